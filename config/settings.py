@@ -184,6 +184,102 @@ CSRF_TRUSTED_ORIGINS = env.list('CSRF_TRUSTED_ORIGINS', default=[])
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Electronic billing
+
+# native: firma XAdES-BES en proceso (core.pos.utilities.xades) | jar: java -jar sri.jar por documento
+SRI_SIGNER = env('SRI_SIGNER', default='native')
+
+# Servicios web offline del SRI (se pueden apuntar a `manage.py sri_stub_server` para pruebas sin red)
+SRI_WS_TEST_URL = env('SRI_WS_TEST_URL', default='https://celcer.sri.gob.ec')
+SRI_WS_PRODUCTION_URL = env('SRI_WS_PRODUCTION_URL', default='https://cel.sri.gob.ec')
+SRI_WS_TIMEOUT = env.int('SRI_WS_TIMEOUT', default=30)
+SRI_WS_POOL_SIZE = env.int('SRI_WS_POOL_SIZE', default=10)
+SRI_WSDL_CACHE_DIR = env('SRI_WSDL_CACHE_DIR', default=os.path.join(BASE_DIR, 'cache', 'wsdl'))
+SRI_WSDL_CACHE_DAYS = env.int('SRI_WSDL_CACHE_DAYS', default=7)
+SRI_WARM_UP_CLIENTS = env.bool('SRI_WARM_UP_CLIENTS', default=False)
+# Secuenciales reservados por proceso en cada acceso a la fila del comprobante (1 = sin saltos en la numeración)
+RECEIPT_SEQUENCE_BLOCK_SIZE = env.int('RECEIPT_SEQUENCE_BLOCK_SIZE', default=1)
+# Circuit breaker de los servicios del SRI: fallos consecutivos para abrirlo, segundos antes de probar de nuevo
+# y duración a partir de la cual una llamada exitosa se considera un fallo por lentitud
+SRI_BREAKER_FAILURE_THRESHOLD = env.int('SRI_BREAKER_FAILURE_THRESHOLD', default=5)
+SRI_BREAKER_RESET_TIMEOUT = env.int('SRI_BREAKER_RESET_TIMEOUT', default=60)
+SRI_BREAKER_SLOW_CALL = env.float('SRI_BREAKER_SLOW_CALL', default=20)
+
+# Cola de facturación electrónica: la venta se guarda y `manage.py electronic_billing_worker` procesa las etapas
+ELECTRONIC_BILLING_ASYNC = env.bool('ELECTRONIC_BILLING_ASYNC', default=True)
+ELECTRONIC_BILLING_MAX_ATTEMPTS = env.int('ELECTRONIC_BILLING_MAX_ATTEMPTS', default=8)
+ELECTRONIC_BILLING_RETRY_DELAY = env.int('ELECTRONIC_BILLING_RETRY_DELAY', default=5)
+ELECTRONIC_BILLING_MAX_RETRY_DELAY = env.int('ELECTRONIC_BILLING_MAX_RETRY_DELAY', default=900)
+ELECTRONIC_BILLING_LOCK_TIMEOUT = env.int('ELECTRONIC_BILLING_LOCK_TIMEOUT', default=600)
+# Consultas de autorización: espera inicial, espera máxima y tiempo tras el cual se abandona el comprobante (segundos)
+ELECTRONIC_BILLING_POLL_DELAY = env.int('ELECTRONIC_BILLING_POLL_DELAY', default=2)
+ELECTRONIC_BILLING_POLL_MAX_DELAY = env.int('ELECTRONIC_BILLING_POLL_MAX_DELAY', default=300)
+ELECTRONIC_BILLING_POLL_TIMEOUT = env.int('ELECTRONIC_BILLING_POLL_TIMEOUT', default=172800)
+# Llamadas por segundo al SRI por compañía emisora (0 = sin límite)
+ELECTRONIC_BILLING_RATE_LIMIT = env.float('ELECTRONIC_BILLING_RATE_LIMIT', default=5)
+# Valida cada comprobante contra su XSD (core/pos/files/xsd) antes de firmarlo. Desactivado hasta comprobar con
+# `manage.py validate_xml_schema` que los comprobantes ya autorizados de cada compañía cumplen el esquema
+ELECTRONIC_BILLING_VALIDATE_SCHEMA = env.bool('ELECTRONIC_BILLING_VALIDATE_SCHEMA', default=False)
+# Emisión en contingencia: con el SRI inaccesible la venta se registra y el comprobante firmado queda en cola;
+# electronic_billing_worker envía ese backlog a ELECTRONIC_BILLING_OFFLINE_RATE_LIMIT comprobantes por segundo y compañía
+ELECTRONIC_BILLING_OFFLINE = env.bool('ELECTRONIC_BILLING_OFFLINE', default=True)
+ELECTRONIC_BILLING_OFFLINE_RATE_LIMIT = env.float('ELECTRONIC_BILLING_OFFLINE_RATE_LIMIT', default=2)
+# Duración, tamaño y resultado de cada etapa por comprobante (VoucherStageMetric) y días que se conservan
+ELECTRONIC_BILLING_METRICS = env.bool('ELECTRONIC_BILLING_METRICS', default=True)
+ELECTRONIC_BILLING_METRICS_RETENTION_DAYS = env.int('ELECTRONIC_BILLING_METRICS_RETENTION_DAYS', default=90)
+# Segundos hacia atrás que cubren la latencia de autorización y la demora de los correos en cada consulta de /metrics
+METRICS_WINDOW = env.int('METRICS_WINDOW', default=86400)
+# Token (Authorization: Bearer) con el que Prometheus consulta /metrics; sin token solo lo ven los superusuarios
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# PDFs generados (dentro de MEDIA_ROOT); con PDF_CACHE_X_ACCEL_REDIRECT nginx entrega el archivo desde esa location interna
+PDF_CACHE_DIR = env('PDF_CACHE_DIR', default='pdf_cache')
+PDF_CACHE_X_ACCEL_REDIRECT = env('PDF_CACHE_X_ACCEL_REDIRECT', default='')
+# Hojas de estilo (rutas de static) que se aplican a cada plantilla PDF; 'default' para las que no estén en la lista
+PDF_STYLESHEETS = {
+    'default': ['css/pdf.css'],
+}
+# Archivos de static y media que se mantienen en memoria al generar los PDF
+PDF_ASSET_CACHE_SIZE = env.int('PDF_ASSET_CACHE_SIZE', default=64)
+# Procesos de `manage.py regenerate_authorized_pdf` y demás generación masiva de PDF (0 = uno por núcleo)
+PDF_POOL_PROCESSES = env.int('PDF_POOL_PROCESSES', default=0)
+# Códigos de barras SVG de las claves de acceso (dentro de MEDIA_ROOT) y cuántos se mantienen en memoria
+ACCESS_CODE_BARCODE_DIR = env('ACCESS_CODE_BARCODE_DIR', default='pdf_authorized/barcode')
+ACCESS_CODE_BARCODE_CACHE_SIZE = env.int('ACCESS_CODE_BARCODE_CACHE_SIZE', default=256)
+# Códigos de barras PNG de los productos (dentro de MEDIA_ROOT); en importaciones y `manage.py migrate_product_barcodes`,
+# desde cuántos pendientes se generan en procesos aparte (0 = uno por núcleo)
+PRODUCT_BARCODE_DIR = env('PRODUCT_BARCODE_DIR', default='barcode')
+PRODUCT_BARCODE_PROCESSES = env.int('PRODUCT_BARCODE_PROCESSES', default=0)
+PRODUCT_BARCODE_POOL_THRESHOLD = env.int('PRODUCT_BARCODE_POOL_THRESHOLD', default=200)
+# Importación de productos desde excel: la petición guarda el archivo y `manage.py product_import_worker` lo importa
+# por bloques de PRODUCT_IMPORT_BATCH_SIZE filas
+PRODUCT_IMPORT_ASYNC = env.bool('PRODUCT_IMPORT_ASYNC', default=True)
+PRODUCT_IMPORT_BATCH_SIZE = env.int('PRODUCT_IMPORT_BATCH_SIZE', default=500)
+PRODUCT_IMPORT_LOCK_TIMEOUT = env.int('PRODUCT_IMPORT_LOCK_TIMEOUT', default=1800)
+
+# Bandeja de salida de correos: la petición guarda el mensaje y `manage.py email_worker` lo envía reutilizando conexiones SMTP
+EMAIL_OUTBOX_ASYNC = env.bool('EMAIL_OUTBOX_ASYNC', default=True)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int('EMAIL_OUTBOX_MAX_ATTEMPTS', default=6)
+EMAIL_OUTBOX_RETRY_DELAY = env.int('EMAIL_OUTBOX_RETRY_DELAY', default=30)
+EMAIL_OUTBOX_MAX_RETRY_DELAY = env.int('EMAIL_OUTBOX_MAX_RETRY_DELAY', default=3600)
+EMAIL_OUTBOX_LOCK_TIMEOUT = env.int('EMAIL_OUTBOX_LOCK_TIMEOUT', default=300)
+# Conexiones SMTP: tiempo de espera, mensajes antes de renovarla y segundos sin uso antes de cerrarla
+EMAIL_OUTBOX_TIMEOUT = env.int('EMAIL_OUTBOX_TIMEOUT', default=30)
+EMAIL_OUTBOX_MESSAGES_PER_CONNECTION = env.int('EMAIL_OUTBOX_MESSAGES_PER_CONNECTION', default=100)
+EMAIL_OUTBOX_IDLE_TIMEOUT = env.int('EMAIL_OUTBOX_IDLE_TIMEOUT', default=60)
+# Reenvío masivo de comprobantes: tamaño máximo de adjuntos por correo (bytes) antes de dividir el envío en varios correos
+VOUCHER_MAILING_MAX_SIZE = env.int('VOUCHER_MAILING_MAX_SIZE', default=20 * 1024 * 1024)
+VOUCHER_MAILING_LOCK_TIMEOUT = env.int('VOUCHER_MAILING_LOCK_TIMEOUT', default=1800)
+# Exportación ZIP de XML/PDF autorizados: comprobantes por parte, para retomar descargas y exportaciones grandes
+VOUCHER_EXPORT_PART_SIZE = env.int('VOUCHER_EXPORT_PART_SIZE', default=1000)
+# XML y PDF autorizados: se guardan por hash de contenido (sin duplicados) en un backend intercambiable, p. ej. MinIO/S3 con
+# VOUCHER_STORAGE_BACKEND=storages.backends.s3.S3Storage y VOUCHER_STORAGE_OPTIONS={"bucket_name": "comprobantes", "endpoint_url": "http://127.0.0.1:9000"}
+VOUCHER_STORAGE_BACKEND = env.str('VOUCHER_STORAGE_BACKEND', default='django.core.files.storage.FileSystemStorage')
+VOUCHER_STORAGE_OPTIONS = env.json('VOUCHER_STORAGE_OPTIONS', default={})
+# Compresión zstd de los XML autorizados (se descomprimen al leerlos)
+VOUCHER_STORAGE_COMPRESS_XML = env.bool('VOUCHER_STORAGE_COMPRESS_XML', default=False)
+VOUCHER_STORAGE_COMPRESS_LEVEL = env.int('VOUCHER_STORAGE_COMPRESS_LEVEL', default=10)
+
 # Constants
 
 GROUPS = {
@@ -4,6 +4,7 @@ from django.urls import path, include
 
 from config import settings
 from core.dashboard.views import *
+from core.pos.views.metrics.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -14,6 +15,7 @@ urlpatterns = [
     path('security/', include('core.security.urls')),
     path('user/', include('core.user.urls')),
     path('subscription/', include('core.subscription.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('', DashboardView.as_view(), name='dashboard'),
 ]
 
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.SRI_WARM_UP_CLIENTS:
+    # Cada worker de gunicorn importa este módulo al arrancar: precarga los WSDL del SRI sin bloquear el arranque
+    from core.pos.utilities.sri_client import sri_clients
+
+    sri_clients.warm_up_in_background()
@@ -1,5 +1,4 @@
 import json
-import smtplib
 import uuid
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -15,6 +14,7 @@ from django.views.generic import FormView, RedirectView, TemplateView
 
 from config import settings
 from core.login.forms import ResetPasswordForm, UpdatePasswordForm
+from core.pos.models import OutboundEmail
 from core.security.form_handlers.helpers import update_form_fields_attributes
 from core.security.models import UserAccess
 from core.user.models import User
@@ -76,7 +76,6 @@ class LoginResetPasswordView(FormView):
             activate_account = f"{ABSOLUTE_ROOT_URL}{reverse_lazy('update_password', kwargs={'pk': user.password_reset_token})}"
             message = MIMEMultipart('alternative')
             message['Subject'] = 'Reseteo de contraseña'
-            message['From'] = settings.EMAIL_HOST_USER
             message['To'] = user.email
             params = {
                 'user': user,
@@ -86,11 +85,7 @@ class LoginResetPasswordView(FormView):
             html = render_to_string('login/password_reset_email.html', params)
             content = MIMEText(html, 'html')
             message.attach(content)
-            server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
-            server.starttls()
-            server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-            server.sendmail(settings.EMAIL_HOST_USER, user.email, message.as_string())
-            server.quit()
+            OutboundEmail.enqueue(message=message, recipients=[user.email])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -78,12 +78,55 @@ VOUCHER_STAGE = (
     ('sent_by_email', 'Enviado por email'),
 )
 
+# Etapas medidas por VoucherStageMetric: las del comprobante más la generación del PDF autorizado
+VOUCHER_METRIC_STAGE = VOUCHER_STAGE + (
+    ('pdf_creation', 'Generación del PDF'),
+)
+
+STAGE_OUTCOME = (
+    ('success', 'Exitosa'),
+    ('pending', 'Pendiente'),
+    ('unavailable', 'SRI no disponible'),
+    ('error', 'Error'),
+)
+
+SRI_SERVICE = (
+    ('receipt', 'Recepción de comprobantes'),
+    ('authorization', 'Autorización de comprobantes'),
+)
+
+CIRCUIT_STATE = (
+    ('closed', 'Disponible'),
+    ('open', 'No disponible'),
+    ('half_open', 'En verificación'),
+)
+
+BILLING_JOB_STATUS = (
+    ('pending', 'Pendiente'),
+    ('running', 'En proceso'),
+    ('done', 'Finalizado'),
+    ('failed', 'Fallido'),
+)
+
+EMAIL_STATUS = (
+    ('pending', 'Pendiente'),
+    ('sending', 'Enviando'),
+    ('sent', 'Enviado'),
+    ('failed', 'Fallido'),
+)
+
+MAILING_ATTACHMENT = (
+    ('zip', 'Archivo ZIP'),
+    ('files', 'Archivos PDF y XML'),
+)
+
 INVOICE_STATUS = (
     ('without_authorizing', 'Sin Autorizar'),
     ('authorized', 'Autorizada'),
     ('authorized_and_sent_by_email', 'Autorizada y enviada por email'),
     ('canceled', 'Anulado'),
     ('sequential_registered_error', 'Error de secuencial registrado'),
+    ('offline_pending', 'Emitida sin conexión, pendiente de envío al SRI'),
 )
 
 INVOICE_PAYMENT_METHOD = (
@@ -100,4 +143,12 @@ TAX_CODES = (
     (2, 'IVA'),
     (3, 'ICE'),
     (5, 'IRBPNR'),
-)
\ No newline at end of file
+)
+STOCK_MOVEMENT_TYPE = (
+    ('opening', 'Saldo inicial'),
+    ('sale', 'Venta'),
+    ('credit_note', 'Devolución por nota de crédito'),
+    ('purchase', 'Compra'),
+    ('purchase_cancellation', 'Anulación de compra'),
+    ('adjustment', 'Ajuste de stock'),
+)
@@ -0,0 +1,65 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.pos.choices import ENVIRONMENT_TYPE, VOUCHER_STAGE
+from core.pos.models import ElectronicBillingJob
+from core.pos.utilities.sri import SRI
+
+
+class Command(BaseCommand):
+    help = 'Consulta con backoff exponencial la autorización de los comprobantes que el SRI ya recibió'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='Comprobantes consultados en cada ronda')
+        parser.add_argument('--workers', type=int, default=8, help='Consultas simultáneas al SRI')
+        parser.add_argument('--sleep', type=float, default=1, help='Segundos de espera cuando no hay consultas pendientes')
+        parser.add_argument('--environment', type=int, choices=[choice[0] for choice in ENVIRONMENT_TYPE], default=None, help='Tipo de ambiente a consultar')
+        parser.add_argument('--once', action='store_true', help='Realiza las consultas pendientes y termina')
+        parser.add_argument('--metrics', action='store_true', help='Muestra las métricas de autorización y termina')
+
+    def print_metrics(self):
+        metrics = ElectronicBillingJob.get_authorization_metrics()
+        average = metrics['latency_sum'] / metrics['authorized'] if metrics['authorized'] else 0
+        self.stdout.write(f'Consultas: {metrics["polls"]} sobre {metrics["polled_documents"]} comprobantes, autorizados: {metrics["authorized"]} (promedio {average:.1f} s)')
+        self.stdout.write('Latencia hasta la autorización: ' + ', '.join(f'<= {bucket} s: {count}' for bucket, count in metrics['latency_histogram'].items()))
+        self.stdout.write('Pendientes de autorización: ' + ', '.join(f'{name}: {count}' for name, count in metrics['backlog'].items()))
+
+    def poll(self, job):
+        try:
+            job.process(sri=self.sri)
+        finally:
+            connection.close()
+        return job
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.print_metrics()
+            return
+        self.sri = SRI()
+        worker = f'poller-{socket.gethostname()}:{os.getpid()}'
+        queryset = ElectronicBillingJob.objects.filter(stage=VOUCHER_STAGE[3][0])
+        if options['environment']:
+            queryset = queryset.filter(company__environment_type=options['environment'])
+        executor = ThreadPoolExecutor(max_workers=max(options['workers'], 1))
+        try:
+            while True:
+                close_old_connections()
+                jobs = ElectronicBillingJob.claim(worker=worker, limit=options['batch'], queryset=queryset)
+                for job in executor.map(self.poll, jobs):
+                    if job.stage != VOUCHER_STAGE[3][0] or job.is_finished:
+                        message = f'{job.get_voucher().receipt_number_full}: {job.get_status_display()} ({job.get_stage_display()}) tras {job.polls} consultas'
+                        self.stdout.write(self.style.ERROR(message) if job.last_error else message)
+                if options['once'] and not jobs:
+                    break
+                if not jobs:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.print_metrics()
@@ -0,0 +1,57 @@
+import time
+
+import weasyprint
+from django.core.management import BaseCommand, CommandError
+from django.template.loader import get_template
+from weasyprint import CSS, HTML
+
+from config import settings
+from core.pos.models import Invoice
+from core.pos.utilities.pdf_creator import pdf_engine
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de generación del PDF de una factura: Bootstrap analizado en cada documento contra pdf_engine con estilos en caché'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, default=None, help='ID de la factura a generar')
+        parser.add_argument('--template', type=str, default='invoice/invoice_pdf.html', help='Plantilla del PDF')
+        parser.add_argument('--repeat', type=int, default=20, help='Veces que se genera el documento')
+
+    def get_invoice(self, options):
+        queryset = Invoice.objects.exclude(access_code__isnull=True).select_related('company', 'receipt', 'customer__user')
+        if options['invoice']:
+            queryset = queryset.filter(pk=options['invoice'])
+        invoice = queryset.order_by('-id').first()
+        if invoice is None:
+            raise CommandError('No existe una factura con código de acceso para generar el PDF')
+        return invoice
+
+    def create_pdf_legacy(self, template_name, context):
+        # Generación anterior a pdf_engine fuera de una petición, usada como referencia
+        html_template = get_template(template_name).render(context).encode(encoding='UTF-8')
+        path_css = f'{settings.BASE_DIR}{settings.STATIC_URL}lib/bootstrap-4.6.0/css/bootstrap.min.css'
+        return HTML(string=html_template, base_url='.', url_fetcher=weasyprint.default_url_fetcher).write_pdf(stylesheets=[CSS(path_css)], presentational_hints=True)
+
+    def measure(self, function, repeat):
+        start = time.perf_counter()
+        function()
+        first = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return first, (time.perf_counter() - start) / repeat * 1000
+
+    def handle(self, *args, **options):
+        invoice = self.get_invoice(options)
+        template_name = options['template']
+        context = {'object': invoice, 'height': 450 + invoice.invoicedetail_set.count() * 10}
+        # El contexto se evalúa una vez para medir solo el trabajo de WeasyPrint
+        get_template(template_name).render(context)
+        old_first, old = self.measure(lambda: self.create_pdf_legacy(template_name, context), options['repeat'])
+        pdf_engine.clear()
+        new_first, new = self.measure(lambda: pdf_engine.render(template_name, context), options['repeat'])
+        self.stdout.write(f'Factura {invoice.receipt_number_full} con {template_name}, {options["repeat"]} repeticiones')
+        self.stdout.write(f'  Bootstrap en cada documento: primero {old_first:.1f} ms, promedio {old:.1f} ms')
+        self.stdout.write(f'  pdf_engine ({", ".join(settings.PDF_STYLESHEETS.get(template_name, settings.PDF_STYLESHEETS["default"]))}): primero {new_first:.1f} ms, promedio {new:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'  {old / new if new else 0:.1f}x por documento'))
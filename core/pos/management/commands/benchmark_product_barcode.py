@@ -0,0 +1,70 @@
+import time
+from io import BytesIO
+
+import barcode
+from barcode.writer import ImageWriter
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from core.pos.choices import STOCK_MOVEMENT_TYPE
+from core.pos.models import Product, StockMovement
+from core.pos.utilities.product_barcode import product_barcodes, render_job
+
+
+class Command(BaseCommand):
+    help = 'Mide la venta con y sin regenerar el código de barras al guardar el producto y la generación en bloque con procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=10, help='Productos por venta')
+        parser.add_argument('--repeat', type=int, default=10, help='Ventas medidas')
+        parser.add_argument('--batch', type=int, default=1000, help='Códigos de barras de la importación simulada')
+
+    def save_with_barcode(self, product, names):
+        # Product.save anterior a product_barcodes: dibuja y escribe el PNG en cada guardado
+        image_io = BytesIO()
+        barcode.Gs1_128(product.code, writer=ImageWriter()).write(image_io)
+        product.barcode.save(f'{product.code}.png', content=ContentFile(image_io.getvalue()), save=False)
+        names.append(product.barcode.name)
+        product.save()
+
+    def measure(self, function, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - start) / repeat * 1000
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.filter(is_inventoried=True).exclude(code='')[:options['lines']])
+        if not products:
+            raise CommandError('No existen productos inventariados para simular la venta')
+        names = []
+        # Las ventas de prueba se descartan al terminar
+        with transaction.atomic():
+            def sale_per_product(save):
+                for product in products:
+                    product.stock -= 1
+                    save(product)
+
+            old = self.measure(lambda: sale_per_product(lambda product: self.save_with_barcode(product, names)), options['repeat'])
+            new = self.measure(lambda: sale_per_product(lambda product: product.save()), options['repeat'])
+            bulk = self.measure(lambda: StockMovement.register([StockMovement(product=product, movement_type=STOCK_MOVEMENT_TYPE[1][0], quantity=-1) for product in products]), options['repeat'])
+            transaction.set_rollback(True)
+        for name in names:
+            default_storage.delete(name)
+        self.stdout.write(f'Venta de {len(products)} productos: save con código de barras {old:.2f} ms, save sin código de barras {new:.2f} ms ({old / new if new else 0:.1f}x), StockMovement.register {bulk:.2f} ms ({old / bulk if bulk else 0:.1f}x)')
+
+        jobs = [(f'benchmark/{index}.png', f'{index:012d}') for index in range(options['batch'])]
+        start = time.perf_counter()
+        for job in jobs:
+            render_job(job)
+        inline = time.perf_counter() - start
+        # Con el umbral en 1 siempre se usan los procesos, incluido su arranque
+        threshold = product_barcodes.pool_threshold
+        product_barcodes.pool_threshold = 1
+        start = time.perf_counter()
+        product_barcodes.render(jobs)
+        pool = time.perf_counter() - start
+        product_barcodes.pool_threshold = threshold
+        self.stdout.write(f'{len(jobs)} códigos de barras: en el proceso {inline:.2f} s, con {product_barcodes.processes} procesos {pool:.2f} s ({inline / pool if pool else 0:.1f}x)')
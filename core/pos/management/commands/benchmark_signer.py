@@ -0,0 +1,59 @@
+import shutil
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from core.pos.models import Company, Invoice
+from core.pos.utilities.sri import SRI
+from core.pos.utilities.xades import signer_cache
+
+
+class Command(BaseCommand):
+    help = 'Compara documentos firmados por segundo entre el firmador XAdES en proceso y el subproceso java -jar sri.jar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, default=None, help='ID de la compañía cuya firma electrónica se usará')
+        parser.add_argument('--invoice', type=int, default=None, help='ID de la factura usada como documento de prueba')
+        parser.add_argument('--documents', type=int, default=200, help='Documentos a firmar con el firmador en proceso')
+        parser.add_argument('--jar-documents', type=int, default=10, help='Documentos a firmar con el subproceso java')
+
+    def get_invoice(self, options):
+        queryset = Invoice.objects.exclude(receipt_number__isnull=True).select_related('company', 'receipt', 'customer__user')
+        if options['invoice']:
+            queryset = queryset.filter(pk=options['invoice'])
+        elif options['company']:
+            queryset = queryset.filter(company_id=options['company'])
+        else:
+            queryset = queryset.filter(company__in=Company.objects.exclude(electronic_signature=''))
+        invoice = queryset.order_by('-id').first()
+        if invoice is None:
+            raise CommandError('No existe una factura con una compañía que tenga firma electrónica')
+        return invoice
+
+    def measure(self, sign, xml, documents):
+        start = time.perf_counter()
+        for _ in range(documents):
+            sign(xml)
+        elapsed = time.perf_counter() - start
+        return elapsed, documents / elapsed if elapsed else 0
+
+    def handle(self, *args, **options):
+        sri = SRI()
+        invoice = self.get_invoice(options)
+        xml, _ = invoice.create_xml_document()
+        self.stdout.write(f'Documento: {invoice.receipt_number_full} ({len(xml.encode())} bytes) - Compañía: {invoice.company}')
+
+        signer_cache.clear()
+        start = time.perf_counter()
+        signer = signer_cache.get(invoice.company)
+        self.stdout.write(f'Carga del P12 (una vez por proceso): {(time.perf_counter() - start) * 1000:.1f} ms')
+        elapsed, rate = self.measure(signer.sign, xml, options['documents'])
+        self.stdout.write(self.style.SUCCESS(f'En proceso: {options["documents"]} documentos en {elapsed:.3f} s -> {rate:.1f} docs/s'))
+
+        if shutil.which('java') is None:
+            self.stdout.write(self.style.WARNING('java no está disponible en el PATH, se omite la medición de sri.jar'))
+            return
+        elapsed_jar, rate_jar = self.measure(lambda value: sri.sign_xml_with_jar(instance=invoice, xml=value), xml, options['jar_documents'])
+        self.stdout.write(self.style.SUCCESS(f'java -jar sri.jar: {options["jar_documents"]} documentos en {elapsed_jar:.3f} s -> {rate_jar:.1f} docs/s'))
+        if rate_jar:
+            self.stdout.write(f'Aceleración: {rate / rate_jar:.1f}x')
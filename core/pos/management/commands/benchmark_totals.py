@@ -0,0 +1,101 @@
+import time
+from decimal import Decimal
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import FloatField, Sum
+from django.db.models.functions import Coalesce
+from django.test.utils import CaptureQueriesContext
+
+from core.pos.models import Invoice, InvoiceDetail, Product
+
+
+class Command(BaseCommand):
+    help = 'Compara el cálculo de totales de factura con guardado por línea y agregados contra totals_engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, default=None, help='ID de la factura usada como base de los documentos de prueba')
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 100, 1000], help='Cantidad de líneas de cada documento de prueba')
+        parser.add_argument('--repeat', type=int, default=5, help='Veces que se calcula cada documento')
+
+    def recalculate_invoice_per_row(self, invoice, lines):
+        # Cálculo anterior a totals_engine, usado como referencia
+        for i in lines:
+            InvoiceDetail.objects.create(invoice_id=invoice.id, product_id=i['product'].id, quantity=i['quantity'], price=i['price'], discount=i['discount'])
+        for detail in invoice.invoicedetail_set.filter():
+            detail.price = float(detail.price)
+            detail.tax = float(invoice.tax)
+            detail.price_with_tax = detail.price + (detail.price * detail.tax)
+            detail.subtotal = detail.price * detail.quantity
+            detail.total_discount = detail.subtotal * float(detail.discount)
+            detail.total_tax = (detail.subtotal - detail.total_discount) * detail.tax
+            detail.total_amount = detail.subtotal - detail.total_discount
+            detail.save()
+        invoice.subtotal_without_tax = float(invoice.invoicedetail_set.filter(product__has_tax=False).aggregate(result=Coalesce(Sum('total_amount'), 0.00, output_field=FloatField()))['result'])
+        invoice.subtotal_with_tax = float(invoice.invoicedetail_set.filter(product__has_tax=True).aggregate(result=Coalesce(Sum('total_amount'), 0.00, output_field=FloatField()))['result'])
+        invoice.total_tax = round(invoice.invoicedetail_set.filter(product__has_tax=True).aggregate(result=Coalesce(Sum('total_tax'), 0.00, output_field=FloatField()))['result'], 2)
+        invoice.total_discount = float(invoice.invoicedetail_set.filter().aggregate(result=Coalesce(Sum('total_discount'), 0.00, output_field=FloatField()))['result'])
+        invoice.total_amount = round(invoice.subtotal, 2) + float(invoice.total_tax)
+        invoice.save()
+
+    def recalculate_invoice_engine(self, invoice, lines):
+        invoice.recalculate_invoice([
+            InvoiceDetail(invoice=invoice, product=i['product'], quantity=i['quantity'], price=i['price'], discount=i['discount'])
+            for i in lines
+        ])
+
+    def get_invoice(self, options):
+        queryset = Invoice.objects.exclude(receipt_number__isnull=True)
+        if options['invoice']:
+            queryset = queryset.filter(pk=options['invoice'])
+        invoice = queryset.order_by('-id').first()
+        if invoice is None:
+            raise CommandError('No existe una factura para usar como base')
+        return invoice
+
+    def get_lines(self, base, lines):
+        products = list(Product.objects.filter(company=base.company)[:20]) or list(Product.objects.all()[:20])
+        if not products:
+            raise CommandError('No existen productos para armar los documentos de prueba')
+        return [
+            {'product': products[index % len(products)], 'quantity': index % 7 + 1, 'price': float(products[index % len(products)].pvp), 'discount': (index % 4) * 0.05}
+            for index in range(lines)
+        ]
+
+    def create_invoice(self, base):
+        invoice = Invoice.objects.get(pk=base.pk)
+        invoice.pk = None
+        invoice.access_code = None
+        invoice.save()
+        return invoice
+
+    def measure(self, function, base, lines, repeat):
+        durations, queries, invoice = [], 0, None
+        for _ in range(repeat):
+            # Cada corrida trabaja sobre una factura nueva, fuera de la medición
+            invoice = self.create_invoice(base)
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                function(invoice, lines)
+                durations.append(time.perf_counter() - start)
+            queries = len(captured)
+        return sum(durations) / len(durations) * 1000, queries, Invoice.objects.get(pk=invoice.pk)
+
+    def get_difference(self, old_invoice, new_invoice):
+        # El redondeo de float puede diferir en un centavo del ROUND_HALF_UP de Decimal
+        fields = ('subtotal_without_tax', 'subtotal_with_tax', 'total_tax', 'total_discount', 'total_amount')
+        return max(abs(getattr(old_invoice, name) - getattr(new_invoice, name)) for name in fields)
+
+    def handle(self, *args, **options):
+        base = self.get_invoice(options)
+        # Los documentos de prueba se descartan al terminar
+        with transaction.atomic():
+            for lines in options['lines']:
+                items = self.get_lines(base, lines)
+                old, old_queries, old_invoice = self.measure(self.recalculate_invoice_per_row, base, items, options['repeat'])
+                new, new_queries, new_invoice = self.measure(self.recalculate_invoice_engine, base, items, options['repeat'])
+                difference = self.get_difference(old_invoice, new_invoice)
+                message = f'{lines} líneas: por línea {old:.2f} ms ({old_queries} consultas), totals_engine {new:.2f} ms ({new_queries} consultas), {old / new if new else 0:.1f}x, diferencia máxima en totales: {difference:.2f}'
+                self.stdout.write(self.style.SUCCESS(message) if difference <= Decimal('0.01') else self.style.ERROR(message))
+            transaction.set_rollback(True)
@@ -0,0 +1,150 @@
+import time
+from xml.etree import ElementTree
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from lxml import etree
+
+from core.pos.choices import RETENTION_AGENT, TAX_CODES
+from core.pos.models import Invoice, InvoiceDetail, Product
+from core.pos.utilities.sri import SRI
+from core.pos.utilities.xml_builder import xml_builder
+
+
+class Command(BaseCommand):
+    help = 'Compara el XML de factura armado con ElementTree nodo a nodo contra el generador con fragmentos por compañía'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, default=None, help='ID de la factura usada como base de los documentos de prueba')
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 50, 500], help='Cantidad de líneas de cada documento de prueba')
+        parser.add_argument('--repeat', type=int, default=20, help='Veces que se genera cada documento')
+
+    def optional_sub_element(self, parent, tag, value):
+        # Igual que optional_element: los elementos opcionales del XSD sin valor se omiten
+        if value is not None and value != '':
+            ElementTree.SubElement(parent, tag).text = value
+
+    def create_xml_document_element_tree(self, invoice):
+        # Generación anterior a xml_builder, usada como referencia
+        access_key = SRI().create_access_key(invoice)
+        root = ElementTree.Element('factura', id='comprobante', version='1.0.0')
+        xml_tax_info = ElementTree.SubElement(root, 'infoTributaria')
+        ElementTree.SubElement(xml_tax_info, 'ambiente').text = str(invoice.company.environment_type)
+        ElementTree.SubElement(xml_tax_info, 'tipoEmision').text = str(invoice.company.emission_type)
+        ElementTree.SubElement(xml_tax_info, 'razonSocial').text = invoice.company.company_name
+        self.optional_sub_element(xml_tax_info, 'nombreComercial', invoice.company.commercial_name)
+        ElementTree.SubElement(xml_tax_info, 'ruc').text = invoice.company.ruc
+        ElementTree.SubElement(xml_tax_info, 'claveAcceso').text = access_key
+        ElementTree.SubElement(xml_tax_info, 'codDoc').text = invoice.receipt.voucher_type
+        ElementTree.SubElement(xml_tax_info, 'estab').text = invoice.receipt.establishment_code
+        ElementTree.SubElement(xml_tax_info, 'ptoEmi').text = invoice.receipt.issuing_point_code
+        ElementTree.SubElement(xml_tax_info, 'secuencial').text = invoice.receipt_number
+        ElementTree.SubElement(xml_tax_info, 'dirMatriz').text = invoice.company.main_address
+        if invoice.company.retention_agent == RETENTION_AGENT[0][0]:
+            ElementTree.SubElement(xml_tax_info, 'agenteRetencion').text = '1'
+        if not invoice.company.is_popular_regime:
+            self.optional_sub_element(xml_tax_info, 'contribuyenteRimpe', invoice.company.regimen_rimpe)
+        xml_info_invoice = ElementTree.SubElement(root, 'infoFactura')
+        ElementTree.SubElement(xml_info_invoice, 'fechaEmision').text = invoice.get_issue_date().strftime('%d/%m/%Y')
+        self.optional_sub_element(xml_info_invoice, 'dirEstablecimiento', invoice.company.establishment_address)
+        self.optional_sub_element(xml_info_invoice, 'obligadoContabilidad', invoice.company.obligated_accounting)
+        ElementTree.SubElement(xml_info_invoice, 'tipoIdentificacionComprador').text = invoice.customer.identification_type
+        ElementTree.SubElement(xml_info_invoice, 'razonSocialComprador').text = invoice.customer.user.names
+        ElementTree.SubElement(xml_info_invoice, 'identificacionComprador').text = invoice.customer.dni
+        self.optional_sub_element(xml_info_invoice, 'direccionComprador', invoice.customer.address)
+        ElementTree.SubElement(xml_info_invoice, 'totalSinImpuestos').text = f'{invoice.subtotal:.2f}'
+        ElementTree.SubElement(xml_info_invoice, 'totalDescuento').text = f'{invoice.total_discount:.2f}'
+        xml_total_with_taxes = ElementTree.SubElement(xml_info_invoice, 'totalConImpuestos')
+        if invoice.subtotal_without_tax != 0.0000:
+            subtotal_without_tax = ElementTree.SubElement(xml_total_with_taxes, 'totalImpuesto')
+            ElementTree.SubElement(subtotal_without_tax, 'codigo').text = str(TAX_CODES[0][0])
+            ElementTree.SubElement(subtotal_without_tax, 'codigoPorcentaje').text = '0'
+            ElementTree.SubElement(subtotal_without_tax, 'baseImponible').text = f'{invoice.subtotal_without_tax:.2f}'
+            ElementTree.SubElement(subtotal_without_tax, 'valor').text = '0.00'
+        if invoice.subtotal_with_tax != 0.0000:
+            subtotal_with_tax = ElementTree.SubElement(xml_total_with_taxes, 'totalImpuesto')
+            ElementTree.SubElement(subtotal_with_tax, 'codigo').text = str(TAX_CODES[0][0])
+            ElementTree.SubElement(subtotal_with_tax, 'codigoPorcentaje').text = str(invoice.company.tax_percentage)
+            ElementTree.SubElement(subtotal_with_tax, 'baseImponible').text = f'{invoice.subtotal_with_tax:.2f}'
+            ElementTree.SubElement(subtotal_with_tax, 'valor').text = f'{invoice.total_tax:.2f}'
+        ElementTree.SubElement(xml_info_invoice, 'propina').text = '0.00'
+        ElementTree.SubElement(xml_info_invoice, 'importeTotal').text = f'{invoice.total_amount:.2f}'
+        ElementTree.SubElement(xml_info_invoice, 'moneda').text = 'DOLAR'
+        xml_payments = ElementTree.SubElement(xml_info_invoice, 'pagos')
+        xml_payment = ElementTree.SubElement(xml_payments, 'pago')
+        ElementTree.SubElement(xml_payment, 'formaPago').text = invoice.payment_method
+        ElementTree.SubElement(xml_payment, 'total').text = f'{invoice.total_amount:.2f}'
+        ElementTree.SubElement(xml_payment, 'plazo').text = str(invoice.time_limit)
+        ElementTree.SubElement(xml_payment, 'unidadTiempo').text = 'dias'
+        xml_details = ElementTree.SubElement(root, 'detalles')
+        for detail in invoice.invoicedetail_set.all():
+            xml_detail = ElementTree.SubElement(xml_details, 'detalle')
+            self.optional_sub_element(xml_detail, 'codigoPrincipal', detail.product.code)
+            ElementTree.SubElement(xml_detail, 'descripcion').text = detail.product.name
+            ElementTree.SubElement(xml_detail, 'cantidad').text = f'{detail.quantity:.2f}'
+            ElementTree.SubElement(xml_detail, 'precioUnitario').text = f'{detail.price:.2f}'
+            ElementTree.SubElement(xml_detail, 'descuento').text = f'{detail.total_discount:.2f}'
+            ElementTree.SubElement(xml_detail, 'precioTotalSinImpuesto').text = f'{detail.total_amount:.2f}'
+            xml_taxes = ElementTree.SubElement(xml_detail, 'impuestos')
+            xml_tax = ElementTree.SubElement(xml_taxes, 'impuesto')
+            ElementTree.SubElement(xml_tax, 'codigo').text = str(TAX_CODES[0][0])
+            if detail.product.has_tax:
+                ElementTree.SubElement(xml_tax, 'codigoPorcentaje').text = str(invoice.company.tax_percentage)
+                ElementTree.SubElement(xml_tax, 'tarifa').text = f'{detail.tax_rate:.2f}'
+                ElementTree.SubElement(xml_tax, 'baseImponible').text = f'{detail.total_amount:.2f}'
+                ElementTree.SubElement(xml_tax, 'valor').text = f'{detail.total_tax:.2f}'
+            else:
+                ElementTree.SubElement(xml_tax, 'codigoPorcentaje').text = '0'
+                ElementTree.SubElement(xml_tax, 'tarifa').text = '0'
+                ElementTree.SubElement(xml_tax, 'baseImponible').text = f'{detail.total_amount:.2f}'
+                ElementTree.SubElement(xml_tax, 'valor').text = '0'
+        return ElementTree.tostring(root, xml_declaration=True, encoding='utf-8').decode('utf-8').replace("'", '"').encode('utf-8')
+
+    def get_invoice(self, options):
+        queryset = Invoice.objects.exclude(receipt_number__isnull=True).select_related('company', 'receipt', 'customer__user')
+        if options['invoice']:
+            queryset = queryset.filter(pk=options['invoice'])
+        invoice = queryset.order_by('-id').first()
+        if invoice is None:
+            raise CommandError('No existe una factura para usar como base')
+        return invoice
+
+    def create_document(self, base, lines):
+        products = list(Product.objects.filter(company=base.company)[:20]) or list(Product.objects.all()[:20])
+        if not products:
+            raise CommandError('No existen productos para armar los documentos de prueba')
+        invoice = Invoice.objects.get(pk=base.pk)
+        invoice.pk = None
+        invoice.access_code = None
+        invoice.save()
+        InvoiceDetail.objects.bulk_create([
+            InvoiceDetail(invoice=invoice, product=products[index % len(products)], quantity=index % 7 + 1, price=products[index % len(products)].pvp)
+            for index in range(lines)
+        ])
+        invoice.recalculate_invoice()
+        return Invoice.objects.select_related('company', 'receipt', 'customer__user').get(pk=invoice.pk)
+
+    def measure(self, function, repeat):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            document = function()
+        return (time.perf_counter() - start) / repeat * 1000, len(queries), document
+
+    def handle(self, *args, **options):
+        base = self.get_invoice(options)
+        # Los documentos de prueba se descartan al terminar
+        with transaction.atomic():
+            for lines in options['lines']:
+                invoice = self.create_document(base, lines)
+                invoice.access_code = SRI().create_access_key(invoice)
+                old, old_queries, old_xml = self.measure(lambda: self.create_xml_document_element_tree(invoice), options['repeat'])
+                xml_builder.clear()
+                new, new_queries, new_xml = self.measure(lambda: invoice.create_xml_document()[0], options['repeat'])
+                same = etree.tostring(etree.fromstring(old_xml), method='c14n') == etree.tostring(etree.fromstring(new_xml), method='c14n')
+                message = f'{lines} líneas: ElementTree {old:.2f} ms ({old_queries} consultas), xml_builder {new:.2f} ms ({new_queries} consultas), {old / new if new else 0:.1f}x, XML equivalente: {"sí" if same else "no"}'
+                self.stdout.write(self.style.SUCCESS(message) if same else self.style.ERROR(message))
+            transaction.set_rollback(True)
@@ -1,12 +1,93 @@
+import json
 import os
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
 import django
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
+from config import settings
+from core.pos.choices import BILLING_JOB_STATUS, INVOICE_STATUS, VOUCHER_STAGE, VOUCHER_TYPE
 from core.pos.models import *
+from core.pos.utilities.rate_limiter import RateLimiter
+from core.pos.utilities.sri import SRI
+from core.pos.utilities.stage_metrics import stage_metrics
+
+# Etapas que consumen los servicios web del SRI y se someten al límite por compañía
+NETWORK_STAGES = [VOUCHER_STAGE[2][0], VOUCHER_STAGE[3][0]]
+
+
+class Checkpoint:
+    """Registra en un archivo JSON los comprobantes ya procesados para retomar una ejecución interrumpida."""
+
+    def __init__(self, path, signature, restart=False):
+        self.path = path
+        self.signature = signature
+        self.lock = threading.Lock()
+        self.processed = set()
+        if path and not restart and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('signature') == signature:
+                self.processed = set(data.get('processed', []))
+
+    def __contains__(self, key):
+        return key in self.processed
+
+    def add(self, key):
+        with self.lock:
+            self.processed.add(key)
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'signature': self.signature, 'processed': sorted(self.processed)}, file)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Statistics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.failures = Counter()
+        self.throttled = 0
+        self.documents = 0
+        self.failed_documents = 0
+
+    def add_stage(self, stage, elapsed, success):
+        with self.lock:
+            self.latencies[stage].append(elapsed)
+            if not success:
+                self.failures[stage] += 1
+
+    def add_document(self, success):
+        with self.lock:
+            self.documents += 1
+            if not success:
+                self.failed_documents += 1
+
+    def add_throttled(self, waited):
+        with self.lock:
+            self.throttled += waited
+
+    def percentile(self, values, percentage):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(round(percentage / 100 * (len(values) - 1))))]
 
 
 class Command(BaseCommand):
@@ -14,18 +95,170 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--date_joined', nargs='?', type=str, default=None, help='Fecha de registro')
+        parser.add_argument('--start_date', type=str, default=None, help='Fecha de registro inicial (YYYY-MM-DD)')
+        parser.add_argument('--end_date', type=str, default=None, help='Fecha de registro final (YYYY-MM-DD)')
+        parser.add_argument('--company', type=int, nargs='+', default=None, help='ID de las compañías a procesar')
+        parser.add_argument('--workers', type=int, default=1, help='Comprobantes procesados en paralelo')
+        parser.add_argument('--rate_limit', type=float, default=None, help='Llamadas por segundo al SRI por compañía (0 = sin límite)')
+        parser.add_argument('--checkpoint', type=str, default=os.path.join(settings.BASE_DIR, 'cache', 'electronic_billing_checkpoint.json'), help='Archivo para retomar una ejecución interrumpida')
+        parser.add_argument('--restart', action='store_true', help='Ignora el checkpoint existente')
+        parser.add_argument('--batch', type=int, default=0, help='Envía los comprobantes al SRI en lotes de hasta N documentos por compañía, ambiente y tipo')
 
-    def handle(self, *args, **options):
-        sri = SRI()
-        date_joined = options['date_joined'] if options['date_joined'] else datetime.now().date()
+    def get_date_range(self, options):
+        if options['start_date'] or options['end_date']:
+            start_date = options['start_date'] or options['end_date']
+            end_date = options['end_date'] or options['start_date']
+        else:
+            start_date = end_date = options['date_joined'] if options['date_joined'] else str(datetime.now().date())
+        try:
+            start_date, end_date = datetime.strptime(start_date, '%Y-%m-%d').date(), datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Las fechas deben tener el formato YYYY-MM-DD')
+        if start_date > end_date:
+            raise CommandError('La fecha inicial no puede ser mayor a la fecha final')
+        return start_date, end_date
+
+    def get_documents(self, start_date, end_date, companies):
         excluded_invoice_states = [INVOICE_STATUS[2][0], INVOICE_STATUS[3][0], INVOICE_STATUS[4][0]]
-        for instance in Invoice.objects.filter(date_joined=date_joined, receipt__voucher_type=VOUCHER_TYPE[0][0], create_electronic_invoice=True, is_draft_invoice=False).exclude(status__in=excluded_invoice_states):
-            if instance.status == INVOICE_STATUS[0][0]:
-                instance.generate_electronic_invoice_document()
-            elif instance.status == INVOICE_STATUS[1][0]:
-                sri.send_receipt_by_email(instance=instance)
-        for instance in CreditNote.objects.filter(date_joined=date_joined, create_electronic_invoice=True).exclude(status__in=excluded_invoice_states):
+        # Los comprobantes con un trabajo pendiente en la cola los procesa electronic_billing_worker
+        queued_states = [BILLING_JOB_STATUS[0][0], BILLING_JOB_STATUS[1][0]]
+        invoices = Invoice.objects.filter(date_joined__range=[start_date, end_date], receipt__voucher_type=VOUCHER_TYPE[0][0], create_electronic_invoice=True, is_draft_invoice=False)
+        credit_notes = CreditNote.objects.filter(date_joined__range=[start_date, end_date], create_electronic_invoice=True)
+        documents = []
+        for queryset in [invoices, credit_notes]:
+            if companies:
+                queryset = queryset.filter(company_id__in=companies)
+            queryset = queryset.exclude(status__in=excluded_invoice_states).exclude(electronicbillingjob__status__in=queued_states)
+            documents.extend(queryset.select_related('company', 'receipt').order_by('date_joined', 'id'))
+        return documents
+
+    def get_key(self, instance):
+        return f'{instance.__class__.__name__}:{instance.pk}'
+
+    def get_stage_runner(self, company_id):
+        def run_stage(stage, function, **kwargs):
+            if stage in NETWORK_STAGES:
+                self.statistics.add_throttled(self.rate_limiter.acquire(company_id))
+            start = time.perf_counter()
+            response = function(**kwargs)
+            self.statistics.add_stage(stage, time.perf_counter() - start, response['resp'] or response.get('pending', False))
+            return response
+
+        return run_stage
+
+    def process_document(self, instance):
+        run_stage = self.get_stage_runner(instance.company_id)
+        try:
             if instance.status == INVOICE_STATUS[0][0]:
-                instance.generate_electronic_invoice_document()
-            elif instance.status == INVOICE_STATUS[1][0]:
-                sri.send_receipt_by_email(instance=instance)
+                response = instance.generate_electronic_invoice_document(run_stage=run_stage)
+            else:
+                response = run_stage(VOUCHER_STAGE[4][0], self.sri.send_receipt_by_email, instance=instance)
+        except Exception as e:
+            response = {'resp': False, 'error': str(e)}
+        finally:
+            # Cada hilo abre su propia conexión a la base de datos
+            connection.close()
+        return [(instance, response)]
+
+    def process_batch(self, instances):
+        run_stage = self.get_stage_runner(instances[0].company_id)
+        results = {}
+        signed = []
+        try:
+            for instance in instances:
+                response = run_stage(VOUCHER_STAGE[0][0], stage_metrics.timed(instance, VOUCHER_STAGE[0][0], self.sri.create_xml), instance=instance)
+                if response['resp']:
+                    response = run_stage(VOUCHER_STAGE[1][0], stage_metrics.timed(instance, VOUCHER_STAGE[1][0], self.sri.firm_xml), instance=instance, xml=response['xml'])
+                if response['resp']:
+                    signed.append((instance, response['xml']))
+                else:
+                    results[instance.pk] = response
+            if signed:
+                response = run_stage(VOUCHER_STAGE[2][0], self.sri.validate_batch_xml, instances=[item[0] for item in signed], xmls=[item[1] for item in signed])
+                pending = []
+                for (instance, xml), result in zip(signed, response['results']):
+                    results[instance.pk] = result
+                    if result['resp']:
+                        pending.append(instance)
+                if pending:
+                    authorization = run_stage(VOUCHER_STAGE[3][0], self.sri.authorize_batch_xml, access_code=response['access_code'], instances=pending)
+                    for instance, result in zip(pending, authorization['results']):
+                        results[instance.pk] = result
+                        if result.get('pending'):
+                            # Lo que el SRI aún procesa queda en manos de authorization_poller
+                            instance.enqueue_authorization_poll()
+                            results[instance.pk] = {'resp': True, 'pending': True, 'stage': VOUCHER_STAGE[3][0]}
+        except Exception as e:
+            for instance in instances:
+                results.setdefault(instance.pk, {'resp': False, 'error': str(e)})
+        finally:
+            connection.close()
+        return [(instance, results[instance.pk]) for instance in instances]
+
+    def get_tasks(self, documents, batch_size):
+        if not batch_size:
+            return [(self.process_document, instance) for instance in documents]
+        tasks = []
+        groups = defaultdict(list)
+        for instance in documents:
+            # Las notificaciones por email no pasan por el SRI y se procesan una a una
+            if instance.status != INVOICE_STATUS[0][0]:
+                tasks.append((self.process_document, instance))
+                continue
+            groups[(instance.company_id, instance.company.environment_type, instance.receipt.voucher_type)].append(instance)
+        for instances in groups.values():
+            for index in range(0, len(instances), batch_size):
+                tasks.append((self.process_batch, instances[index:index + batch_size]))
+        return tasks
+
+    def print_summary(self, elapsed):
+        statistics = self.statistics
+        rate = statistics.documents / elapsed if elapsed else 0
+        self.stdout.write(f'Comprobantes: {statistics.documents} ({statistics.failed_documents} con errores) en {elapsed:.2f} s -> {rate:.2f} docs/s')
+        if statistics.throttled:
+            self.stdout.write(f'Espera por límite de peticiones: {statistics.throttled:.2f} s')
+        for stage, name in VOUCHER_STAGE:
+            latencies = statistics.latencies.get(stage)
+            if not latencies:
+                continue
+            self.stdout.write(
+                f'  {name}: {len(latencies)} llamadas, {statistics.failures[stage]} fallidas, '
+                f'promedio {sum(latencies) / len(latencies) * 1000:.0f} ms, p50 {statistics.percentile(latencies, 50) * 1000:.0f} ms, '
+                f'p95 {statistics.percentile(latencies, 95) * 1000:.0f} ms, máx {max(latencies) * 1000:.0f} ms'
+            )
+
+    def handle(self, *args, **options):
+        start_date, end_date = self.get_date_range(options)
+        companies = sorted(options['company']) if options['company'] else []
+        rate_limit = settings.ELECTRONIC_BILLING_RATE_LIMIT if options['rate_limit'] is None else options['rate_limit']
+        self.sri = SRI()
+        self.rate_limiter = RateLimiter(rate=rate_limit)
+        self.statistics = Statistics()
+        signature = {'start_date': str(start_date), 'end_date': str(end_date), 'companies': companies}
+        checkpoint = Checkpoint(path=options['checkpoint'], signature=signature, restart=options['restart'])
+
+        documents = [instance for instance in self.get_documents(start_date, end_date, companies) if self.get_key(instance) not in checkpoint]
+        if checkpoint.processed:
+            self.stdout.write(f'Retomando ejecución: {len(checkpoint.processed)} comprobantes ya procesados')
+        mode = f' en lotes de {options["batch"]}' if options['batch'] else ''
+        self.stdout.write(f'Comprobantes por procesar: {len(documents)} ({start_date} - {end_date}) con {options["workers"]} workers{mode}')
+
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=max(options['workers'], 1))
+        try:
+            futures = [executor.submit(function, argument) for function, argument in self.get_tasks(documents, options['batch'])]
+            for future in as_completed(futures):
+                for instance, response in future.result():
+                    self.statistics.add_document(response['resp'])
+                    checkpoint.add(self.get_key(instance))
+                    if not response['resp']:
+                        self.stdout.write(self.style.ERROR(f'{instance.receipt_number_full}: {response.get("error")}'))
+        except KeyboardInterrupt:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.print_summary(time.perf_counter() - start)
+            self.stdout.write(self.style.WARNING(f'Ejecución interrumpida, se retomará desde {checkpoint.path}'))
+            return
+        executor.shutdown()
+        self.print_summary(time.perf_counter() - start)
+        # Una ejecución completa no necesita retomarse
+        checkpoint.clear()
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from django.core.management import BaseCommand
+
+from config import settings
+from core.pos.choices import VOUCHER_METRIC_STAGE
+from core.pos.models import VoucherStageMetric
+
+
+class Command(BaseCommand):
+    help = 'Muestra los percentiles de duración de cada etapa de la facturación electrónica y depura las métricas antiguas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help='Días hacia atrás incluidos en el resumen')
+        parser.add_argument('--company', type=int, default=None, help='ID de la compañía')
+        parser.add_argument('--purge', action='store_true', help=f'Elimina las métricas con más de ELECTRONIC_BILLING_METRICS_RETENTION_DAYS ({settings.ELECTRONIC_BILLING_METRICS_RETENTION_DAYS}) días')
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            deleted = VoucherStageMetric.purge()
+            self.stdout.write(self.style.SUCCESS(f'Métricas eliminadas: {deleted}'))
+            return
+        queryset = VoucherStageMetric.objects.filter(date_joined__gte=datetime.now().date() - timedelta(days=max(options['days'] - 1, 0)))
+        if options['company']:
+            queryset = queryset.filter(company_id=options['company'])
+        stages = dict(VOUCHER_METRIC_STAGE)
+        # En el orden del flujo del comprobante
+        rows = sorted(VoucherStageMetric.get_report(queryset, group_by=('stage',)), key=lambda row: list(stages).index(row['stage']) if row['stage'] in stages else len(stages))
+        if not rows:
+            self.stdout.write('Sin métricas en el periodo')
+            return
+        self.stdout.write(f'{"Etapa":<28}{"Cant.":>8}{"Errores":>9}{"Prom.":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"Máx.":>9}{"KB prom.":>10}')
+        for row in rows:
+            self.stdout.write(
+                f'{stages.get(row["stage"], row["stage"]):<28}{row["count"]:>8}{row["errors"]:>9}{row["avg"]:>9.3f}{row["p50"]:>9.3f}'
+                f'{row["p95"]:>9.3f}{row["p99"]:>9.3f}{row["max"]:>9.3f}{row["size_avg"] / 1024:>10.1f}'
+            )
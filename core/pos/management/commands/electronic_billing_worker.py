@@ -0,0 +1,46 @@
+import os
+import socket
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from config import settings
+from core.pos.choices import VOUCHER_STAGE
+from core.pos.models import ElectronicBillingJob
+from core.pos.utilities.rate_limiter import RateLimiter
+from core.pos.utilities.sri import SRI
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de facturación electrónica (creación, firma, recepción, autorización y envío por email) etapa por etapa'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=10, help='Trabajos tomados de la cola en cada consulta')
+        parser.add_argument('--sleep', type=float, default=2, help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--once', action='store_true', help='Procesa los trabajos disponibles y termina')
+        parser.add_argument('--worker', type=str, default=None, help='Identificador del worker (por defecto host:pid)')
+        parser.add_argument('--rate_limit', type=float, default=settings.ELECTRONIC_BILLING_OFFLINE_RATE_LIMIT, help='Comprobantes emitidos sin conexión enviados al SRI por segundo y compañía (0 = sin límite)')
+
+    def handle(self, *args, **options):
+        sri = SRI()
+        worker = options['worker'] or f'{socket.gethostname()}:{os.getpid()}'
+        # El backlog de la contingencia se envía a ritmo controlado para no saturar al SRI cuando se recupera
+        rate_limiter = RateLimiter(rate=options['rate_limit'])
+        self.stdout.write(f'Worker {worker} iniciado')
+        try:
+            while True:
+                close_old_connections()
+                jobs = ElectronicBillingJob.claim(worker=worker, limit=options['batch'])
+                for job in jobs:
+                    if job.offline and job.stage == VOUCHER_STAGE[2][0]:
+                        rate_limiter.acquire(job.company_id)
+                    job.process(sri=sri)
+                    message = f'{job.get_voucher().receipt_number_full}: {job.get_status_display()} ({job.get_stage_display()})'
+                    self.stdout.write(self.style.ERROR(message) if job.last_error else message)
+                if options['once'] and not jobs:
+                    break
+                if not jobs:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write(f'Worker {worker} detenido')
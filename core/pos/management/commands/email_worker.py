@@ -0,0 +1,62 @@
+import os
+import socket
+import time
+from collections import Counter
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from core.pos.choices import EMAIL_STATUS
+from core.pos.models import OutboundEmail, VoucherMailing
+from core.pos.utilities.mailer import SMTPConnectionPool
+
+
+class Command(BaseCommand):
+    help = 'Prepara los reenvíos masivos de comprobantes y envía la bandeja de salida de correos manteniendo abiertas las conexiones SMTP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=50, help='Correos tomados de la bandeja en cada consulta')
+        parser.add_argument('--sleep', type=float, default=2, help='Segundos de espera cuando la bandeja está vacía')
+        parser.add_argument('--once', action='store_true', help='Envía los correos disponibles y termina')
+        parser.add_argument('--worker', type=str, default=None, help='Identificador del worker (por defecto host:pid)')
+
+    def print_metrics(self, pool, totals, elapsed):
+        sent = pool.metrics['sent']
+        self.stdout.write(
+            f'Correos: {totals[EMAIL_STATUS[2][0]]} enviados, {totals[EMAIL_STATUS[0][0]]} reprogramados, {totals[EMAIL_STATUS[3][0]]} fallidos '
+            f'en {elapsed:.2f} s -> {sent / elapsed if elapsed else 0:.1f} correos/s, '
+            f'{pool.metrics["connections"]} conexiones abiertas, {pool.metrics["reused"]} reutilizadas, '
+            f'{pool.metrics["send_time"] / sent * 1000 if sent else 0:.1f} ms por envío'
+        )
+
+    def handle(self, *args, **options):
+        worker = options['worker'] or f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Worker de correo {worker} iniciado')
+        totals = Counter()
+        start = time.perf_counter()
+        with SMTPConnectionPool() as pool:
+            try:
+                while True:
+                    close_old_connections()
+                    # Los reenvíos masivos solo generan correos en la bandeja; se preparan de a uno para no retrasar el envío
+                    for mailing in VoucherMailing.claim(worker=worker, limit=1):
+                        mailing.process()
+                        if mailing.last_error:
+                            self.stdout.write(self.style.ERROR(f'Reenvío de comprobantes a {mailing.customer}: {mailing.last_error}'))
+                        else:
+                            self.stdout.write(f'Reenvío de comprobantes a {mailing.customer}: {mailing.processed} de {mailing.total} comprobantes en la bandeja de salida')
+                    emails = OutboundEmail.claim(worker=worker, limit=options['batch'])
+                    for email in emails:
+                        email.process(pool=pool)
+                        totals[email.status] += 1
+                        if email.last_error:
+                            self.stdout.write(self.style.ERROR(f'{email.subject} -> {", ".join(email.recipients)}: {email.get_status_display()} ({email.last_error})'))
+                    if emails:
+                        self.print_metrics(pool, totals, time.perf_counter() - start)
+                    pool.close_idle()
+                    if options['once'] and not emails:
+                        break
+                    if not emails:
+                        time.sleep(options['sleep'])
+            except KeyboardInterrupt:
+                self.stdout.write(f'Worker de correo {worker} detenido')
@@ -0,0 +1,62 @@
+import os
+import time
+from datetime import datetime
+
+from django.core.management import BaseCommand, CommandError
+
+from config import settings
+from core.pos.models import Company
+from core.pos.utilities.voucher_export import VoucherExport
+
+
+class Command(BaseCommand):
+    help = 'Exporta en archivos ZIP los XML y PDF autorizados de una compañía en un rango de fechas, con un manifiesto CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, required=True, help='ID de la compañía')
+        parser.add_argument('--start_date', type=str, default=None, help='Fecha de registro inicial (YYYY-MM-DD)')
+        parser.add_argument('--end_date', type=str, default=None, help='Fecha de registro final (YYYY-MM-DD)')
+        parser.add_argument('--output', type=str, default=os.path.join(settings.BASE_DIR, 'exports'), help='Directorio donde se guardan los ZIP')
+        parser.add_argument('--part_size', type=int, default=None, help='Comprobantes por archivo ZIP (por defecto VOUCHER_EXPORT_PART_SIZE)')
+        parser.add_argument('--restart', action='store_true', help='Vuelve a generar las partes que ya existen')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date() if options['start_date'] else None
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date() if options['end_date'] else None
+        except ValueError:
+            raise CommandError('Las fechas deben tener el formato YYYY-MM-DD')
+        company = Company.objects.filter(pk=options['company']).first()
+        if company is None:
+            raise CommandError(f'No existe la compañía {options["company"]}')
+        export = VoucherExport(company=company, start_date=start_date, end_date=end_date, part_size=options['part_size'])
+        total = export.get_count()
+        parts = export.get_parts()
+        os.makedirs(options['output'], exist_ok=True)
+        self.stdout.write(f'Comprobantes por exportar: {total} en {parts} archivo(s)')
+        start = time.perf_counter()
+        done = 0
+        for part in range(1, parts + 1):
+            path = os.path.join(options['output'], export.get_filename(part))
+            if os.path.exists(path) and not options['restart']:
+                # La parte ya terminó en una ejecución anterior
+                self.stdout.write(f'{path}: ya existe, se omite')
+                continue
+            # Se escribe en un archivo temporal y se renombra al terminar, así una parte incompleta nunca parece lista
+            partial = f'{path}.partial'
+            count = 0
+            try:
+                with open(partial, 'wb') as file:
+                    for _ in export.write(file, part=part):
+                        count += 1
+                os.replace(partial, path)
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING(f'Exportación interrumpida en la parte {part}; vuelva a ejecutar el comando para continuar'))
+                return
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+            done += count
+            self.stdout.write(f'{path}: {count} comprobantes, {os.path.getsize(path) / 1024 / 1024:.1f} MB')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Exportados {done} comprobantes en {elapsed:.2f} s'))
@@ -11,6 +11,7 @@ from django.core.management import BaseCommand
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
+from core.pos.choices import STOCK_MOVEMENT_TYPE
 from core.pos.models import *
 
 
@@ -87,7 +88,6 @@ class Command(BaseCommand):
                 detail = PurchaseDetail.objects.create(purchase_id=purchase.id, product_id=product.id, quantity=random.randint(1, 50), price=product.pvp)
                 detail.subtotal = float(detail.price) * detail.quantity
                 detail.save()
-                product.stock += detail.quantity
-                product.save()
+                StockMovement.register([StockMovement(product=product, movement_type=STOCK_MOVEMENT_TYPE[3][0], quantity=detail.quantity, purchase=purchase, description=purchase.number)])
             purchase.recalculate_invoice()
             print(f'Purchase record created successfully: {purchase.id}')
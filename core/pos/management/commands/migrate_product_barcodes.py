@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+
+from config import settings
+from core.pos.models import Product
+from core.pos.utilities.product_barcode import product_barcodes
+
+
+class Command(BaseCommand):
+    help = 'Genera los códigos de barras que faltan con el nombre por código y borra los PNG anteriores (barcode/%Y/%m/%d/CODIGO.png) que ya no usa ningún producto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, nargs='+', default=None, help='ID de las compañías a procesar')
+        parser.add_argument('--batch', type=int, default=1000, help='Productos procesados en cada bloque')
+        parser.add_argument('--keep', action='store_true', help='No borra los archivos anteriores')
+
+    def backfill(self, options):
+        queryset = Product.objects.exclude(code='').only('id', 'company_id', 'code', 'barcode')
+        if options['company']:
+            queryset = queryset.filter(company_id__in=options['company'])
+        updated = 0
+        products = []
+        for product in queryset.order_by('id').iterator(chunk_size=options['batch']):
+            products.append(product)
+            if len(products) >= options['batch']:
+                updated += product_barcodes.render_products(products)
+                products = []
+        if products:
+            updated += product_barcodes.render_products(products)
+        return updated
+
+    def walk(self, path):
+        try:
+            directories, files = default_storage.listdir(path)
+        except FileNotFoundError:
+            return
+        for name in files:
+            yield f'{path}/{name}'
+        for directory in directories:
+            yield from self.walk(f'{path}/{directory}')
+
+    def clean(self):
+        # Se conserva todo archivo referenciado o que corresponde al código actual de algún producto
+        keep = set(Product.objects.exclude(barcode='').exclude(barcode__isnull=True).values_list('barcode', flat=True))
+        keep.update(product_barcodes.get_name(SimpleNamespace(company_id=company_id, code=code)) for company_id, code in Product.objects.exclude(code='').values_list('company_id', 'code'))
+        folders = {settings.PRODUCT_BARCODE_DIR, Product._meta.get_field('barcode').upload_to.split('/', 1)[0]}
+        deleted, size = 0, 0
+        for folder in folders:
+            for name in list(self.walk(folder)):
+                if name in keep or not name.lower().endswith('.png'):
+                    continue
+                size += default_storage.size(name)
+                default_storage.delete(name)
+                deleted += 1
+        return deleted, size
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        updated = self.backfill(options)
+        message = f'Productos actualizados: {updated}'
+        if not options['keep']:
+            deleted, size = self.clean()
+            message += f', archivos anteriores borrados: {deleted} ({size / 1024 / 1024:.2f} MB)'
+        self.stdout.write(f'{message} en {time.perf_counter() - start:.2f} s')
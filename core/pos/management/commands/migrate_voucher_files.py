@@ -0,0 +1,56 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from core.pos.models import CreditNote, Invoice
+from core.pos.utilities.voucher_storage import voucher_storage
+
+
+class Command(BaseCommand):
+    help = 'Mueve los XML y PDF autorizados guardados con el esquema anterior al almacenamiento direccionado por contenido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, nargs='+', default=None, help='ID de las compañías a procesar')
+        parser.add_argument('--keep', action='store_true', help='No borra los archivos anteriores')
+
+    def migrate_file(self, instance, field_name, options):
+        file = getattr(instance, field_name)
+        previous = file.name
+        if not previous or voucher_storage.is_hashed(previous) or not voucher_storage.exists(previous):
+            return None
+        size = voucher_storage.size(previous)
+        with voucher_storage.open(previous, 'rb') as content:
+            name = voucher_storage.save(file.field.generate_filename(instance, previous.rsplit('/', 1)[-1]), content)
+        type(instance).objects.filter(pk=instance.pk).update(**{field_name: name})
+        if not options['keep']:
+            # Solo se borra si ningún otro comprobante sigue apuntando al nombre anterior
+            voucher_storage.delete(previous)
+        return size, voucher_storage.size(name), name
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        files = 0
+        size_before = 0
+        size_after = 0
+        names = set()
+        for model in [Invoice, CreditNote]:
+            queryset = model.objects.filter(Q(authorized_xml__isnull=False) | Q(authorized_pdf__isnull=False)).exclude(authorized_xml='', authorized_pdf='')
+            if options['company']:
+                queryset = queryset.filter(company_id__in=options['company'])
+            for instance in queryset.order_by('id').iterator(chunk_size=200):
+                for field_name in ['authorized_xml', 'authorized_pdf']:
+                    result = self.migrate_file(instance, field_name, options)
+                    if result is None:
+                        continue
+                    size, new_size, name = result
+                    files += 1
+                    size_before += size
+                    # Un archivo compartido por varios comprobantes ocupa espacio una sola vez
+                    if name not in names:
+                        names.add(name)
+                        size_after += new_size
+        self.stdout.write(
+            f'Archivos migrados: {files} ({len(names)} distintos) en {time.perf_counter() - start:.2f} s, '
+            f'{size_before / 1024 / 1024:.2f} MB -> {size_after / 1024 / 1024:.2f} MB'
+        )
@@ -0,0 +1,42 @@
+import os
+import socket
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from core.pos.models import ProductImport
+
+
+class Command(BaseCommand):
+    help = 'Importa en segundo plano los excel de productos subidos desde el listado de productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=2, help='Segundos de espera cuando no hay importaciones pendientes')
+        parser.add_argument('--once', action='store_true', help='Procesa las importaciones pendientes y termina')
+        parser.add_argument('--worker', type=str, default=None, help='Identificador del worker (por defecto host:pid)')
+
+    def handle(self, *args, **options):
+        worker = options['worker'] or f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'Worker de importación de productos {worker} iniciado')
+        try:
+            while True:
+                close_old_connections()
+                imports = ProductImport.claim(worker=worker, limit=1)
+                for product_import in imports:
+                    start = time.perf_counter()
+                    product_import.process()
+                    elapsed = time.perf_counter() - start
+                    if product_import.last_error:
+                        self.stdout.write(self.style.ERROR(f'{product_import} ({product_import.company}): {product_import.last_error}'))
+                    else:
+                        self.stdout.write(
+                            f'{product_import} ({product_import.company}): {product_import.created} creados, {product_import.updated} actualizados, '
+                            f'{len(product_import.errors)} filas con errores en {elapsed:.2f} s'
+                        )
+                if options['once'] and not imports:
+                    break
+                if not imports:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write(f'Worker de importación de productos {worker} detenido')
@@ -0,0 +1,110 @@
+import random
+import string
+import threading
+import time
+from collections import Counter
+from datetime import date
+from itertools import cycle
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from core.pos.choices import VOUCHER_TYPE
+from core.pos.models import Company, Receipt
+from core.pos.utilities.access_key import create_access_keys, is_valid_access_key
+from core.pos.utilities.sequence import ReceiptSequenceAllocator
+
+
+class Command(BaseCommand):
+    help = 'Reserva secuenciales desde varios hilos a la vez para comprobar que no se repiten y mide la generación de claves de acceso'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, default=None, help='ID de la compañía cuyos datos se usan en las claves de acceso')
+        parser.add_argument('--workers', type=int, default=8, help='Hilos que reservan secuenciales a la vez, cada uno con su propio asignador')
+        parser.add_argument('--allocations', type=int, default=200, help='Secuenciales reservados por cada hilo')
+        parser.add_argument('--block', type=int, default=1, help='Secuenciales reservados por cada acceso a la base de datos')
+        parser.add_argument('--keys', type=int, default=100000, help='Claves de acceso generadas en bloque')
+
+    def get_company(self, options):
+        queryset = Company.objects.all()
+        if options['company']:
+            queryset = queryset.filter(pk=options['company'])
+        company = queryset.order_by('id').first()
+        if company is None:
+            raise CommandError('No existe una compañía para generar las claves de acceso')
+        return company
+
+    def allocate(self, receipt, allocator, allocations, numbers, errors):
+        try:
+            for _ in range(allocations):
+                numbers.extend(allocator.allocate(receipt))
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            connection.close()
+
+    def stress_sequences(self, options):
+        # Un comprobante temporal evita consumir la numeración real de la compañía
+        receipt = Receipt.objects.create(voucher_type=VOUCHER_TYPE[0][0], establishment_code='999', issuing_point_code='999', sequence=0)
+        try:
+            numbers, errors, threads = [], [], []
+            for _ in range(options['workers']):
+                allocator = ReceiptSequenceAllocator(block_size=options['block'])
+                threads.append(threading.Thread(target=self.allocate, args=(receipt, allocator, options['allocations'], numbers, errors)))
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            receipt.refresh_from_db()
+        finally:
+            receipt.delete()
+        duplicates = sum(count - 1 for count in Counter(numbers).values() if count > 1)
+        gaps = receipt.sequence - len(set(numbers))
+        self.stdout.write(f'Secuenciales: {len(numbers)} reservados por {options["workers"]} hilos en {elapsed:.3f} s ({len(numbers) / elapsed if elapsed else 0:.0f}/s), bloque de {options["block"]}')
+        self.stdout.write(f'Secuencia final: {receipt.sequence}, sin usar: {gaps}')
+        for error in errors[:5]:
+            self.stdout.write(self.style.ERROR(f'Error: {error}'))
+        if duplicates or errors:
+            raise CommandError(f'Se repitieron {duplicates} secuenciales y fallaron {len(errors)} hilos')
+        self.stdout.write(self.style.SUCCESS('Ningún secuencial se repitió'))
+
+    def create_access_key_loop(self, company, issue_date, sequence):
+        # Generación anterior, una clave a la vez, usada como referencia
+        password_48 = f"{issue_date.strftime('%d%m%Y')}{VOUCHER_TYPE[0][0]}{company.ruc}{company.environment_type}999999{sequence:09d}{''.join(random.choices(list(string.digits), k=8))}{company.emission_type}"
+        addition = 0
+        for digit, factor in zip(reversed(password_48), cycle((2, 3, 4, 5, 6, 7))):
+            addition += int(digit) * factor
+        number = 11 - addition % 11
+        return f'{password_48}{0 if number == 11 else 1 if number == 10 else number}'
+
+    def benchmark_access_keys(self, company, count):
+        issue_date = date.today()
+        start = time.perf_counter()
+        for sequence in range(1, count + 1):
+            self.create_access_key_loop(company, issue_date, sequence)
+        elapsed_loop = time.perf_counter() - start
+        start = time.perf_counter()
+        keys = create_access_keys(
+            issue_dates=issue_date,
+            voucher_type=VOUCHER_TYPE[0][0],
+            ruc=company.ruc,
+            environment_type=company.environment_type,
+            establishment_code='999',
+            issuing_point_code='999',
+            sequences=range(1, count + 1),
+            emission_type=company.emission_type,
+        )
+        elapsed = time.perf_counter() - start
+        invalid = sum(1 for key in keys[:1000] if not is_valid_access_key(key))
+        self.stdout.write(f'Claves de acceso, una a la vez: {count} en {elapsed_loop:.3f} s ({count / elapsed_loop if elapsed_loop else 0:.0f}/s)')
+        self.stdout.write(f'Claves de acceso en bloque: {count} en {elapsed:.3f} s ({count / elapsed if elapsed else 0:.0f}/s), únicas: {len(set(keys))}')
+        if invalid or len(set(keys)) != count:
+            raise CommandError(f'Se generaron {invalid} claves con dígito verificador incorrecto o claves repetidas')
+
+    def handle(self, *args, **options):
+        company = self.get_company(options)
+        self.stress_sequences(options)
+        if options['keys']:
+            self.benchmark_access_keys(company, options['keys'])
@@ -0,0 +1,83 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Case, IntegerField, Min, Sum, Value, When
+
+from core.pos.choices import STOCK_MOVEMENT_TYPE
+from core.pos.models import Product, StockMovement
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el stock de los productos y los saldos del kárdex a partir de sus movimientos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, default=None, help='ID de la compañía')
+        parser.add_argument('--dry_run', action='store_true', help='Solo muestra las diferencias encontradas')
+        parser.add_argument('--batch_size', type=int, default=1000, help='Filas por cada actualización en bloque')
+
+    def get_totals(self, movements):
+        return dict(movements.order_by().values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+
+    def create_opening_movements(self, products, movements, options):
+        # El stock anterior al kárdex entra una sola vez como saldo inicial de cada producto
+        totals = self.get_totals(movements)
+        # Con la fecha del primer movimiento para que las consultas de stock a una fecha lo incluyan
+        dates = dict(movements.order_by().values('product_id').annotate(first=Min('date_joined')).values_list('product_id', 'first'))
+        openings = []
+        for product in products.exclude(stockmovement__movement_type=STOCK_MOVEMENT_TYPE[0][0]).only('id', 'company_id', 'stock'):
+            quantity = product.stock - totals.get(product.id, 0)
+            if quantity:
+                opening = StockMovement(company_id=product.company_id, product_id=product.id, movement_type=STOCK_MOVEMENT_TYPE[0][0], quantity=quantity, balance=quantity)
+                if product.id in dates:
+                    opening.date_joined = dates[product.id]
+                openings.append(opening)
+        StockMovement.objects.bulk_create(openings, batch_size=options['batch_size'])
+        return len(openings)
+
+    def rebuild_product_stock(self, products, movements, options):
+        totals = self.get_totals(movements)
+        updated = []
+        for product in products.select_for_update().only('id', 'name', 'stock'):
+            total = totals.get(product.id, 0)
+            if product.stock != total:
+                self.stdout.write(f'{product.name}: stock {product.stock}, kárdex {total}')
+                product.stock = total
+                updated.append(product)
+        Product.objects.bulk_update(updated, ['stock'], batch_size=options['batch_size'])
+        return len(updated)
+
+    def rebuild_balances(self, movements, options):
+        updated, count, product_id, balance = [], 0, None, 0
+        # El saldo inicial va primero aunque se haya registrado después de otros movimientos
+        opening_first = Case(When(movement_type=STOCK_MOVEMENT_TYPE[0][0], then=Value(0)), default=Value(1), output_field=IntegerField())
+        for movement in movements.order_by('product_id', opening_first, 'id').only('id', 'product_id', 'quantity', 'balance').iterator(chunk_size=options['batch_size']):
+            if movement.product_id != product_id:
+                product_id, balance = movement.product_id, 0
+            balance += movement.quantity
+            if movement.balance != balance:
+                movement.balance = balance
+                updated.append(movement)
+            if len(updated) >= options['batch_size']:
+                count += self.update_balances(updated)
+                updated = []
+        return count + self.update_balances(updated)
+
+    def update_balances(self, movements):
+        # bulk_update no pasa por StockMovement.save: solo se corrige el saldo derivado
+        StockMovement.objects.bulk_update(movements, ['balance'])
+        return len(movements)
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        movements = StockMovement.objects.all()
+        if options['company']:
+            products = products.filter(company_id=options['company'])
+            movements = movements.filter(company_id=options['company'])
+        with transaction.atomic():
+            opening = self.create_opening_movements(products, movements, options)
+            stock = self.rebuild_product_stock(products, movements, options)
+            balances = self.rebuild_balances(movements, options)
+            # Con --dry_run se calcula todo y se descarta al final
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        message = f'Saldos iniciales: {opening}, productos con stock corregido: {stock}, movimientos con saldo corregido: {balances}'
+        self.stdout.write(self.style.WARNING(f'{message} (sin guardar)') if options['dry_run'] else self.style.SUCCESS(message))
@@ -0,0 +1,72 @@
+import time
+from datetime import datetime
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+
+from core.pos.choices import INVOICE_STATUS
+from core.pos.models import CreditNote, Invoice
+from core.pos.utilities.pdf_pool import PDFRenderPool
+
+
+class Command(BaseCommand):
+    help = 'Vuelve a generar el PDF autorizado de los comprobantes de un rango de fechas usando todos los núcleos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start_date', type=str, required=True, help='Fecha de registro inicial (YYYY-MM-DD)')
+        parser.add_argument('--end_date', type=str, required=True, help='Fecha de registro final (YYYY-MM-DD)')
+        parser.add_argument('--company', type=int, nargs='+', default=None, help='ID de las compañías a procesar')
+        parser.add_argument('--voucher', choices=['invoice', 'credit_note'], default=None, help='Procesa solo facturas o solo notas de crédito')
+        parser.add_argument('--missing', action='store_true', help='Solo los comprobantes autorizados que no tienen PDF')
+        parser.add_argument('--processes', type=int, default=None, help='Procesos en paralelo (por defecto PDF_POOL_PROCESSES o uno por núcleo)')
+        parser.add_argument('--chunksize', type=int, default=4, help='Comprobantes que recibe cada proceso a la vez')
+
+    def get_jobs(self, options):
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Las fechas deben tener el formato YYYY-MM-DD')
+        models = []
+        if options['voucher'] in [None, 'invoice']:
+            models.append(Invoice)
+        if options['voucher'] in [None, 'credit_note']:
+            models.append(CreditNote)
+        jobs = []
+        for model in models:
+            queryset = model.objects.filter(date_joined__range=[start_date, end_date], status__in=[INVOICE_STATUS[1][0], INVOICE_STATUS[2][0]])
+            if options['company']:
+                queryset = queryset.filter(company_id__in=options['company'])
+            if options['missing']:
+                queryset = queryset.filter(authorized_pdf__in=['', None])
+            for instance in queryset.select_related('receipt').order_by('id').only('id', 'receipt__voucher_type'):
+                jobs.append(PDFRenderPool.create_job(instance, authorized=True, force=True))
+        return jobs
+
+    def handle(self, *args, **options):
+        jobs = self.get_jobs(options)
+        if not jobs:
+            self.stdout.write('No hay comprobantes autorizados en el rango indicado')
+            return
+        # Los procesos abren sus propias conexiones
+        connections.close_all()
+        pool = PDFRenderPool(processes=options['processes'])
+        self.stdout.write(f'Comprobantes por procesar: {len(jobs)} con {pool.processes} procesos')
+        start = time.perf_counter()
+        done = 0
+        errors = 0
+        render_time = 0
+        with pool:
+            for result in pool.render(jobs, chunksize=options['chunksize']):
+                done += 1
+                render_time += result['time']
+                if result['error']:
+                    errors += 1
+                    self.stdout.write(self.style.ERROR(f'{result["label"]} {result["pk"]}: {result["error"]}'))
+                if done % 100 == 0:
+                    self.stdout.write(f'  {done}/{len(jobs)}')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'PDF generados: {done - errors} ({errors} con errores) en {elapsed:.2f} s -> {done / elapsed if elapsed else 0:.2f} docs/s, {render_time / done * 1000:.0f} ms por documento en cada proceso')
+        if errors:
+            raise CommandError(f'No se pudieron generar {errors} PDF')
+        self.stdout.write(self.style.SUCCESS('PDF autorizados actualizados'))
@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+
+from core.pos.utilities.smtp_stub import REJECTED_DOMAIN, SMTPStubServer
+
+
+class Command(BaseCommand):
+    help = 'Levanta un servidor SMTP local que acepta los correos sin enviarlos, para probar la bandeja de salida'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Interfaz de escucha')
+        parser.add_argument('--port', type=int, default=2525, help='Puerto de escucha')
+        parser.add_argument('--delay', type=float, default=0, help='Segundos que tarda en aceptar cada mensaje')
+        parser.add_argument('--messages-per-connection', type=int, default=0, help='Cierra la conexión tras esta cantidad de mensajes (0 = nunca)')
+        parser.add_argument('--verbose', action='store_true', help='Muestra cada mensaje recibido')
+
+    def handle(self, *args, **options):
+        server = SMTPStubServer(address=(options['host'], options['port']), delay=options['delay'], messages_per_connection=options['messages_per_connection'], verbose=options['verbose'])
+        self.stdout.write(self.style.SUCCESS(f'Servidor SMTP de pruebas escuchando en {options["host"]}:{server.port}'))
+        self.stdout.write(f'Use EMAIL_HOST={options["host"]} y EMAIL_PORT={server.port}; los destinatarios @{REJECTED_DOMAIN} se rechazan')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Mensajes recibidos: {server.metrics["messages"]} en {server.metrics["connections"]} conexiones')
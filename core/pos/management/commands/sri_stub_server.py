@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from core.pos.utilities.sri_stub import SRIStubServer
+
+
+class Command(BaseCommand):
+    help = 'Levanta un servidor SOAP local que imita la recepción y autorización offline del SRI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Interfaz de escucha')
+        parser.add_argument('--port', type=int, default=8099, help='Puerto de escucha')
+        parser.add_argument('--verbose', action='store_true', help='Muestra cada petición recibida')
+        parser.add_argument('--authorization-delay', type=float, default=0, help='Segundos que un comprobante recibido permanece EN PROCESO')
+
+    def handle(self, *args, **options):
+        server = SRIStubServer(address=(options['host'], options['port']), verbose=options['verbose'], authorization_delay=options['authorization_delay'])
+        self.stdout.write(self.style.SUCCESS(f'Servidor SRI de pruebas escuchando en {server.base_url}'))
+        self.stdout.write(f'Use SRI_WS_TEST_URL={server.base_url} y SRI_WS_PRODUCTION_URL={server.base_url} para apuntar la aplicación a este servidor')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,21 @@
+from datetime import datetime, timedelta
+
+from django.core.management import BaseCommand
+
+from core.pos.models import StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Guarda el stock de cada producto al cierre del día desde el kárdex para las consultas de stock a una fecha'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=str, default=None, help='Fecha del cierre (YYYY-MM-DD), por defecto ayer')
+        parser.add_argument('--company', type=int, default=None, help='ID de la compañía')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        else:
+            date = datetime.now().date() - timedelta(days=1)
+        count = StockSnapshot.create_snapshots(date, company=options['company'])
+        self.stdout.write(self.style.SUCCESS(f'Instantáneas de stock al {date:%Y-%m-%d}: {count}'))
@@ -0,0 +1,86 @@
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.core.management import BaseCommand, CommandError
+from lxml import etree
+
+from core.pos.models import CreditNote, Invoice
+from core.pos.utilities.sri import SRI
+from core.pos.utilities.xsd import schema_cache
+
+
+class Command(BaseCommand):
+    help = 'Valida contra el XSD del SRI los comprobantes ya emitidos (XML autorizado o regenerado desde la base de datos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start_date', type=str, default=None, help='Fecha de registro inicial (YYYY-MM-DD)')
+        parser.add_argument('--end_date', type=str, default=None, help='Fecha de registro final (YYYY-MM-DD)')
+        parser.add_argument('--company', type=int, nargs='+', default=None, help='ID de las compañías a validar')
+        parser.add_argument('--voucher', choices=['invoice', 'credit_note'], default=None, help='Valida solo facturas o solo notas de crédito')
+        parser.add_argument('--generate', action='store_true', help='Regenera el XML desde la base de datos aunque exista el XML autorizado')
+        parser.add_argument('--record', action='store_true', help='Registra los comprobantes inválidos en los errores de comprobantes')
+        parser.add_argument('--limit', type=int, default=None, help='Cantidad máxima de comprobantes a validar')
+
+    def get_querysets(self, options):
+        querysets = []
+        if options['voucher'] in [None, 'invoice']:
+            querysets.append(Invoice.objects.exclude(receipt_number__isnull=True).filter(create_electronic_invoice=True, is_draft_invoice=False))
+        if options['voucher'] in [None, 'credit_note']:
+            querysets.append(CreditNote.objects.exclude(receipt_number__isnull=True).select_related('invoice__receipt', 'invoice__customer__user'))
+        try:
+            if options['start_date']:
+                querysets = [queryset.filter(date_joined__gte=datetime.strptime(options['start_date'], '%Y-%m-%d').date()) for queryset in querysets]
+            if options['end_date']:
+                querysets = [queryset.filter(date_joined__lte=datetime.strptime(options['end_date'], '%Y-%m-%d').date()) for queryset in querysets]
+        except ValueError:
+            raise CommandError('Las fechas deben tener el formato YYYY-MM-DD')
+        if options['company']:
+            querysets = [queryset.filter(company_id__in=options['company']) for queryset in querysets]
+        return [queryset.select_related('company', 'receipt').order_by('date_joined', 'id') for queryset in querysets]
+
+    def get_xml(self, instance, generate):
+        """XML enviado al SRI si el comprobante está autorizado; si no, el que se generaría hoy"""
+        if not generate and instance.authorized_xml:
+            with instance.authorized_xml.open('rb') as file:
+                authorization = etree.fromstring(file.read())
+            voucher = authorization.findtext('comprobante')
+            if voucher:
+                return voucher.encode('utf-8'), 'autorizado'
+        return instance.create_xml_document()[0], 'generado'
+
+    def handle(self, *args, **options):
+        sri = SRI()
+        start = time.perf_counter()
+        validated = 0
+        invalid = 0
+        sources = Counter()
+        messages = Counter()
+        for queryset in self.get_querysets(options):
+            for instance in queryset.iterator(chunk_size=200):
+                if options['limit'] and validated >= options['limit']:
+                    break
+                try:
+                    xml, source = self.get_xml(instance, options['generate'])
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'{instance.receipt_number_full}: no se pudo obtener el XML ({e})'))
+                    continue
+                validated += 1
+                sources[source] += 1
+                errors = schema_cache.validate(xml)
+                if not errors:
+                    continue
+                invalid += 1
+                for error in errors:
+                    messages[error['informacionAdicional'].split(': ', 1)[-1]] += 1
+                self.stdout.write(self.style.ERROR(f'{instance.receipt_number_full} ({source}): {errors[0]["informacionAdicional"]}'))
+                if options['record']:
+                    instance.create_receipt_error(errors=sri.validate_xml_schema(instance=instance, xml=xml), change_status=False)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Comprobantes validados: {validated} ({", ".join(f"{count} {source}s" for source, count in sources.items())}) en {elapsed:.2f} s')
+        for message, count in messages.most_common(10):
+            self.stdout.write(f'  {count} x {message}')
+        if invalid:
+            self.stdout.write(self.style.ERROR(f'Comprobantes que no cumplen el esquema: {invalid}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Todos los comprobantes cumplen el esquema'))
@@ -9,11 +9,14 @@ from .credit_note_detail import CreditNoteDetail
 from .customer import Customer
 from .elec_billing_base import ElecBillingBase
 from .elec_billing_detail_base import ElecBillingDetailBase
+from .electronic_billing_job import ElectronicBillingJob
 from .expense import Expense
 from .expense_type import ExpenseType
 from .invoice import Invoice
 from .invoice_detail import InvoiceDetail
+from .outbound_email import OutboundEmail
 from .product import Product
+from .product_import import ProductImport
 from .promotion import Promotion
 from .promotion_detail import PromotionDetail
 from .provider import Provider
@@ -23,7 +26,12 @@ from .quotation import Quotation
 from .quotation_detail import QuotationDetail
 from .receipt import Receipt
 from .receipt_error import ReceiptError
+from .sri_service_status import SRIServiceStatus
+from .stock_movement import StockMovement
+from .stock_snapshot import StockSnapshot
 from .transaction_summary import TransactionSummary
+from .voucher_mailing import VoucherMailing
+from .voucher_stage_metric import VoucherStageMetric
 
 __all__ = [
     'AccountPayable',
@@ -37,11 +45,14 @@ __all__ = [
     'Customer',
     'ElecBillingBase',
     'ElecBillingDetailBase',
+    'ElectronicBillingJob',
     'Expense',
     'ExpenseType',
     'Invoice',
     'InvoiceDetail',
+    'OutboundEmail',
     'Product',
+    'ProductImport',
     'Promotion',
     'PromotionDetail',
     'Provider',
@@ -51,5 +62,10 @@ __all__ = [
     'QuotationDetail',
     'Receipt',
     'ReceiptError',
+    'SRIServiceStatus',
+    'StockMovement',
+    'StockSnapshot',
     'TransactionSummary',
+    'VoucherMailing',
+    'VoucherStageMetric',
 ]
@@ -1,25 +1,21 @@
-import base64
-import smtplib
-import tempfile
-import time
 from datetime import datetime
-from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.utils import formataddr
-from io import BytesIO
+from functools import partial
 from xml.etree import ElementTree
 
-import barcode
-from barcode import writer
-from django.core.files.base import File
+from django.core.files.base import ContentFile
 from django.db import models
+from django.urls import reverse
 
 from config import settings
-from core.pos.choices import ENVIRONMENT_TYPE, INVOICE_STATUS, VOUCHER_STAGE, VOUCHER_TYPE
+from core.pos.choices import EMAIL_STATUS, ENVIRONMENT_TYPE, INVOICE_STATUS, VOUCHER_METRIC_STAGE, VOUCHER_STAGE, VOUCHER_TYPE
 from core.pos.models.transaction_summary import TransactionSummary
-from core.pos.utilities.pdf_creator import PDFCreator
+from core.pos.utilities.access_code_barcode import access_code_barcodes
+from core.pos.utilities.pdf_cache import pdf_cache
 from core.pos.utilities.sri import SRI
+from core.pos.utilities.stage_metrics import stage_metrics
+from core.pos.utilities.voucher_storage import get_voucher_storage, voucher_storage
 
 
 class ElecBillingBase(TransactionSummary):
@@ -30,12 +26,14 @@ class ElecBillingBase(TransactionSummary):
     environment_type = models.PositiveIntegerField(choices=ENVIRONMENT_TYPE, default=ENVIRONMENT_TYPE[0][0], verbose_name='Entorno de facturación electrónica')
     access_code = models.CharField(max_length=49, null=True, blank=True, verbose_name='Código de acceso')
     authorized_date = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de autorización')
-    authorized_xml = models.FileField(upload_to='authorized_xml/%Y/%m/%d', null=True, blank=True, verbose_name='XML Autorizado')
-    authorized_pdf = models.FileField(upload_to='pdf_authorized/%Y/%m/%d', null=True, blank=True, verbose_name='PDF Autorizado')
+    authorized_xml = models.FileField(upload_to='authorized_xml', storage=get_voucher_storage, null=True, blank=True, verbose_name='XML Autorizado')
+    authorized_pdf = models.FileField(upload_to='pdf_authorized', storage=get_voucher_storage, null=True, blank=True, verbose_name='PDF Autorizado')
     create_electronic_invoice = models.BooleanField(default=True, verbose_name='Crear factura electrónica')
     additional_info = models.JSONField(default=dict, verbose_name='Información adicional')
     status = models.CharField(max_length=50, choices=INVOICE_STATUS, default=INVOICE_STATUS[0][0], verbose_name='Estado')
 
+    pdf_version_exclude = ('status', 'authorized_xml', 'authorized_pdf')
+
     class Meta:
         abstract = True
 
@@ -59,11 +57,12 @@ class ElecBillingBase(TransactionSummary):
 
     @property
     def access_code_barcode(self):
-        buffer = BytesIO()
-        barcode_image = barcode.Code128(self.access_code, writer=writer.ImageWriter())
-        barcode_image.write(buffer, options={'text_distance': 3.0, 'font_size': 6})
-        encoded_image = base64.b64encode(buffer.getvalue()).decode('ascii')
-        return f"data:image/png;base64,{encoded_image}"
+        return access_code_barcodes.get_data_uri(self.access_code)
+
+    def get_access_code_barcode(self):
+        if self.access_code:
+            return access_code_barcodes.get_url(self.access_code)
+        return f'{settings.STATIC_URL}img/default/empty.png'
 
     def is_invoice(self):
         return self.receipt.voucher_type == VOUCHER_TYPE[0][0]
@@ -77,14 +76,20 @@ class ElecBillingBase(TransactionSummary):
     def formatted_authorized_date(self):
         return self.authorized_date.strftime('%Y-%m-%d') if self.authorized_date else ''
 
+    def get_file_url(self, file, kind):
+        # Los archivos comprimidos se descomprimen al vuelo en la vista de descarga; el resto se sirve desde el backend
+        if voucher_storage.is_compressed(file.name):
+            return reverse('voucher_file', kwargs={'code': self.voucher_type_code, 'pk': self.pk, 'kind': kind})
+        return file.url
+
     def get_authorized_xml(self):
         if self.authorized_xml:
-            return f'{settings.MEDIA_URL}{self.authorized_xml}'
+            return self.get_file_url(self.authorized_xml, 'xml')
         return None
 
     def get_authorized_pdf(self):
         if self.authorized_pdf:
-            return f'{settings.MEDIA_URL}{self.authorized_pdf}'
+            return self.get_file_url(self.authorized_pdf, 'pdf')
         return None
 
     def as_dict(self):
@@ -127,8 +132,8 @@ class ElecBillingBase(TransactionSummary):
             if self.check_sequential_error(errors=errors) and change_status:
                 self.status = INVOICE_STATUS[4][0]
                 self.edit()
-                self.receipt.sequence = self.receipt.sequence + 1
-                self.receipt.save()
+                # El secuencial ya existe en el SRI: se salta atómicamente para que la próxima venta no lo repita
+                self.receipt.allocate_sequence()
 
     def generate_receipt_number(self, increase=True):
         if isinstance(self.receipt.sequence, str):
@@ -146,45 +151,113 @@ class ElecBillingBase(TransactionSummary):
                 establishment_code=self.company.establishment_code,
                 issuing_point_code=self.company.issuing_point_code,
             )
-        self.receipt_number = self.generate_receipt_number()
-        return self.get_receipt_number_full()
+        return self.allocate_receipt_number()
+
+    def allocate_receipt_number(self):
+        from core.pos.utilities.sequence import receipt_sequences
+
+        self.receipt_number = f'{receipt_sequences.allocate(self.receipt)[0]:09d}'
+        self.receipt_number_full = self.get_receipt_number_full()
+        return self.receipt_number_full
+
+    def find_next_available_sequential(self):
+        # Tras un ERROR SECUENCIAL REGISTRADO se reserva otro secuencial y la clave de acceso se genera de nuevo
+        self.allocate_receipt_number()
+        self.access_code = None
+        return True
 
     def get_receipt_number_full(self):
         return f'{self.receipt.establishment_code}-{self.receipt.issuing_point_code}-{self.receipt_number}'
 
+    def get_issue_date(self):
+        value = self.date_joined
+        if isinstance(value, str):
+            value = datetime.strptime(value, '%Y-%m-%d')
+        return value
+
     def create_authorized_pdf(self):
         try:
             template = self.receipt_template_name
             if not template:
                 return
-            pdf_file = PDFCreator(template_name=template).create(context={'object': self})
-            with tempfile.NamedTemporaryFile(delete=True) as file_temp:
-                file_temp.write(pdf_file)
-                file_temp.flush()
-                self.authorized_pdf.save(
-                    name=f'{self.receipt.get_name_file()}-{self.receipt_number_full}.pdf',
-                    content=File(file_temp),
-                )
+            # Queda en la caché de PDFs: la impresión y el correo no vuelven a generarlo
+            pdf_file = pdf_cache.get_content(self, template)
+            self.authorized_pdf.save(
+                name=f'{self.receipt.get_name_file()}-{self.receipt_number_full}.pdf',
+                content=ContentFile(pdf_file),
+            )
         except Exception:  # pragma: no cover
             pass
 
-    def generate_electronic_invoice_document(self):
+    def update_authorized_pdf(self, force=False):
+        """Vuelve a generar el PDF autorizado, reemplaza el archivo anterior y actualiza solo esa columna"""
+        previous = self.authorized_pdf.name if self.authorized_pdf else None
+        pdf_file = stage_metrics.measure(self, VOUCHER_METRIC_STAGE[5][0], pdf_cache.get_content, instance=self, template_name=self.receipt_template_name, force=force)
+        self.authorized_pdf.save(
+            name=f'{self.receipt.get_name_file()}-{self.receipt_number_full}.pdf',
+            content=ContentFile(pdf_file),
+            save=False,
+        )
+        type(self).objects.filter(pk=self.pk).update(authorized_pdf=self.authorized_pdf.name)
+        if previous and previous != self.authorized_pdf.name:
+            self.authorized_pdf.storage.delete(previous)
+        return self.authorized_pdf.name
+
+    def get_email_attachments(self):
+        """PDF y XML autorizados como adjuntos que se leen del storage al escribir el correo (ver mailer.write_message)"""
+        if not self.authorized_pdf:
+            self.update_authorized_pdf()
+        return [
+            (f'{self.access_code}.pdf', 'application/pdf', partial(self.authorized_pdf.storage.open, self.authorized_pdf.name, 'rb')),
+            (f'{self.access_code}.xml', 'application/xml', partial(self.authorized_xml.storage.open, self.authorized_xml.name, 'rb')),
+        ]
+
+    def get_pdf_file(self):
+        if self.authorized_pdf:
+            with self.authorized_pdf.open('rb') as file:
+                return file.read()
+        return self.create_invoice_pdf()
+
+    def generate_electronic_invoice_document(self, run_stage=None):
+        # run_stage(stage, function, **kwargs) permite medir o limitar cada etapa (ver manage.py electronic_billing);
+        # la duración registrada en VoucherStageMetric es solo la de la etapa, sin la espera del limitador
         sri = SRI()
-        response = sri.create_xml(self)
+        runner = run_stage or (lambda stage, function, **kwargs: function(**kwargs))
+        run_stage = lambda stage, function, **kwargs: runner(stage, stage_metrics.timed(self, stage, function), **kwargs)
+        response = run_stage(VOUCHER_STAGE[0][0], sri.create_xml, instance=self)
         if response['resp']:
-            response = sri.firm_xml(instance=self, xml=response['xml'])
+            response = run_stage(VOUCHER_STAGE[1][0], sri.firm_xml, instance=self, xml=response['xml'])
             if response['resp']:
-                response = sri.validate_xml(instance=self, xml=response['xml'])
+                xml = response['xml']
+                response = run_stage(VOUCHER_STAGE[2][0], sri.validate_xml, instance=self, xml=xml)
+                if sri.is_unavailable(response):
+                    # Con el SRI caído el comprobante firmado queda en cola y se envía cuando el servicio se recupere
+                    self.enqueue_electronic_billing(stage=VOUCHER_STAGE[2][0], xml=xml, offline=True)
+                    response = {'resp': True, 'pending': True, 'offline': True, 'stage': VOUCHER_STAGE[2][0], 'msg': f'{response["error"]}. El comprobante fue emitido sin conexión y quedó en cola para su envío al SRI'}
+                    return response
                 if response['resp']:
-                    response = sri.authorize_xml(instance=self)
-                    index = 1
-                    while not response['resp'] and index < 3:
-                        time.sleep(1)
-                        response = sri.authorize_xml(instance=self)
-                        index += 1
+                    response = run_stage(VOUCHER_STAGE[3][0], sri.authorize_xml, instance=self)
+                    if response.get('pending') or sri.is_unavailable(response):
+                        # El SRI ya recibió el comprobante; la autorización la consulta authorization_poller con backoff
+                        self.enqueue_authorization_poll()
+                        response = {'resp': True, 'pending': True, 'stage': VOUCHER_STAGE[3][0], 'msg': 'El comprobante fue recibido por el SRI y está en proceso de autorización'}
                     return response
         return response
 
+    def enqueue_electronic_billing(self, send_email=True, stage=VOUCHER_STAGE[0][0], xml=None, offline=False):
+        from core.pos.models.electronic_billing_job import ElectronicBillingJob
+
+        return ElectronicBillingJob.enqueue(voucher=self, send_email=send_email, stage=stage, xml=xml, offline=offline)
+
+    def set_offline_pending(self, offline=True):
+        # Solo cambia un comprobante sin autorizar (o el que vuelve de la contingencia): nunca pisa una autorización
+        current, status = (INVOICE_STATUS[0][0], INVOICE_STATUS[5][0]) if offline else (INVOICE_STATUS[5][0], INVOICE_STATUS[0][0])
+        if type(self).objects.filter(pk=self.pk, status=current).update(status=status):
+            self.status = status
+
+    def enqueue_authorization_poll(self, send_email=True):
+        return self.enqueue_electronic_billing(send_email=send_email, stage=VOUCHER_STAGE[3][0])
+
     def get_client_from_model(self):
         if hasattr(self, 'customer'):
             return getattr(self, 'customer')
@@ -193,12 +266,16 @@ class ElecBillingBase(TransactionSummary):
         return None
 
     def send_invoice_files_to_customer(self):
+        from core.pos.models.outbound_email import OutboundEmail
+
         response = {'resp': True}
+        if OutboundEmail.objects.filter(OutboundEmail.get_voucher_filter(self), status__in=[EMAIL_STATUS[0][0], EMAIL_STATUS[1][0]]).exists():
+            # Ya hay un correo en la bandeja de salida para este comprobante
+            return response
         try:
             customer = self.get_client_from_model()
-            message = MIMEMultipart('alternative')
+            message = MIMEMultipart('mixed')
             message['Subject'] = f'Factura electrónica – {self.receipt_number_full}'
-            message['From'] = formataddr(('OptimusPos Facturación', settings.EMAIL_HOST_USER))
             message['To'] = customer.user.email
 
             html_content = f"""
@@ -304,20 +381,8 @@ class ElecBillingBase(TransactionSummary):
             """
             message.attach(MIMEText(html_content, 'html'))
 
-            pdf_file = self.create_invoice_pdf()
-            pdf_part = MIMEApplication(pdf_file, _subtype='pdf')
-            pdf_part.add_header('Content-Disposition', 'attachment', filename=f'{self.access_code}.pdf')
-            message.attach(pdf_part)
-
-            with open(f'{settings.BASE_DIR}{self.get_authorized_xml()}', 'rb') as file_xml:
-                xml_part = MIMEApplication(file_xml.read())
-                xml_part.add_header('Content-Disposition', 'attachment', filename=f'{self.access_code}.xml')
-                message.attach(xml_part)
-
-            server = smtplib.SMTP_SSL(settings.EMAIL_HOST, 465)
-            server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-            server.sendmail(settings.EMAIL_HOST_USER, [customer.user.email], message.as_string())
-            server.quit()
+            # El estado pasa a "enviada por email" cuando el worker de correo entrega el mensaje
+            OutboundEmail.enqueue(message=message, recipients=[customer.user.email], company=self.company, voucher=self, sender_name='OptimusPos Facturación', attachments=self.get_email_attachments())
 
         except Exception as exc:  # pragma: no cover
             response = {'resp': False, 'error': str(exc)}
@@ -327,12 +392,15 @@ class ElecBillingBase(TransactionSummary):
         return not self.receipt_number_full or not self.receipt_number
 
     def save_sequence_number(self):
-        self.receipt.sequence = int(self.receipt_number)
-        self.receipt.save()
+        from core.pos.models.receipt import Receipt
+
+        # Solo avanza la secuencia: otra caja pudo reservar un número mayor mientras tanto
+        Receipt.objects.filter(pk=self.receipt_id, sequence__lt=int(self.receipt_number)).update(sequence=int(self.receipt_number))
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         if self.pk is None and not self.receipt_number_is_null():
-            self.save_sequence_number()
+            # El número mostrado en el formulario es orientativo; el definitivo se reserva al guardar
+            self.allocate_receipt_number()
         super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
 
     def edit(self):
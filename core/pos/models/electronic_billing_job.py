@@ -0,0 +1,301 @@
+import random
+from datetime import timedelta
+from functools import partial
+
+from django.db import models, transaction
+from django.db.models import Q
+from django.forms import model_to_dict
+from django.utils import timezone
+
+from config import settings
+from core.pos.choices import BILLING_JOB_STATUS, ENVIRONMENT_TYPE, VOUCHER_STAGE, VOUCHER_TYPE
+from core.pos.utilities.sri import SRI
+from core.pos.utilities.stage_metrics import stage_metrics
+
+# Límites (segundos) del histograma de tiempo entre la recepción y la autorización del SRI
+AUTHORIZATION_LATENCY_BUCKETS = (1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class ElectronicBillingJob(models.Model):
+    company = models.ForeignKey('pos.Company', on_delete=models.CASCADE, verbose_name='Compañía')
+    invoice = models.ForeignKey('pos.Invoice', null=True, blank=True, on_delete=models.CASCADE, verbose_name='Factura')
+    credit_note = models.ForeignKey('pos.CreditNote', null=True, blank=True, on_delete=models.CASCADE, verbose_name='Nota de crédito')
+    stage = models.CharField(max_length=20, choices=VOUCHER_STAGE, default=VOUCHER_STAGE[0][0], verbose_name='Etapa')
+    status = models.CharField(max_length=20, choices=BILLING_JOB_STATUS, default=BILLING_JOB_STATUS[0][0], verbose_name='Estado')
+    send_email = models.BooleanField(default=True, verbose_name='Enviar por email')
+    offline = models.BooleanField(default=False, verbose_name='Emitido sin conexión')
+    xml = models.TextField(null=True, blank=True, verbose_name='XML de la última etapa')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Intentos en la etapa')
+    polls = models.PositiveIntegerField(default=0, verbose_name='Consultas de autorización')
+    received_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de recepción en el SRI')
+    unavailable_seconds = models.PositiveIntegerField(default=0, verbose_name='Segundos de espera con el SRI sin responder')
+    authorized_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de autorización')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Próximo intento')
+    locked_by = models.CharField(max_length=100, null=True, blank=True, verbose_name='Procesado por')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de bloqueo')
+    last_error = models.JSONField(default=dict, verbose_name='Último error')
+    time_joined = models.DateTimeField(default=timezone.now, verbose_name='Fecha y hora de registro')
+    time_updated = models.DateTimeField(auto_now=True, verbose_name='Última actualización')
+
+    def __str__(self):
+        return f'{self.get_voucher()} - {self.get_stage_display()}'
+
+    @classmethod
+    def enqueue(cls, voucher, send_email=True, stage=VOUCHER_STAGE[0][0], xml=None, offline=False):
+        field = 'credit_note' if voucher.voucher_type_code == VOUCHER_TYPE[1][0] else 'invoice'
+        # Un comprobante diferido varias veces (p. ej. con el SRI caído) conserva un único trabajo pendiente
+        job = cls.objects.filter(**{field: voucher}, status__in=[BILLING_JOB_STATUS[0][0], BILLING_JOB_STATUS[1][0]]).first()
+        if job is not None:
+            if offline and not job.offline:
+                job.mark_offline(voucher)
+                job.save()
+            return job
+        job = cls(company_id=voucher.company_id, send_email=send_email, stage=stage, xml=xml)
+        if offline:
+            job.mark_offline(voucher)
+        if stage == VOUCHER_STAGE[3][0]:
+            # Comprobante ya recibido por el SRI que solo espera su autorización
+            job.received_at = timezone.now()
+        if voucher.voucher_type_code == VOUCHER_TYPE[1][0]:
+            job.credit_note = voucher
+        else:
+            job.invoice = voucher
+        job.save()
+        return job
+
+    @classmethod
+    def get_available_filter(cls):
+        now = timezone.now()
+        # Un trabajo en proceso cuyo bloqueo expiró pertenece a un worker caído y se retoma desde su etapa actual
+        expired = now - timedelta(seconds=settings.ELECTRONIC_BILLING_LOCK_TIMEOUT)
+        return Q(status=BILLING_JOB_STATUS[0][0], next_attempt_at__lte=now) | Q(status=BILLING_JOB_STATUS[1][0], locked_at__lt=expired)
+
+    @classmethod
+    def claim(cls, worker, limit=10, queryset=None):
+        queryset = cls.objects.all() if queryset is None else queryset
+        claimed = []
+        with transaction.atomic():
+            available = queryset.filter(cls.get_available_filter())
+            ids = list(available.select_for_update(skip_locked=True).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit])
+            for pk in ids:
+                # La actualización condicionada evita que dos workers tomen el mismo trabajo en motores sin SELECT ... FOR UPDATE
+                if cls.objects.filter(cls.get_available_filter(), pk=pk).update(status=BILLING_JOB_STATUS[1][0], locked_by=worker, locked_at=timezone.now()):
+                    claimed.append(pk)
+        return list(cls.objects.filter(id__in=claimed).select_related('company', 'invoice', 'credit_note').order_by('next_attempt_at', 'id'))
+
+    @classmethod
+    def get_authorization_metrics(cls, since=None):
+        """Consultas realizadas, histograma de latencia hasta la autorización y backlog pendiente por ambiente,
+        calculados en la base de datos sobre los comprobantes de los últimos METRICS_WINDOW segundos."""
+        since = since or timezone.now() - timedelta(seconds=settings.METRICS_WINDOW)
+        pending = cls.objects.filter(stage=VOUCHER_STAGE[3][0], status__in=[BILLING_JOB_STATUS[0][0], BILLING_JOB_STATUS[1][0]])
+        backlog = {name: 0 for _, name in ENVIRONMENT_TYPE}
+        for item in pending.order_by().values('company__environment_type').annotate(count=models.Count('id')):
+            backlog[dict(ENVIRONMENT_TYPE).get(item['company__environment_type'], item['company__environment_type'])] = item['count']
+        latency = models.ExpressionWrapper(models.F('authorized_at') - models.F('received_at'), output_field=models.DurationField())
+        buckets = {f'le_{index}': models.Count('id', filter=Q(latency__lte=timedelta(seconds=bucket))) for index, bucket in enumerate(AUTHORIZATION_LATENCY_BUCKETS)}
+        authorized = cls.objects.filter(authorized_at__gte=since, received_at__isnull=False).annotate(latency=latency).aggregate(count=models.Count('id'), sum=models.Sum('latency'), **buckets)
+        histogram = {bucket: authorized[f'le_{index}'] for index, bucket in enumerate(AUTHORIZATION_LATENCY_BUCKETS)}
+        histogram['+Inf'] = authorized['count']
+        totals = cls.objects.filter(time_updated__gte=since, polls__gt=0).aggregate(polls=models.Sum('polls'), documents=models.Count('id'))
+        return {
+            'polls': totals['polls'] or 0,
+            'polled_documents': totals['documents'],
+            'authorized': authorized['count'],
+            'latency_sum': authorized['sum'].total_seconds() if authorized['sum'] else 0,
+            'latency_histogram': histogram,
+            'backlog': backlog,
+            'oldest_pending': pending.filter(received_at__isnull=False).aggregate(value=models.Min('received_at'))['value'],
+        }
+
+    @classmethod
+    def get_offline_metrics(cls, since=None):
+        """Backlog de comprobantes emitidos sin conexión y avance de su envío al SRI."""
+        now = timezone.now()
+        queryset = cls.objects.filter(offline=True)
+        backlog = queryset.filter(status__in=[BILLING_JOB_STATUS[0][0], BILLING_JOB_STATUS[1][0]])
+        # La contingencia en curso empieza con el comprobante pendiente más antiguo; sin backlog se muestran las últimas 24 horas
+        oldest = backlog.aggregate(value=models.Min('time_joined'))['value']
+        since = since or oldest or now - timedelta(days=1)
+        episode = queryset.filter(time_joined__gte=since)
+        counts = {name: 0 for name, _ in BILLING_JOB_STATUS}
+        for item in episode.values('status').annotate(count=models.Count('id')):
+            counts[item['status']] = item['count']
+        waiting = backlog.filter(stage__in=[VOUCHER_STAGE[0][0], VOUCHER_STAGE[1][0], VOUCHER_STAGE[2][0]]).count()
+        total = sum(counts.values())
+        drained = total - waiting
+        # Ritmo de envío de los últimos 5 minutos para estimar cuánto falta
+        window = 300
+        received = queryset.filter(received_at__gte=now - timedelta(seconds=window)).count()
+        rate = received / window
+        return {
+            'backlog': waiting,
+            'authorizing': backlog.count() - waiting,
+            'done': counts[BILLING_JOB_STATUS[2][0]],
+            'failed': counts[BILLING_JOB_STATUS[3][0]],
+            'total': total,
+            'drained': drained,
+            'percent': round(drained * 100 / total) if total else 100,
+            'since': since,
+            'oldest_pending': oldest,
+            'rate': rate,
+            'eta': round(waiting / rate) if rate and waiting else None,
+        }
+
+    @property
+    def is_finished(self):
+        return self.status in [BILLING_JOB_STATUS[2][0], BILLING_JOB_STATUS[3][0]]
+
+    def get_voucher(self):
+        return self.invoice if self.invoice_id else self.credit_note
+
+    def get_retry_delay(self):
+        return min(settings.ELECTRONIC_BILLING_RETRY_DELAY * 2 ** max(self.attempts - 1, 0), settings.ELECTRONIC_BILLING_MAX_RETRY_DELAY)
+
+    def get_poll_delay(self):
+        # Backoff exponencial con jitter para no consultar al SRI en ráfagas sincronizadas
+        delay = min(settings.ELECTRONIC_BILLING_POLL_DELAY * 2 ** max(self.polls - 1, 0), settings.ELECTRONIC_BILLING_POLL_MAX_DELAY)
+        return random.uniform(delay / 2, delay)
+
+    def schedule_poll(self):
+        # El tiempo que el SRI estuvo sin responder no cuenta para abandonar la consulta
+        if self.received_at and timezone.now() - self.received_at > timedelta(seconds=settings.ELECTRONIC_BILLING_POLL_TIMEOUT + self.unavailable_seconds):
+            self.last_error = {'stage': self.stage, 'error': f'El SRI no autorizó el comprobante después de {self.polls} consultas'}
+            self.finish(BILLING_JOB_STATUS[3][0])
+            return
+        self.finish(BILLING_JOB_STATUS[0][0])
+        self.next_attempt_at = timezone.now() + timedelta(seconds=self.get_poll_delay())
+
+    def is_already_received(self, response):
+        # Tras una caída entre el envío y el guardado de la etapa el SRI ya tiene la clave de acceso;
+        # el comprobante se da por recibido y se continúa con la autorización.
+        if isinstance(response.get('error'), dict):
+            for error in response['error'].get('errors', []):
+                if error.get('mensaje') == 'CLAVE ACCESO REGISTRADA':
+                    return True
+        return False
+
+    def is_permanent_error(self, response):
+        # Los rechazos del SRI (DEVUELTA / NO AUTORIZADO) llegan como diccionario y no se resuelven reintentando
+        return isinstance(response.get('error'), dict)
+
+    def mark_offline(self, voucher=None):
+        # Emisión en contingencia: la venta sigue registrada y el comprobante firmado espera a que el SRI responda
+        self.offline = True
+        (voucher or self.get_voucher()).set_offline_pending()
+
+    def defer(self):
+        # El SRI está caído o no responde: se espera a la prueba de recuperación sin consumir intentos
+        self.finish(BILLING_JOB_STATUS[0][0])
+        self.next_attempt_at = timezone.now() + timedelta(seconds=settings.SRI_BREAKER_RESET_TIMEOUT)
+        if self.stage == VOUCHER_STAGE[3][0]:
+            self.unavailable_seconds += settings.SRI_BREAKER_RESET_TIMEOUT
+        if self.stage == VOUCHER_STAGE[2][0] and not self.offline:
+            self.mark_offline()
+
+    def move_to(self, stage):
+        self.stage = stage
+        self.attempts = 0
+        self.last_error = {}
+        self.locked_at = timezone.now()
+
+    def finish(self, status):
+        self.status = status
+        self.locked_by = None
+        self.locked_at = None
+        if status == BILLING_JOB_STATUS[3][0] and self.offline:
+            # Un comprobante de contingencia que el SRI no autorizó vuelve a quedar sin autorizar para corregirlo
+            self.get_voucher().set_offline_pending(offline=False)
+
+    def run_stage(self, sri, voucher):
+        # Cada llamada queda registrada en VoucherStageMetric con la etapa en la que empezó
+        measure = partial(stage_metrics.measure, voucher, self.stage)
+        if self.stage == VOUCHER_STAGE[0][0]:
+            response = measure(sri.create_xml, instance=voucher)
+            if response['resp']:
+                self.xml = response['xml'].decode('utf-8')
+                self.move_to(VOUCHER_STAGE[1][0])
+        elif self.stage == VOUCHER_STAGE[1][0]:
+            response = measure(sri.firm_xml, instance=voucher, xml=self.xml)
+            if response['resp']:
+                self.xml = response['xml']
+                self.move_to(VOUCHER_STAGE[2][0])
+        elif self.stage == VOUCHER_STAGE[2][0]:
+            response = measure(sri.validate_xml, instance=voucher, xml=self.xml)
+            if response['resp'] or self.is_already_received(response):
+                response['resp'] = True
+                self.received_at = timezone.now()
+                self.move_to(VOUCHER_STAGE[3][0])
+        elif self.stage == VOUCHER_STAGE[3][0]:
+            response = measure(sri.authorize_xml, instance=voucher)
+            if sri.is_unavailable(response):
+                # Sin consultar al SRI no se cuenta la consulta; process() lo pospone con defer()
+                return response
+            self.polls += 1
+            if response.get('pending'):
+                response['resp'] = True
+                self.schedule_poll()
+            elif response['resp']:
+                self.xml = None
+                self.authorized_at = timezone.now()
+                if self.send_email:
+                    self.move_to(VOUCHER_STAGE[4][0])
+                else:
+                    self.finish(BILLING_JOB_STATUS[2][0])
+        else:
+            response = measure(sri.send_receipt_by_email, instance=voucher)
+            if response['resp']:
+                self.finish(BILLING_JOB_STATUS[2][0])
+        return response
+
+    def register_failure(self, response):
+        self.attempts += 1
+        self.last_error = {'stage': self.stage, 'error': response.get('error', '')}
+        if self.is_permanent_error(response) or self.attempts >= settings.ELECTRONIC_BILLING_MAX_ATTEMPTS:
+            self.finish(BILLING_JOB_STATUS[3][0])
+        else:
+            self.finish(BILLING_JOB_STATUS[0][0])
+            self.next_attempt_at = timezone.now() + timedelta(seconds=self.get_retry_delay())
+
+    def process(self, sri=None):
+        sri = sri or SRI()
+        voucher = self.get_voucher()
+        while self.status == BILLING_JOB_STATUS[1][0]:
+            try:
+                response = self.run_stage(sri=sri, voucher=voucher)
+            except Exception as e:
+                response = {'resp': False, 'stage': self.stage, 'error': str(e)}
+            if sri.is_unavailable(response) and self.status == BILLING_JOB_STATUS[1][0]:
+                self.defer()
+            elif not response['resp']:
+                self.register_failure(response)
+            self.save()
+        return self
+
+    def as_dict(self):
+        item = model_to_dict(self, exclude=['xml', 'company'])
+        voucher = self.get_voucher()
+        item['stage'] = {'id': self.stage, 'name': self.get_stage_display()}
+        item['status'] = {'id': self.status, 'name': self.get_status_display()}
+        item['voucher'] = {'id': voucher.id, 'receipt_number_full': voucher.receipt_number_full, 'status': {'id': voucher.status, 'name': voucher.get_status_display()}, 'authorized_pdf': voucher.get_authorized_pdf()}
+        item['is_finished'] = self.is_finished
+        item['next_attempt_at'] = timezone.localtime(self.next_attempt_at).strftime('%Y-%m-%d %H:%M:%S')
+        item['locked_at'] = timezone.localtime(self.locked_at).strftime('%Y-%m-%d %H:%M:%S') if self.locked_at else ''
+        item['received_at'] = timezone.localtime(self.received_at).strftime('%Y-%m-%d %H:%M:%S') if self.received_at else ''
+        item['authorized_at'] = timezone.localtime(self.authorized_at).strftime('%Y-%m-%d %H:%M:%S') if self.authorized_at else ''
+        item['time_joined'] = timezone.localtime(self.time_joined).strftime('%Y-%m-%d %H:%M:%S')
+        return item
+
+    class Meta:
+        verbose_name = 'Trabajo de Facturación Electrónica'
+        verbose_name_plural = 'Trabajos de Facturación Electrónica'
+        default_permissions = ()
+        permissions = (
+            ('view_electronic_billing_job', 'Can view Trabajo de Facturación Electrónica'),
+        )
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['offline', 'status']),
+            models.Index(fields=['authorized_at']),
+        ]
+        ordering = ['id']
@@ -1,5 +1,4 @@
 from datetime import datetime
-from xml.etree import ElementTree
 
 from django.db import models
 from django.db.models import FloatField, Sum
@@ -8,12 +7,13 @@ from django.db.models.functions import Coalesce
 from core.pos.choices import (
     INVOICE_PAYMENT_METHOD,
     PAYMENT_TYPE,
-    RETENTION_AGENT,
-    TAX_CODES,
+    STOCK_MOVEMENT_TYPE,
 )
 from core.pos.models.elec_billing_base import ElecBillingBase
-from core.pos.utilities.pdf_creator import PDFCreator
+from core.pos.models.stock_movement import StockMovement
+from core.pos.utilities.pdf_cache import pdf_cache
 from core.pos.utilities.sri import SRI
+from core.pos.utilities.xml_builder import element, optional_element, xml_builder
 
 
 class Invoice(ElecBillingBase):
@@ -27,6 +27,8 @@ class Invoice(ElecBillingBase):
     change = models.DecimalField(max_digits=9, decimal_places=2, default=0.00, verbose_name='Cambio')
     is_draft_invoice = models.BooleanField(default=False, verbose_name='Factura borrador')
 
+    detail_set_name = 'invoicedetail_set'
+
     def __str__(self):
         return self.get_full_name()
 
@@ -37,111 +39,58 @@ class Invoice(ElecBillingBase):
     def get_full_name(self):
         return f'{self.receipt_number_full} / {self.customer.get_full_name()})'
 
-    def calculate_detail(self):
-        for detail in self.invoicedetail_set.filter():
-            detail.price = float(detail.price)
-            detail.tax = float(self.tax)
-            detail.price_with_tax = detail.price + (detail.price * detail.tax)
-            detail.subtotal = detail.price * detail.quantity
-            detail.total_discount = detail.subtotal * float(detail.discount)
-            detail.total_tax = (detail.subtotal - detail.total_discount) * detail.tax
-            detail.total_amount = detail.subtotal - detail.total_discount
-            detail.save()
-
-    def calculate_invoice(self):
-        self.subtotal_without_tax = float(self.invoicedetail_set.filter(product__has_tax=False).aggregate(result=Coalesce(Sum('total_amount'), 0.00, output_field=FloatField()))['result'])
-        self.subtotal_with_tax = float(self.invoicedetail_set.filter(product__has_tax=True).aggregate(result=Coalesce(Sum('total_amount'), 0.00, output_field=FloatField()))['result'])
-        self.total_tax = round(self.invoicedetail_set.filter(product__has_tax=True).aggregate(result=Coalesce(Sum('total_tax'), 0.00, output_field=FloatField()))['result'], 2)
-        self.total_discount = float(self.invoicedetail_set.filter().aggregate(result=Coalesce(Sum('total_discount'), 0.00, output_field=FloatField()))['result'])
-        self.total_amount = round(self.subtotal, 2) + float(self.total_tax)
-        self.save()
-
-    def recalculate_invoice(self):
-        self.calculate_detail()
-        self.calculate_invoice()
+    def deduct_product_stock(self, details):
+        if (not self.is_draft_invoice and self.create_electronic_invoice) or self.receipt.is_ticket:
+            StockMovement.register([
+                StockMovement(
+                    company_id=self.company_id, product=detail.product, movement_type=STOCK_MOVEMENT_TYPE[1][0], quantity=-detail.quantity,
+                    invoice=self, user_id=self.employee_id, description=self.receipt_number_full,
+                )
+                for detail in details if detail.product.is_inventoried
+            ], check_stock=True)
 
     def create_xml_document(self):
         access_key = SRI().create_access_key(self)
-        root = ElementTree.Element('factura', id='comprobante', version='1.0.0')
-        xml_tax_info = ElementTree.SubElement(root, 'infoTributaria')
-        ElementTree.SubElement(xml_tax_info, 'ambiente').text = str(self.company.environment_type)
-        ElementTree.SubElement(xml_tax_info, 'tipoEmision').text = str(self.company.emission_type)
-        ElementTree.SubElement(xml_tax_info, 'razonSocial').text = self.company.company_name
-        ElementTree.SubElement(xml_tax_info, 'nombreComercial').text = self.company.commercial_name
-        ElementTree.SubElement(xml_tax_info, 'ruc').text = self.company.ruc
-        ElementTree.SubElement(xml_tax_info, 'claveAcceso').text = access_key
-        ElementTree.SubElement(xml_tax_info, 'codDoc').text = self.receipt.voucher_type
-        ElementTree.SubElement(xml_tax_info, 'estab').text = self.receipt.establishment_code
-        ElementTree.SubElement(xml_tax_info, 'ptoEmi').text = self.receipt.issuing_point_code
-        ElementTree.SubElement(xml_tax_info, 'secuencial').text = self.receipt_number
-        ElementTree.SubElement(xml_tax_info, 'dirMatriz').text = self.company.main_address
-        if not self.company.is_popular_regime:
-            ElementTree.SubElement(xml_tax_info, 'contribuyenteRimpe').text = self.company.regimen_rimpe
-        if self.company.retention_agent == RETENTION_AGENT[0][0]:
-            ElementTree.SubElement(xml_tax_info, 'agenteRetencion').text = '1'
-
-        xml_info_invoice = ElementTree.SubElement(root, 'infoFactura')
-        ElementTree.SubElement(xml_info_invoice, 'fechaEmision').text = datetime.now().strftime('%d/%m/%Y')
-        ElementTree.SubElement(xml_info_invoice, 'dirEstablecimiento').text = self.company.establishment_address
-        ElementTree.SubElement(xml_info_invoice, 'obligadoContabilidad').text = self.company.obligated_accounting
-        ElementTree.SubElement(xml_info_invoice, 'tipoIdentificacionComprador').text = self.customer.identification_type
-        ElementTree.SubElement(xml_info_invoice, 'razonSocialComprador').text = self.customer.user.names
-        ElementTree.SubElement(xml_info_invoice, 'identificacionComprador').text = self.customer.dni
-        ElementTree.SubElement(xml_info_invoice, 'direccionComprador').text = self.customer.address
-        ElementTree.SubElement(xml_info_invoice, 'totalSinImpuestos').text = f'{self.subtotal:.2f}'
-        ElementTree.SubElement(xml_info_invoice, 'totalDescuento').text = f'{self.total_discount:.2f}'
-
-        xml_total_with_taxes = ElementTree.SubElement(xml_info_invoice, 'totalConImpuestos')
-        if self.subtotal_without_tax != 0.0000:
-            subtotal_without_tax = ElementTree.SubElement(xml_total_with_taxes, 'totalImpuesto')
-            ElementTree.SubElement(subtotal_without_tax, 'codigo').text = str(TAX_CODES[0][0])
-            ElementTree.SubElement(subtotal_without_tax, 'codigoPorcentaje').text = '0'
-            ElementTree.SubElement(subtotal_without_tax, 'baseImponible').text = f'{self.subtotal_without_tax:.2f}'
-            ElementTree.SubElement(subtotal_without_tax, 'valor').text = '0.00'
-        if self.subtotal_with_tax != 0.0000:
-            subtotal_with_tax = ElementTree.SubElement(xml_total_with_taxes, 'totalImpuesto')
-            ElementTree.SubElement(subtotal_with_tax, 'codigo').text = str(TAX_CODES[0][0])
-            ElementTree.SubElement(subtotal_with_tax, 'codigoPorcentaje').text = str(self.company.tax_percentage)
-            ElementTree.SubElement(subtotal_with_tax, 'baseImponible').text = f'{self.subtotal_with_tax:.2f}'
-            ElementTree.SubElement(subtotal_with_tax, 'valor').text = f'{self.total_tax:.2f}'
-        ElementTree.SubElement(xml_info_invoice, 'propina').text = '0.00'
-        ElementTree.SubElement(xml_info_invoice, 'importeTotal').text = f'{self.total_amount:.2f}'
-        ElementTree.SubElement(xml_info_invoice, 'moneda').text = 'DOLAR'
-
-        xml_payments = ElementTree.SubElement(xml_info_invoice, 'pagos')
-        xml_payment = ElementTree.SubElement(xml_payments, 'pago')
-        ElementTree.SubElement(xml_payment, 'formaPago').text = self.payment_method
-        ElementTree.SubElement(xml_payment, 'total').text = f'{self.total_amount:.2f}'
-        ElementTree.SubElement(xml_payment, 'plazo').text = str(self.time_limit)
-        ElementTree.SubElement(xml_payment, 'unidadTiempo').text = 'dias'
-
-        xml_details = ElementTree.SubElement(root, 'detalles')
-        for detail in self.invoicedetail_set.all():
-            xml_detail = ElementTree.SubElement(xml_details, 'detalle')
-            ElementTree.SubElement(xml_detail, 'codigoPrincipal').text = detail.product.code
-            ElementTree.SubElement(xml_detail, 'descripcion').text = detail.product.name
-            ElementTree.SubElement(xml_detail, 'cantidad').text = f'{detail.quantity:.2f}'
-            ElementTree.SubElement(xml_detail, 'precioUnitario').text = f'{detail.price:.2f}'
-            ElementTree.SubElement(xml_detail, 'descuento').text = f'{detail.total_discount:.2f}'
-            ElementTree.SubElement(xml_detail, 'precioTotalSinImpuesto').text = f'{detail.total_amount:.2f}'
-            xml_taxes = ElementTree.SubElement(xml_detail, 'impuestos')
-            xml_tax = ElementTree.SubElement(xml_taxes, 'impuesto')
-            ElementTree.SubElement(xml_tax, 'codigo').text = str(TAX_CODES[0][0])
-            if detail.product.has_tax:
-                ElementTree.SubElement(xml_tax, 'codigoPorcentaje').text = str(self.company.tax_percentage)
-                ElementTree.SubElement(xml_tax, 'tarifa').text = f'{detail.tax_rate:.2f}'
-                ElementTree.SubElement(xml_tax, 'baseImponible').text = f'{detail.total_amount:.2f}'
-                ElementTree.SubElement(xml_tax, 'valor').text = f'{detail.total_tax:.2f}'
-            else:
-                ElementTree.SubElement(xml_tax, 'codigoPorcentaje').text = '0'
-                ElementTree.SubElement(xml_tax, 'tarifa').text = '0'
-                ElementTree.SubElement(xml_tax, 'baseImponible').text = f'{detail.total_amount:.2f}'
-                ElementTree.SubElement(xml_tax, 'valor').text = '0'
-        return ElementTree.tostring(root, xml_declaration=True, encoding='utf-8').decode('utf-8').replace("'", '"'), access_key
+        fragments = xml_builder.get_company_fragments(self.company)
+        customer = self.customer
+        details = self.invoicedetail_set.select_related('product').order_by('id')
+        parts = [
+            xml_builder.render_tax_info(self, access_key, fragments),
+            '<infoFactura>',
+            element('fechaEmision', self.get_issue_date().strftime('%d/%m/%Y')),
+            fragments['establishment_address'],
+            fragments['obligated_accounting'],
+            element('tipoIdentificacionComprador', customer.identification_type),
+            element('razonSocialComprador', customer.user.names),
+            element('identificacionComprador', customer.dni),
+            optional_element('direccionComprador', customer.address),
+            element('totalSinImpuestos', f'{self.subtotal:.2f}'),
+            element('totalDescuento', f'{self.total_discount:.2f}'),
+            xml_builder.render_total_taxes(self, fragments),
+            element('propina', '0.00'),
+            element('importeTotal', f'{self.total_amount:.2f}'),
+            element('moneda', 'DOLAR'),
+            '<pagos><pago>',
+            element('formaPago', self.payment_method),
+            element('total', f'{self.total_amount:.2f}'),
+            element('plazo', self.time_limit),
+            element('unidadTiempo', 'dias'),
+            '</pago></pagos>',
+            '</infoFactura>',
+            xml_builder.render_details(details, fragments, code_tag='codigoPrincipal'),
+        ]
+        return xml_builder.render('factura', '1.0.0', parts), access_key
+
+    def get_pdf_sources(self):
+        user = self.customer.user
+        return [
+            self, self.company, self.receipt, self.customer, (user.names, user.email, user.username),
+            self.invoicedetail_set.order_by('id').values_list(*self.pdf_detail_fields),
+        ]
 
     def create_invoice_pdf(self):
         template_name = 'invoice/invoice_pdf.html'
-        return PDFCreator(template_name=template_name).create(context={'object': self})
+        return pdf_cache.get_content(self, template_name)
 
     def as_dict(self):
         item = super().as_dict()
@@ -9,13 +9,6 @@ class InvoiceDetail(ElecBillingDetailBase):
     def __str__(self):
         return self.product.name
 
-    def deduct_product_stock(self):
-        invoice = self.invoice
-        if (not invoice.is_draft_invoice and invoice.create_electronic_invoice) or invoice.receipt.is_ticket:
-            if self.product.is_inventoried:
-                self.product.stock -= self.quantity
-                self.product.save()
-
     def as_dict(self):
         return super().as_dict()
 
@@ -0,0 +1,187 @@
+import smtplib
+import tempfile
+from datetime import timedelta
+from email.utils import formataddr
+
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models import Q
+from django.forms import model_to_dict
+from django.utils import timezone
+
+from config import settings
+from core.pos.choices import EMAIL_STATUS, INVOICE_STATUS, VOUCHER_TYPE
+from core.pos.utilities.mailer import SMTPConnectionPool, get_credentials, write_message
+
+
+class OutboundEmail(models.Model):
+    company = models.ForeignKey('pos.Company', null=True, blank=True, on_delete=models.CASCADE, verbose_name='Compañía')
+    invoice = models.ForeignKey('pos.Invoice', null=True, blank=True, on_delete=models.CASCADE, verbose_name='Factura')
+    credit_note = models.ForeignKey('pos.CreditNote', null=True, blank=True, on_delete=models.CASCADE, verbose_name='Nota de crédito')
+    mailing = models.ForeignKey('pos.VoucherMailing', null=True, blank=True, on_delete=models.SET_NULL, verbose_name='Reenvío de comprobantes')
+    subject = models.CharField(max_length=255, verbose_name='Asunto')
+    recipients = models.JSONField(default=list, verbose_name='Destinatarios')
+    message = models.TextField(blank=True, verbose_name='Mensaje MIME')
+    message_file = models.FileField(upload_to='email_outbox/%Y/%m/%d', null=True, blank=True, verbose_name='Mensaje MIME con adjuntos')
+    status = models.CharField(max_length=20, choices=EMAIL_STATUS, default=EMAIL_STATUS[0][0], verbose_name='Estado')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Intentos')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Próximo intento')
+    locked_by = models.CharField(max_length=100, null=True, blank=True, verbose_name='Procesado por')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de bloqueo')
+    last_error = models.TextField(null=True, blank=True, verbose_name='Último error')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de envío')
+    time_joined = models.DateTimeField(default=timezone.now, verbose_name='Fecha y hora de registro')
+
+    def __str__(self):
+        return f'{self.subject} - {", ".join(self.recipients)}'
+
+    @classmethod
+    def enqueue(cls, message, recipients, company=None, voucher=None, sender_name=None, attachments=None, mailing=None):
+        """Guarda el mensaje en la bandeja de salida; lo envía `manage.py email_worker` con las credenciales de la compañía.
+
+        Con `attachments` (ver mailer.write_message) el mensaje se escribe en el storage por bloques en lugar de la base de datos.
+        """
+        recipients = [recipient for recipient in recipients if recipient]
+        if not recipients:
+            return None
+        credentials = get_credentials(company)
+        del message['From']
+        message['From'] = formataddr((sender_name or (company.commercial_name if company else 'OptimusPos Facturación'), credentials.username))
+        if 'To' not in message:
+            message['To'] = ', '.join(recipients)
+        email = cls(company=company, mailing=mailing, subject=str(message['Subject'] or ''), recipients=recipients)
+        if voucher is not None:
+            if voucher.voucher_type_code == VOUCHER_TYPE[1][0]:
+                email.credit_note = voucher
+            else:
+                email.invoice = voucher
+        if attachments:
+            with tempfile.TemporaryFile() as file:
+                write_message(message, attachments, file)
+                file.seek(0)
+                email.message_file.save('message.eml', File(file), save=False)
+        else:
+            email.message = message.as_string()
+        email.save()
+        if not settings.EMAIL_OUTBOX_ASYNC:
+            transaction.on_commit(email.send_now)
+        return email
+
+    @classmethod
+    def get_available_filter(cls):
+        now = timezone.now()
+        # Un correo en envío cuyo bloqueo expiró pertenece a un worker caído y se vuelve a intentar
+        expired = now - timedelta(seconds=settings.EMAIL_OUTBOX_LOCK_TIMEOUT)
+        return Q(status=EMAIL_STATUS[0][0], next_attempt_at__lte=now) | Q(status=EMAIL_STATUS[1][0], locked_at__lt=expired)
+
+    @classmethod
+    def claim(cls, worker, limit=50, queryset=None):
+        queryset = cls.objects.all() if queryset is None else queryset
+        claimed = []
+        with transaction.atomic():
+            available = queryset.filter(cls.get_available_filter())
+            ids = list(available.select_for_update(skip_locked=True).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit])
+            for pk in ids:
+                if cls.objects.filter(cls.get_available_filter(), pk=pk).update(status=EMAIL_STATUS[1][0], locked_by=worker, locked_at=timezone.now()):
+                    claimed.append(pk)
+        # Agrupados por compañía para enviar seguidos los mensajes que comparten conexión
+        return list(cls.objects.filter(id__in=claimed).select_related('company').order_by('company_id', 'id'))
+
+    @classmethod
+    def get_metrics(cls, since=None):
+        """Correos por estado, enviados en el periodo y demora promedio entre el registro y el envío de los últimos METRICS_WINDOW segundos"""
+        since = since or timezone.now() - timedelta(seconds=settings.METRICS_WINDOW)
+        queryset = cls.objects.filter(time_joined__gte=since)
+        status = {name: 0 for name, _ in EMAIL_STATUS}
+        for item in queryset.order_by().values('status').annotate(count=models.Count('id')):
+            status[item['status']] = item['count']
+        delay = models.ExpressionWrapper(models.F('sent_at') - models.F('time_joined'), output_field=models.DurationField())
+        delays = queryset.filter(sent_at__isnull=False).annotate(delay=delay).aggregate(sent=models.Count('id'), delay_avg=models.Avg('delay'), delay_max=models.Max('delay'))
+        return {
+            'status': status,
+            'sent': delays['sent'],
+            'delay_avg': delays['delay_avg'].total_seconds() if delays['delay_avg'] else 0,
+            'delay_max': delays['delay_max'].total_seconds() if delays['delay_max'] else 0,
+            'oldest_pending': cls.objects.filter(status=EMAIL_STATUS[0][0]).aggregate(value=models.Min('time_joined'))['value'],
+        }
+
+    @classmethod
+    def get_voucher_filter(cls, voucher):
+        if voucher.voucher_type_code == VOUCHER_TYPE[1][0]:
+            return Q(credit_note=voucher)
+        return Q(invoice=voucher)
+
+    def get_voucher(self):
+        return self.invoice if self.invoice_id else self.credit_note
+
+    def get_retry_delay(self):
+        return min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** max(self.attempts - 1, 0), settings.EMAIL_OUTBOX_MAX_RETRY_DELAY)
+
+    def is_permanent_error(self, error):
+        # Destinatarios rechazados o respuestas 5xx del servidor no se resuelven reintentando; la autenticación sí puede corregirse
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return True
+        return isinstance(error, smtplib.SMTPResponseException) and not isinstance(error, smtplib.SMTPAuthenticationError) and 500 <= error.smtp_code < 600
+
+    def mark_sent(self):
+        self.status = EMAIL_STATUS[2][0]
+        self.sent_at = timezone.now()
+        self.last_error = None
+        self.locked_by = None
+        self.locked_at = None
+        if self.message_file:
+            self.message_file.delete(save=False)
+        voucher = self.get_voucher()
+        if voucher is not None:
+            type(voucher).objects.filter(pk=voucher.pk, status=INVOICE_STATUS[1][0]).update(status=INVOICE_STATUS[2][0])
+
+    def register_failure(self, error):
+        self.attempts += 1
+        self.last_error = str(error)
+        self.locked_by = None
+        self.locked_at = None
+        if self.is_permanent_error(error) or self.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            self.status = EMAIL_STATUS[3][0]
+        else:
+            self.status = EMAIL_STATUS[0][0]
+            self.next_attempt_at = timezone.now() + timedelta(seconds=self.get_retry_delay())
+
+    def process(self, pool):
+        try:
+            if self.message_file:
+                with self.message_file.open('rb') as file:
+                    pool.send(get_credentials(self.company), self.recipients, file)
+            else:
+                pool.send(get_credentials(self.company), self.recipients, self.message)
+            self.mark_sent()
+        except Exception as e:
+            self.register_failure(e)
+        self.save()
+        return self
+
+    def send_now(self):
+        # Sin worker (EMAIL_OUTBOX_ASYNC=False) el correo se envía al confirmar la transacción, con una conexión propia
+        if self.__class__.objects.filter(pk=self.pk, status=EMAIL_STATUS[0][0]).update(status=EMAIL_STATUS[1][0], locked_by='web', locked_at=timezone.now()):
+            with SMTPConnectionPool() as pool:
+                self.process(pool)
+
+    def as_dict(self):
+        item = model_to_dict(self, exclude=['message', 'message_file', 'company', 'mailing'])
+        item['status'] = {'id': self.status, 'name': self.get_status_display()}
+        item['next_attempt_at'] = timezone.localtime(self.next_attempt_at).strftime('%Y-%m-%d %H:%M:%S')
+        item['sent_at'] = timezone.localtime(self.sent_at).strftime('%Y-%m-%d %H:%M:%S') if self.sent_at else ''
+        item['time_joined'] = timezone.localtime(self.time_joined).strftime('%Y-%m-%d %H:%M:%S')
+        return item
+
+    class Meta:
+        verbose_name = 'Correo de Salida'
+        verbose_name_plural = 'Correos de Salida'
+        default_permissions = ()
+        permissions = (
+            ('view_outbound_email', 'Can view Correo de Salida'),
+        )
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['time_joined']),
+        ]
+        ordering = ['id']
@@ -1,13 +1,9 @@
-from io import BytesIO
-
-import barcode
-from barcode import writer
-from django.core.files.base import ContentFile
 from django.db import models
 from django.db.models import UniqueConstraint
 from django.forms import model_to_dict
 
 from config import settings
+from core.pos.utilities.product_barcode import product_barcodes
 
 
 class Product(models.Model):
@@ -49,22 +45,14 @@ class Product(models.Model):
         return f'{settings.STATIC_URL}img/default/empty.png'
 
     def get_barcode(self):
-        if self.barcode:
-            return f'{settings.MEDIA_URL}{self.barcode}'
+        name = product_barcodes.get(self)
+        if name:
+            return f'{settings.MEDIA_URL}{name}'
         return f'{settings.STATIC_URL}img/default/empty.png'
 
     def get_benefit(self):
         return round(float(self.pvp) - float(self.price), 2)
 
-    def generate_barcode(self):
-        try:
-            image_io = BytesIO()
-            barcode.Gs1_128(self.code, writer=barcode.writer.ImageWriter()).write(image_io)
-            filename = f'{self.code}.png'
-            self.barcode.save(filename, content=ContentFile(image_io.getvalue()), save=False)
-        except Exception:  # pragma: no cover - fallback silencioso
-            pass
-
     def as_dict(self):
         item = model_to_dict(self)
         item['value'] = self.get_full_name()
@@ -79,10 +67,6 @@ class Product(models.Model):
         item['barcode'] = self.get_barcode()
         return item
 
-    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        self.generate_barcode()
-        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
-
     class Meta:
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
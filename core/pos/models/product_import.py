@@ -0,0 +1,114 @@
+import os
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Q
+from django.forms import model_to_dict
+from django.utils import timezone
+
+from config import settings
+from core.pos.choices import BILLING_JOB_STATUS
+from core.pos.utilities.product_import import product_importer
+
+
+class ProductImport(models.Model):
+    company = models.ForeignKey('pos.Company', on_delete=models.CASCADE, verbose_name='Compañía')
+    user = models.ForeignKey('user.User', null=True, blank=True, on_delete=models.SET_NULL, verbose_name='Usuario')
+    archive = models.FileField(upload_to='product_import/%Y/%m/%d', verbose_name='Archivo')
+    status = models.CharField(max_length=20, choices=BILLING_JOB_STATUS, default=BILLING_JOB_STATUS[0][0], verbose_name='Estado')
+    total = models.PositiveIntegerField(default=0, verbose_name='Filas válidas')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Filas procesadas')
+    created = models.PositiveIntegerField(default=0, verbose_name='Productos creados')
+    updated = models.PositiveIntegerField(default=0, verbose_name='Productos actualizados')
+    errors = models.JSONField(default=list, blank=True, verbose_name='Filas con errores')
+    locked_by = models.CharField(max_length=100, null=True, blank=True, verbose_name='Procesado por')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de bloqueo')
+    last_error = models.TextField(null=True, blank=True, verbose_name='Último error')
+    time_joined = models.DateTimeField(default=timezone.now, verbose_name='Fecha y hora de registro')
+    time_updated = models.DateTimeField(auto_now=True, verbose_name='Última actualización')
+
+    def __str__(self):
+        return self.get_filename()
+
+    @classmethod
+    def enqueue(cls, archive, company, user=None):
+        """Guarda el excel y registra la importación; la procesa `manage.py product_import_worker` en segundo plano"""
+        product_import = cls.objects.create(company=company, user=user, archive=archive)
+        if not settings.PRODUCT_IMPORT_ASYNC:
+            transaction.on_commit(product_import.process_now)
+        return product_import
+
+    @classmethod
+    def get_available_filter(cls):
+        # Una importación en proceso cuyo bloqueo expiró pertenece a un worker caído y se procesa de nuevo
+        expired = timezone.now() - timedelta(seconds=settings.PRODUCT_IMPORT_LOCK_TIMEOUT)
+        return Q(status=BILLING_JOB_STATUS[0][0]) | Q(status=BILLING_JOB_STATUS[1][0], locked_at__lt=expired)
+
+    @classmethod
+    def claim(cls, worker, limit=1):
+        claimed = []
+        with transaction.atomic():
+            ids = list(cls.objects.filter(cls.get_available_filter()).select_for_update(skip_locked=True).order_by('id').values_list('id', flat=True)[:limit])
+            for pk in ids:
+                if cls.objects.filter(cls.get_available_filter(), pk=pk).update(status=BILLING_JOB_STATUS[1][0], locked_by=worker, locked_at=timezone.now(), processed=0):
+                    claimed.append(pk)
+        return list(cls.objects.filter(id__in=claimed).select_related('company', 'user').order_by('id'))
+
+    @property
+    def is_finished(self):
+        return self.status in [BILLING_JOB_STATUS[2][0], BILLING_JOB_STATUS[3][0]]
+
+    def get_filename(self):
+        return os.path.basename(self.archive.name)
+
+    def update_progress(self, result):
+        # Los bloques ya importados quedan guardados aunque la importación falle después
+        for field in ['total', 'processed', 'created', 'updated', 'errors']:
+            setattr(self, field, result[field])
+        type(self).objects.filter(pk=self.pk).update(total=self.total, processed=self.processed, created=self.created, updated=self.updated, errors=self.errors)
+
+    def process(self):
+        try:
+            with self.archive.open('rb') as file:
+                product_importer.run(self.company, file, progress=self.update_progress, user=self.user, description=self.get_filename()[:150])
+            self.status = BILLING_JOB_STATUS[2][0]
+            self.last_error = None
+        except Exception as e:
+            self.status = BILLING_JOB_STATUS[3][0]
+            self.last_error = str(e)
+        self.locked_by = None
+        self.locked_at = None
+        self.save()
+        return self
+
+    def process_now(self):
+        # Sin worker (PRODUCT_IMPORT_ASYNC=False) el archivo se importa al confirmar la transacción
+        if type(self).objects.filter(pk=self.pk, status=BILLING_JOB_STATUS[0][0]).update(status=BILLING_JOB_STATUS[1][0], locked_by='web', locked_at=timezone.now()):
+            self.process()
+
+    def get_progress(self):
+        return {
+            'total': self.total,
+            'processed': self.processed,
+            'percent': round(self.processed * 100 / self.total) if self.total else (100 if self.is_finished else 0),
+            'finished': self.is_finished,
+        }
+
+    def as_dict(self):
+        item = model_to_dict(self, exclude=['company', 'user', 'archive'])
+        item['archive'] = self.get_filename()
+        item['status'] = {'id': self.status, 'name': self.get_status_display()}
+        item['progress'] = self.get_progress()
+        item['locked_at'] = timezone.localtime(self.locked_at).strftime('%Y-%m-%d %H:%M:%S') if self.locked_at else ''
+        item['time_joined'] = timezone.localtime(self.time_joined).strftime('%Y-%m-%d %H:%M:%S')
+        item['time_updated'] = timezone.localtime(self.time_updated).strftime('%Y-%m-%d %H:%M:%S')
+        return item
+
+    class Meta:
+        verbose_name = 'Importación de Productos'
+        verbose_name_plural = 'Importaciones de Productos'
+        default_permissions = ()
+        permissions = (
+            ('view_product_import', 'Can view Importación de Productos'),
+        )
+        ordering = ['-id']
@@ -5,7 +5,8 @@ from django.db.models import FloatField, Sum
 from django.db.models.functions import Coalesce
 from django.forms import model_to_dict
 
-from core.pos.choices import PAYMENT_TYPE
+from core.pos.choices import PAYMENT_TYPE, STOCK_MOVEMENT_TYPE
+from core.pos.models.stock_movement import StockMovement
 
 
 class Purchase(models.Model):
@@ -40,9 +41,13 @@ class Purchase(models.Model):
 
     def delete(self, using=None, keep_parents=False):
         try:
-            for detail in self.purchasedetail_set.all():
-                detail.product.stock -= detail.quantity
-                detail.product.save()
+            StockMovement.register([
+                StockMovement(
+                    company_id=self.company_id, product=detail.product, movement_type=STOCK_MOVEMENT_TYPE[4][0], quantity=-detail.quantity,
+                    purchase=self, description=self.number,
+                )
+                for detail in self.purchasedetail_set.select_related('product')
+            ])
         except Exception:
             pass
         super().delete(using=using, keep_parents=keep_parents)
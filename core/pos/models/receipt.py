@@ -1,6 +1,7 @@
 import unicodedata
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.forms import model_to_dict
 
 from core.pos.choices import VOUCHER_TYPE
@@ -30,6 +31,14 @@ class Receipt(models.Model):
     def remove_accents(self, text):
         return ''.join((c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn'))
 
+    def allocate_sequence(self, count=1):
+        """Reserva de forma atómica count secuenciales consecutivos y devuelve el primero"""
+        with transaction.atomic():
+            # El UPDATE bloquea la fila hasta el final de la transacción: dos cajas no pueden leer el mismo valor
+            Receipt.objects.filter(pk=self.pk).update(sequence=F('sequence') + count)
+            self.sequence = Receipt.objects.values_list('sequence', flat=True).get(pk=self.pk)
+        return self.sequence - count + 1
+
     def get_sequence(self):
         return f'{self.sequence:09d}'
 
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.db import models
+from django.db.models import F
+from django.forms import model_to_dict
+from django.utils import timezone
+
+from config import settings
+from core.pos.choices import CIRCUIT_STATE, ENVIRONMENT_TYPE, SRI_SERVICE
+
+
+class SRIServiceStatus(models.Model):
+    service = models.CharField(max_length=20, choices=SRI_SERVICE, verbose_name='Servicio')
+    environment_type = models.PositiveIntegerField(choices=ENVIRONMENT_TYPE, default=ENVIRONMENT_TYPE[0][0], verbose_name='Tipo de ambiente')
+    state = models.CharField(max_length=20, choices=CIRCUIT_STATE, default=CIRCUIT_STATE[0][0], verbose_name='Estado')
+    consecutive_failures = models.PositiveIntegerField(default=0, verbose_name='Fallos consecutivos')
+    total_calls = models.PositiveIntegerField(default=0, verbose_name='Llamadas')
+    total_failures = models.PositiveIntegerField(default=0, verbose_name='Llamadas fallidas')
+    rejected_calls = models.PositiveIntegerField(default=0, verbose_name='Llamadas rechazadas sin consultar al SRI')
+    last_latency = models.FloatField(default=0, verbose_name='Duración de la última llamada (s)')
+    last_error = models.TextField(null=True, blank=True, verbose_name='Último error')
+    last_success_at = models.DateTimeField(null=True, blank=True, verbose_name='Último éxito')
+    last_failure_at = models.DateTimeField(null=True, blank=True, verbose_name='Último fallo')
+    opened_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de apertura')
+    probe_started_at = models.DateTimeField(null=True, blank=True, verbose_name='Inicio de la prueba de recuperación')
+
+    def __str__(self):
+        return f'{self.get_service_display()} - {self.get_environment_type_display()}'
+
+    @classmethod
+    def get_status(cls, service, environment_type):
+        status, _ = cls.objects.get_or_create(service=service, environment_type=environment_type)
+        return status
+
+    @property
+    def retry_at(self):
+        if self.opened_at is None:
+            return None
+        return self.opened_at + timedelta(seconds=settings.SRI_BREAKER_RESET_TIMEOUT)
+
+    def allow_request(self):
+        """Indica si se puede llamar al servicio; con el circuito abierto solo un proceso hace la prueba de recuperación."""
+        if self.state == CIRCUIT_STATE[0][0]:
+            return True
+        now = timezone.now()
+        expired = now - timedelta(seconds=settings.SRI_BREAKER_RESET_TIMEOUT)
+        queryset = SRIServiceStatus.objects.filter(pk=self.pk)
+        if self.state == CIRCUIT_STATE[1][0] and self.retry_at <= now:
+            allowed = queryset.filter(state=CIRCUIT_STATE[1][0], opened_at=self.opened_at).update(state=CIRCUIT_STATE[2][0], probe_started_at=now)
+        elif self.state == CIRCUIT_STATE[2][0] and (self.probe_started_at is None or self.probe_started_at <= expired):
+            # La prueba anterior quedó colgada (proceso caído); se permite otra
+            allowed = queryset.filter(state=CIRCUIT_STATE[2][0], probe_started_at=self.probe_started_at).update(probe_started_at=now)
+        else:
+            allowed = 0
+        if not allowed:
+            queryset.update(rejected_calls=F('rejected_calls') + 1)
+        return bool(allowed)
+
+    def record_success(self, latency):
+        now = timezone.now()
+        SRIServiceStatus.objects.filter(pk=self.pk).update(
+            state=CIRCUIT_STATE[0][0], consecutive_failures=0, total_calls=F('total_calls') + 1,
+            last_latency=latency, last_success_at=now, opened_at=None, probe_started_at=None,
+        )
+
+    def record_failure(self, error, latency):
+        now = timezone.now()
+        queryset = SRIServiceStatus.objects.filter(pk=self.pk)
+        queryset.update(
+            consecutive_failures=F('consecutive_failures') + 1, total_calls=F('total_calls') + 1, total_failures=F('total_failures') + 1,
+            last_latency=latency, last_error=str(error)[:2000], last_failure_at=now,
+        )
+        # Una prueba fallida reabre el circuito; en estado cerrado se abre al superar el umbral
+        queryset.filter(state=CIRCUIT_STATE[2][0]).update(state=CIRCUIT_STATE[1][0], opened_at=now, probe_started_at=None)
+        queryset.filter(state=CIRCUIT_STATE[0][0], consecutive_failures__gte=settings.SRI_BREAKER_FAILURE_THRESHOLD).update(state=CIRCUIT_STATE[1][0], opened_at=now)
+
+    def reset(self):
+        self.state = CIRCUIT_STATE[0][0]
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+        self.save()
+
+    def as_dict(self):
+        item = model_to_dict(self)
+        item['service'] = {'id': self.service, 'name': self.get_service_display()}
+        item['environment_type'] = {'id': self.environment_type, 'name': self.get_environment_type_display()}
+        item['state'] = {'id': self.state, 'name': self.get_state_display()}
+        item['last_latency'] = round(self.last_latency, 3)
+        for name in ['last_success_at', 'last_failure_at', 'opened_at', 'probe_started_at', 'retry_at']:
+            value = getattr(self, name)
+            item[name] = timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S') if value else ''
+        return item
+
+    class Meta:
+        verbose_name = 'Estado del Servicio del SRI'
+        verbose_name_plural = 'Estado de los Servicios del SRI'
+        default_permissions = ()
+        permissions = (
+            ('view_sri_service_status', 'Can view Estado del Servicio del SRI'),
+            ('change_sri_service_status', 'Can change Estado del Servicio del SRI'),
+        )
+        unique_together = ('service', 'environment_type')
+        ordering = ['environment_type', 'service']
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from django.db import models
+from django.db.models import Case, F, IntegerField, Value, When
+from django.forms import model_to_dict
+from django.utils import timezone
+
+from core.pos.choices import STOCK_MOVEMENT_TYPE
+
+
+class StockMovement(models.Model):
+    """Kárdex: cada entrada o salida de stock queda registrada y no se modifica; Product.stock es el saldo acumulado"""
+    date_joined = models.DateField(default=datetime.now, verbose_name='Fecha de registro')
+    time_joined = models.DateTimeField(default=timezone.now, verbose_name='Hora de registro')
+    company = models.ForeignKey('pos.Company', null=True, blank=True, on_delete=models.CASCADE, verbose_name='Compañía')
+    product = models.ForeignKey('pos.Product', on_delete=models.CASCADE, verbose_name='Producto')
+    movement_type = models.CharField(max_length=30, choices=STOCK_MOVEMENT_TYPE, default=STOCK_MOVEMENT_TYPE[0][0], verbose_name='Tipo de movimiento')
+    quantity = models.IntegerField(default=0, verbose_name='Cantidad')
+    balance = models.IntegerField(default=0, verbose_name='Saldo')
+    invoice = models.ForeignKey('pos.Invoice', null=True, blank=True, on_delete=models.SET_NULL, verbose_name='Factura')
+    credit_note = models.ForeignKey('pos.CreditNote', null=True, blank=True, on_delete=models.SET_NULL, verbose_name='Nota de crédito')
+    purchase = models.ForeignKey('pos.Purchase', null=True, blank=True, on_delete=models.SET_NULL, verbose_name='Compra')
+    user = models.ForeignKey('user.User', null=True, blank=True, on_delete=models.SET_NULL, verbose_name='Usuario')
+    description = models.CharField(max_length=150, null=True, blank=True, verbose_name='Detalle')
+
+    def __str__(self):
+        return f'{self.get_movement_type_display()} {self.quantity:+d} ({self.product_id})'
+
+    @classmethod
+    def register(cls, movements, check_stock=False):
+        """Aplica las cantidades a Product.stock con un solo UPDATE atómico y guarda los movimientos con su saldo.
+
+        Con check_stock ningún producto puede quedar con stock negativo: si falta stock se lanza una excepción
+        y la transacción que contiene la operación se revierte completa.
+        """
+        from core.pos.models.product import Product
+
+        movements = [movement for movement in movements if movement.quantity]
+        if not movements:
+            return movements
+        quantities = {}
+        for movement in movements:
+            quantities[movement.product_id] = quantities.get(movement.product_id, 0) + movement.quantity
+        quantity = Case(*[When(pk=product_id, then=Value(value)) for product_id, value in quantities.items()], default=Value(0), output_field=IntegerField())
+        queryset = Product.objects.filter(pk__in=quantities)
+        if check_stock:
+            required = Case(*[When(pk=product_id, then=Value(-value)) for product_id, value in quantities.items() if value < 0], default=Value(0), output_field=IntegerField())
+            queryset = queryset.filter(stock__gte=required)
+        if queryset.update(stock=F('stock') + quantity) != len(quantities):
+            products = Product.objects.filter(pk__in=quantities).only('name', 'stock')
+            names = ', '.join(f'{product.name} (stock {product.stock})' for product in products if product.stock + quantities[product.id] < 0)
+            raise Exception(f'No existe stock suficiente de: {names}')
+        # Las filas siguen bloqueadas por el UPDATE hasta el final de la transacción
+        stocks = dict(Product.objects.filter(pk__in=quantities).values_list('id', 'stock'))
+        for movement in reversed(movements):
+            movement.balance = stocks[movement.product_id]
+            stocks[movement.product_id] -= movement.quantity
+            if movement.company_id is None:
+                movement.company_id = movement.product.company_id
+        return cls.objects.bulk_create(movements, batch_size=500)
+
+    @classmethod
+    def adjust(cls, products, movement_type=STOCK_MOVEMENT_TYPE[5][0], **kwargs):
+        """products: {id del producto: stock final}. Registra la diferencia con el stock actual de cada producto"""
+        from core.pos.models.product import Product
+
+        current = Product.objects.select_for_update().in_bulk(list(products))
+        return cls.register([
+            cls(product=product, quantity=int(products[product_id]) - product.stock, movement_type=movement_type, **kwargs)
+            for product_id, product in current.items()
+        ])
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if self.pk:
+            raise Exception('Los movimientos de stock no se pueden modificar')
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+
+    def as_dict(self):
+        item = model_to_dict(self, exclude=['company'])
+        item['date_joined'] = self.date_joined.strftime('%Y-%m-%d')
+        item['time_joined'] = timezone.localtime(self.time_joined).strftime('%Y-%m-%d %H:%M:%S')
+        item['movement_type'] = {'id': self.movement_type, 'name': self.get_movement_type_display()}
+        return item
+
+    class Meta:
+        verbose_name = 'Movimiento de Stock'
+        verbose_name_plural = 'Movimientos de Stock'
+        default_permissions = ()
+        permissions = (
+            ('view_stock_movement', 'Can view Movimiento de Stock'),
+        )
+        indexes = [
+            models.Index(fields=['product', 'date_joined']),
+            models.Index(fields=['company', 'date_joined']),
+        ]
+        ordering = ['id']
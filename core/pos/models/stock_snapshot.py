@@ -0,0 +1,66 @@
+from django.db import models
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.forms import model_to_dict
+
+from core.pos.models.stock_movement import StockMovement
+
+
+class StockSnapshot(models.Model):
+    """Stock de cada producto al cierre de un día, calculado desde el kárdex por `manage.py stock_snapshot`"""
+    date = models.DateField(verbose_name='Fecha')
+    company = models.ForeignKey('pos.Company', null=True, blank=True, on_delete=models.CASCADE, verbose_name='Compañía')
+    product = models.ForeignKey('pos.Product', on_delete=models.CASCADE, verbose_name='Producto')
+    stock = models.IntegerField(default=0, verbose_name='Stock')
+
+    def __str__(self):
+        return f'{self.product_id} {self.date}: {self.stock}'
+
+    @classmethod
+    def get_stock(cls, date, company=None):
+        """Stock de cada producto al cierre de `date`: su última instantánea hasta esa fecha más los movimientos posteriores"""
+        snapshots = cls.objects.filter(date__lte=date)
+        movements = StockMovement.objects.filter(date_joined__lte=date).order_by()
+        if company:
+            snapshots = snapshots.filter(company=company)
+            movements = movements.filter(company=company)
+        latest = snapshots.filter(date=Subquery(cls.objects.filter(product=OuterRef('product'), date__lte=date).order_by('-date').values('date')[:1]))
+        stock, since = {}, {}
+        for product_id, snapshot_date, value in latest.values_list('product_id', 'date', 'stock'):
+            stock[product_id] = value
+            since[product_id] = snapshot_date
+        has_snapshot = Exists(cls.objects.filter(product=OuterRef('product'), date__lte=date))
+        # Productos sin instantánea: todos sus movimientos hasta la fecha
+        for product_id, total in movements.exclude(has_snapshot).values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'):
+            stock[product_id] = total
+        if since:
+            rows = movements.filter(has_snapshot, date_joined__gt=min(since.values())).values('product_id', 'date_joined').annotate(total=Sum('quantity'))
+            for row in rows.values_list('product_id', 'date_joined', 'total'):
+                if row[1] > since[row[0]]:
+                    stock[row[0]] += row[2]
+        return stock
+
+    @classmethod
+    def create_snapshots(cls, date, company=None):
+        from core.pos.models.product import Product
+
+        companies = dict(Product.objects.values_list('id', 'company_id'))
+        snapshots = [cls(date=date, company_id=companies.get(product_id), product_id=product_id, stock=value) for product_id, value in cls.get_stock(date, company).items() if product_id in companies]
+        cls.objects.bulk_create(snapshots, batch_size=1000, update_conflicts=True, unique_fields=['product', 'date'], update_fields=['stock'])
+        return len(snapshots)
+
+    def as_dict(self):
+        item = model_to_dict(self, exclude=['company'])
+        item['date'] = self.date.strftime('%Y-%m-%d')
+        return item
+
+    class Meta:
+        verbose_name = 'Instantánea de Stock'
+        verbose_name_plural = 'Instantáneas de Stock'
+        default_permissions = ()
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='unique_stock_snapshot_per_day')
+        ]
+        indexes = [
+            models.Index(fields=['company', 'date']),
+        ]
+        ordering = ['id']
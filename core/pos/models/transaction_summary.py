@@ -3,6 +3,9 @@ from datetime import datetime
 from django.db import models
 from django.forms import model_to_dict
 
+from core.pos.utilities.pdf_cache import version_stamp
+from core.pos.utilities.totals import totals_engine
+
 
 class TransactionSummary(models.Model):
     company = models.ForeignKey('pos.Company', on_delete=models.CASCADE)
@@ -22,12 +25,37 @@ class TransactionSummary(models.Model):
     def tax_rate(self):
         return int(self.tax * 100)
 
+    # Relación con el detalle del comprobante
+    detail_set_name = None
+
+    def get_details(self):
+        return getattr(self, self.detail_set_name).select_related('product').order_by('id')
+
+    def recalculate_invoice(self, details=None):
+        # Sin detalles se recalculan los guardados; los nuevos se insertan en bloque
+        details = list(self.get_details()) if details is None else details
+        totals_engine.calculate(self, details)
+        totals_engine.save_details(getattr(self, self.detail_set_name).model, details)
+        self.save()
+        return details
+
     def formatted_date_joined(self):
         value = self.date_joined
         if isinstance(value, str):
             value = datetime.strptime(value, '%Y-%m-%d')
         return value.strftime('%Y-%m-%d')
 
+    # Datos del detalle que se muestran en los PDF
+    pdf_detail_fields = ('id', 'quantity', 'price', 'subtotal', 'total_tax', 'total_discount', 'total_amount', 'product__code', 'product__name')
+    # Campos que cambian sin alterar el PDF
+    pdf_version_exclude = ()
+
+    def get_pdf_sources(self):
+        return [self, self.company]
+
+    def get_pdf_version(self):
+        return version_stamp(*self.get_pdf_sources(), exclude=self.pdf_version_exclude)
+
     def as_dict(self):
         item = model_to_dict(self, exclude=['company'])
         item['date_joined'] = self.formatted_date_joined()
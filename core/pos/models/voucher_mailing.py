@@ -0,0 +1,238 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from functools import partial
+
+from django.db import models, transaction
+from django.db.models import Q
+from django.forms import model_to_dict
+from django.utils import timezone
+
+from config import settings
+from core.pos.choices import BILLING_JOB_STATUS, EMAIL_STATUS, INVOICE_STATUS, MAILING_ATTACHMENT
+from core.pos.utilities.mailer import ATTACHMENT_CHUNK_SIZE, get_encoded_size
+
+
+class VoucherMailing(models.Model):
+    company = models.ForeignKey('pos.Company', on_delete=models.CASCADE, verbose_name='Compañía')
+    customer = models.ForeignKey('pos.Customer', on_delete=models.CASCADE, verbose_name='Cliente')
+    start_date = models.DateField(null=True, blank=True, verbose_name='Fecha de inicio')
+    end_date = models.DateField(null=True, blank=True, verbose_name='Fecha de fin')
+    attachment = models.CharField(max_length=10, choices=MAILING_ATTACHMENT, default=MAILING_ATTACHMENT[0][0], verbose_name='Adjuntos')
+    status = models.CharField(max_length=20, choices=BILLING_JOB_STATUS, default=BILLING_JOB_STATUS[0][0], verbose_name='Estado')
+    total = models.PositiveIntegerField(default=0, verbose_name='Comprobantes')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Comprobantes procesados')
+    enqueued = models.JSONField(default=list, blank=True, verbose_name='Comprobantes ya en la bandeja de salida')
+    locked_by = models.CharField(max_length=100, null=True, blank=True, verbose_name='Procesado por')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de bloqueo')
+    last_error = models.TextField(null=True, blank=True, verbose_name='Último error')
+    time_joined = models.DateTimeField(default=timezone.now, verbose_name='Fecha y hora de registro')
+    time_updated = models.DateTimeField(auto_now=True, verbose_name='Última actualización')
+
+    def __str__(self):
+        return f'{self.customer} - {self.get_period()}'
+
+    @classmethod
+    def enqueue(cls, customer, company=None, start_date=None, end_date=None, attachment=MAILING_ATTACHMENT[0][0]):
+        """Registra el reenvío de los comprobantes del cliente; lo prepara `manage.py email_worker` en segundo plano"""
+        mailing = cls.objects.filter(customer=customer, start_date=start_date or None, end_date=end_date or None, attachment=attachment, status__in=[BILLING_JOB_STATUS[0][0], BILLING_JOB_STATUS[1][0], BILLING_JOB_STATUS[3][0]]).first()
+        if mailing is not None:
+            # Un reenvío que falló se retoma: solo se envían los comprobantes que no llegaron a la bandeja de salida
+            if mailing.status == BILLING_JOB_STATUS[3][0] and cls.objects.filter(pk=mailing.pk, status=BILLING_JOB_STATUS[3][0]).update(status=BILLING_JOB_STATUS[0][0], last_error=None):
+                mailing.status, mailing.last_error = BILLING_JOB_STATUS[0][0], None
+                if not settings.EMAIL_OUTBOX_ASYNC:
+                    transaction.on_commit(mailing.process_now)
+            return mailing
+        mailing = cls.objects.create(company=company or customer.company, customer=customer, start_date=start_date or None, end_date=end_date or None, attachment=attachment)
+        if not settings.EMAIL_OUTBOX_ASYNC:
+            transaction.on_commit(mailing.process_now)
+        return mailing
+
+    @classmethod
+    def get_available_filter(cls):
+        # Un reenvío en proceso cuyo bloqueo expiró pertenece a un worker caído y se prepara de nuevo
+        expired = timezone.now() - timedelta(seconds=settings.VOUCHER_MAILING_LOCK_TIMEOUT)
+        return Q(status=BILLING_JOB_STATUS[0][0]) | Q(status=BILLING_JOB_STATUS[1][0], locked_at__lt=expired)
+
+    @classmethod
+    def claim(cls, worker, limit=1):
+        claimed = []
+        with transaction.atomic():
+            ids = list(cls.objects.filter(cls.get_available_filter()).select_for_update(skip_locked=True).order_by('id').values_list('id', flat=True)[:limit])
+            for pk in ids:
+                if cls.objects.filter(cls.get_available_filter(), pk=pk).update(status=BILLING_JOB_STATUS[1][0], locked_by=worker, locked_at=timezone.now(), processed=0):
+                    claimed.append(pk)
+        return list(cls.objects.filter(id__in=claimed).select_related('company', 'customer__user').order_by('id'))
+
+    @property
+    def is_finished(self):
+        return self.status in [BILLING_JOB_STATUS[2][0], BILLING_JOB_STATUS[3][0]]
+
+    def get_period(self):
+        if self.start_date and self.end_date:
+            return f'{self.start_date.strftime("%Y-%m-%d")} al {self.end_date.strftime("%Y-%m-%d")}'
+        return 'todos los periodos'
+
+    def get_vouchers(self):
+        """Facturas y notas de crédito autorizadas del cliente en el periodo, en orden de emisión"""
+        from core.pos.models import CreditNote, Invoice
+
+        filters = Q(company_id=self.company_id, status__in=[INVOICE_STATUS[1][0], INVOICE_STATUS[2][0], INVOICE_STATUS[3][0]]) & ~Q(authorized_xml='') & Q(authorized_xml__isnull=False)
+        if self.start_date and self.end_date:
+            filters &= Q(date_joined__range=[self.start_date, self.end_date])
+        vouchers = list(Invoice.objects.filter(filters, customer_id=self.customer_id).select_related('receipt', 'company'))
+        vouchers += list(CreditNote.objects.filter(filters, invoice__customer_id=self.customer_id).select_related('receipt', 'company'))
+        return sorted(vouchers, key=lambda voucher: (voucher.date_joined, voucher.receipt_number_full or ''))
+
+    def update_progress(self, processed):
+        self.processed = processed
+        type(self).objects.filter(pk=self.pk).update(processed=processed)
+
+    def get_voucher_key(self, voucher):
+        return f'{voucher.voucher_type_code}-{voucher.pk}'
+
+    def split_vouchers(self, vouchers):
+        # Cada correo lleva como máximo VOUCHER_MAILING_MAX_SIZE bytes de adjuntos para no superar el límite del servidor SMTP:
+        # se cuenta el PDF/XML tal como se adjunta (descomprimido y codificado en base64)
+        groups, group, size = [], [], 0
+        for voucher in vouchers:
+            voucher_size = sum(get_encoded_size(file.storage.get_content_size(file.name)) for file in [voucher.authorized_pdf, voucher.authorized_xml])
+            if group and size + voucher_size > settings.VOUCHER_MAILING_MAX_SIZE:
+                groups.append(group)
+                group, size = [], 0
+            group.append(voucher)
+            size += voucher_size
+        if group:
+            groups.append(group)
+        return groups
+
+    def create_message(self, vouchers, part, parts):
+        message = MIMEMultipart('mixed')
+        subject = f'Comprobantes electrónicos {self.get_period()} – {self.company.commercial_name}'
+        message['Subject'] = f'{subject} ({part} de {parts})' if parts > 1 else subject
+        message['To'] = self.customer.user.email
+        rows = ''.join(
+            f'<tr><td>{voucher.receipt.name}</td><td>{voucher.receipt_number_full}</td><td>{voucher.date_joined.strftime("%Y-%m-%d")}</td><td>{voucher.total_amount:.2f}</td></tr>'
+            for voucher in vouchers
+        )
+        html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <head><meta charset="utf-8"></head>
+        <body style="font-family: Arial, sans-serif; color: #333;">
+            <p>Estimado(a) <strong>{self.customer.user.names}</strong>,</p>
+            <p>Adjuntamos los comprobantes electrónicos emitidos por <strong>{self.company.commercial_name}</strong> ({self.get_period()}).</p>
+            <table cellpadding="6" style="border-collapse: collapse;" border="1">
+                <tr><th>Comprobante</th><th>Número</th><th>Fecha</th><th>Total</th></tr>
+                {rows}
+            </table>
+            <p>© {self.company.commercial_name} – Todos los derechos reservados</p>
+        </body>
+        </html>
+        """
+        message.attach(MIMEText(html_content, 'html'))
+        return message
+
+    def write_zip(self, vouchers, path, processed):
+        # Los archivos se copian por bloques desde el storage al ZIP en disco
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as file_zip:
+            for voucher in vouchers:
+                for filename, _, opener in voucher.get_email_attachments():
+                    with opener() as source, file_zip.open(filename, 'w') as target:
+                        shutil.copyfileobj(source, target, ATTACHMENT_CHUNK_SIZE)
+                processed += 1
+                self.update_progress(processed)
+        return processed
+
+    def process(self):
+        from core.pos.models.outbound_email import OutboundEmail
+
+        try:
+            vouchers = self.get_vouchers()
+            self.total = len(vouchers)
+            type(self).objects.filter(pk=self.pk).update(total=self.total)
+            if not vouchers:
+                raise ValueError('El cliente no tiene comprobantes autorizados en el periodo seleccionado')
+            if not self.customer.user.email:
+                raise ValueError('El cliente no tiene un email registrado')
+            # Al retomar un reenvío que falló o cuyo worker cayó no se repiten los correos que ya están en la bandeja de salida
+            vouchers = [voucher for voucher in vouchers if self.get_voucher_key(voucher) not in self.enqueued]
+            processed = self.total - len(vouchers)
+            self.update_progress(processed)
+            for voucher in vouchers:
+                # Solo se genera el PDF de los comprobantes que aún no lo tienen guardado
+                if not voucher.authorized_pdf:
+                    voucher.update_authorized_pdf()
+            groups = self.split_vouchers(vouchers)
+            # Las partes que se retoman siguen la numeración de las que ya se enviaron
+            sent = self.outboundemail_set.count() if self.enqueued else 0
+            parts = sent + len(groups)
+            with tempfile.TemporaryDirectory() as directory:
+                for part, group in enumerate(groups, sent + 1):
+                    message = self.create_message(group, part, parts)
+                    if self.attachment == MAILING_ATTACHMENT[0][0]:
+                        filename = f'comprobantes-{self.customer.user.username}-{part}.zip' if parts > 1 else f'comprobantes-{self.customer.user.username}.zip'
+                        path = os.path.join(directory, filename)
+                        processed = self.write_zip(group, path, processed)
+                        attachments = [(filename, 'application/zip', partial(open, path, 'rb'))]
+                    else:
+                        attachments = [attachment for voucher in group for attachment in voucher.get_email_attachments()]
+                        processed += len(group)
+                        self.update_progress(processed)
+                    with transaction.atomic():
+                        OutboundEmail.enqueue(message=message, recipients=[self.customer.user.email], company=self.company, sender_name='OptimusPos Facturación', attachments=attachments, mailing=self)
+                        self.enqueued = self.enqueued + [self.get_voucher_key(voucher) for voucher in group]
+                        type(self).objects.filter(pk=self.pk).update(enqueued=self.enqueued)
+            self.status = BILLING_JOB_STATUS[2][0]
+            self.last_error = None
+        except Exception as e:
+            self.status = BILLING_JOB_STATUS[3][0]
+            self.last_error = str(e)
+        self.locked_by = None
+        self.locked_at = None
+        self.save()
+        return self
+
+    def process_now(self):
+        # Sin worker (EMAIL_OUTBOX_ASYNC=False) el reenvío se prepara al confirmar la transacción
+        if type(self).objects.filter(pk=self.pk, status=BILLING_JOB_STATUS[0][0]).update(status=BILLING_JOB_STATUS[1][0], locked_by='web', locked_at=timezone.now()):
+            self.process()
+
+    def get_progress(self):
+        emails = {name: 0 for name, _ in EMAIL_STATUS}
+        for item in self.outboundemail_set.values('status').annotate(count=models.Count('id')):
+            emails[item['status']] = item['count']
+        return {
+            'total': self.total,
+            'processed': self.processed,
+            'percent': round(self.processed * 100 / self.total) if self.total else (100 if self.is_finished else 0),
+            'emails': emails,
+            # Terminado cuando se preparó el envío y ningún correo sigue en la bandeja de salida
+            'finished': self.is_finished and not emails[EMAIL_STATUS[0][0]] and not emails[EMAIL_STATUS[1][0]],
+        }
+
+    def as_dict(self):
+        item = model_to_dict(self, exclude=['company', 'customer', 'enqueued'])
+        item['customer'] = self.customer.as_dict()
+        item['start_date'] = self.start_date.strftime('%Y-%m-%d') if self.start_date else ''
+        item['end_date'] = self.end_date.strftime('%Y-%m-%d') if self.end_date else ''
+        item['attachment'] = {'id': self.attachment, 'name': self.get_attachment_display()}
+        item['status'] = {'id': self.status, 'name': self.get_status_display()}
+        item['progress'] = self.get_progress()
+        item['locked_at'] = timezone.localtime(self.locked_at).strftime('%Y-%m-%d %H:%M:%S') if self.locked_at else ''
+        item['time_joined'] = timezone.localtime(self.time_joined).strftime('%Y-%m-%d %H:%M:%S')
+        item['time_updated'] = timezone.localtime(self.time_updated).strftime('%Y-%m-%d %H:%M:%S')
+        return item
+
+    class Meta:
+        verbose_name = 'Reenvío de Comprobantes'
+        verbose_name_plural = 'Reenvíos de Comprobantes'
+        default_permissions = ()
+        permissions = (
+            ('view_voucher_mailing', 'Can view Reenvío de Comprobantes'),
+        )
+        ordering = ['-id']
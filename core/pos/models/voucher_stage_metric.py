@@ -0,0 +1,101 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import models
+from django.db.models import Count, Q, Sum
+from django.forms import model_to_dict
+from django.utils import timezone
+
+from config import settings
+from core.pos.choices import STAGE_OUTCOME, VOUCHER_METRIC_STAGE, VOUCHER_TYPE
+
+# Límites (segundos) del histograma de duración por etapa publicado en /metrics
+STAGE_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_PERCENTILES = (50, 95, 99)
+
+
+class VoucherStageMetric(models.Model):
+    date_joined = models.DateField(default=datetime.now, verbose_name='Fecha de registro')
+    time_joined = models.DateTimeField(default=timezone.now, verbose_name='Hora de registro')
+    company = models.ForeignKey('pos.Company', on_delete=models.CASCADE, verbose_name='Compañía')
+    voucher_type = models.CharField(max_length=2, choices=VOUCHER_TYPE, default=VOUCHER_TYPE[0][0], verbose_name='Tipo de comprobante')
+    voucher_id = models.PositiveIntegerField(verbose_name='Comprobante')
+    receipt_number_full = models.CharField(max_length=50, null=True, blank=True, verbose_name='Número de comprobante')
+    stage = models.CharField(max_length=20, choices=VOUCHER_METRIC_STAGE, default=VOUCHER_METRIC_STAGE[0][0], verbose_name='Etapa')
+    outcome = models.CharField(max_length=20, choices=STAGE_OUTCOME, default=STAGE_OUTCOME[0][0], verbose_name='Resultado')
+    duration = models.FloatField(default=0.0, verbose_name='Duración (s)')
+    size = models.PositiveIntegerField(default=0, verbose_name='Tamaño del contenido (bytes)')
+
+    def __str__(self):
+        return f'{self.receipt_number_full} - {self.get_stage_display()}'
+
+    @classmethod
+    def get_percentile(cls, values, percentile):
+        # Percentil por rango más cercano sobre una lista ordenada
+        if not values:
+            return 0
+        return values[max(math.ceil(percentile / 100 * len(values)) - 1, 0)]
+
+    @classmethod
+    def get_report(cls, queryset, group_by=('date_joined', 'company_id', 'stage')):
+        """Cantidad, errores, duración promedio, p50/p95/p99 y tamaño promedio por cada combinación de `group_by`"""
+        groups = defaultdict(lambda: {'durations': [], 'errors': 0, 'size': 0})
+        for values in queryset.order_by().values_list(*group_by, 'duration', 'outcome', 'size').iterator(chunk_size=2000):
+            group = groups[values[:len(group_by)]]
+            duration, outcome, size = values[len(group_by):]
+            group['durations'].append(duration)
+            group['size'] += size
+            if outcome == STAGE_OUTCOME[3][0]:
+                group['errors'] += 1
+        rows = []
+        for key, group in sorted(groups.items(), key=lambda item: tuple('' if value is None else str(value) for value in item[0])):
+            durations = sorted(group['durations'])
+            row = dict(zip(group_by, key))
+            row['count'] = len(durations)
+            row['errors'] = group['errors']
+            row['avg'] = sum(durations) / len(durations)
+            for percentile in STAGE_PERCENTILES:
+                row[f'p{percentile}'] = cls.get_percentile(durations, percentile)
+            row['max'] = durations[-1]
+            row['size_avg'] = group['size'] / len(durations)
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def get_histogram(cls, queryset=None):
+        """Histograma acumulado de duración por etapa, compañía y resultado calculado en la base de datos"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        buckets = {f'le_{index}': Count('id', filter=Q(duration__lte=bucket)) for index, bucket in enumerate(STAGE_DURATION_BUCKETS)}
+        rows = []
+        for item in queryset.order_by().values('stage', 'company_id', 'outcome').annotate(count=Count('id'), sum=Sum('duration'), size=Sum('size'), **buckets):
+            item['buckets'] = {bucket: item.pop(f'le_{index}') for index, bucket in enumerate(STAGE_DURATION_BUCKETS)}
+            rows.append(item)
+        return rows
+
+    @classmethod
+    def purge(cls, days=None):
+        days = settings.ELECTRONIC_BILLING_METRICS_RETENTION_DAYS if days is None else days
+        return cls.objects.filter(date_joined__lt=datetime.now().date() - timedelta(days=days)).delete()[0]
+
+    def as_dict(self):
+        item = model_to_dict(self, exclude=['company'])
+        item['date_joined'] = self.date_joined.strftime('%Y-%m-%d')
+        item['time_joined'] = timezone.localtime(self.time_joined).strftime('%Y-%m-%d %H:%M:%S')
+        item['voucher_type'] = {'id': self.voucher_type, 'name': self.get_voucher_type_display()}
+        item['stage'] = {'id': self.stage, 'name': self.get_stage_display()}
+        item['outcome'] = {'id': self.outcome, 'name': self.get_outcome_display()}
+        return item
+
+    class Meta:
+        verbose_name = 'Métrica de Etapa del Comprobante'
+        verbose_name_plural = 'Métricas de Etapas de los Comprobantes'
+        default_permissions = ()
+        permissions = (
+            ('view_voucher_stage_metric', 'Can view Métrica de Etapa del Comprobante'),
+        )
+        indexes = [
+            models.Index(fields=['date_joined', 'stage']),
+            models.Index(fields=['company', 'date_joined']),
+        ]
+        ordering = ['id']
@@ -62,6 +62,8 @@ var credit_note = {
                         switch (row.status.id) {
                             case "without_authorizing":
                                 return '<span class="badge rounded-pill bg-warning">' + name + '</span>';
+                            case "offline_pending":
+                                return '<span class="badge rounded-pill bg-info">' + name + '</span>';
                             case "authorized":
                             case "authorized_and_sent_by_email":
                                 return '<span class="badge rounded-pill bg-success">' + name + '</span>';
@@ -95,7 +97,7 @@ var credit_note = {
                         buttons += '<button type="button" class="btn btn-secondary btn-sm dropdown-toggle" data-toggle="dropdown" aria-expanded="false"><i class="fas fa-list"></i> Opciones</button>';
                         buttons += '<div class="dropdown-menu dropdown-menu-right">';
                         buttons += '<a class="dropdown-item" rel="detail"><i class="fas fa-folder-open"></i> Detalle de productos</a>';
-                        if (!['without_authorizing', 'canceled', 'sequential_registered_error'].includes(row.status.id)) {
+                        if (!['without_authorizing', 'offline_pending', 'canceled', 'sequential_registered_error'].includes(row.status.id)) {
                             buttons += '<a href="' + row.print_pdf + '" target="_blank" class="dropdown-item"><i class="fa-solid fa-file-pdf"></i> Imprimir pdf</a>';
                             buttons += '<a href="' + row.authorized_xml + '" target="_blank" class="dropdown-item"><i class="fas fa-file-code"></i> Descargar xml</a>';
                         }
@@ -61,6 +61,8 @@ var credit_note = {
                         switch (row.status.id) {
                             case "without_authorizing":
                                 return '<span class="badge rounded-pill bg-warning">' + name + '</span>';
+                            case "offline_pending":
+                                return '<span class="badge rounded-pill bg-info">' + name + '</span>';
                             case "authorized":
                             case "authorized_and_sent_by_email":
                                 return '<span class="badge rounded-pill bg-success">' + name + '</span>';
@@ -90,7 +92,7 @@ var credit_note = {
                     orderable: false,
                     render: function (data, type, row) {
                         var buttons = '<a rel="detail" data-toggle="tooltip" title="Detalle" class="btn btn-success btn-xs btn-flat"><i class="fas fa-search"></i></a> ';
-                        if (!['without_authorizing', 'canceled', 'sequential_registered_error'].includes(row.status.id)) {
+                        if (!['without_authorizing', 'offline_pending', 'canceled', 'sequential_registered_error'].includes(row.status.id)) {
                             buttons += '<a href="' + row.print_pdf + '" target="_blank" data-toggle="tooltip" title="Descargar PDF" class="btn btn-secondary btn-xs btn-flat"><i class="fas fa-file-pdf"></i></a> ';
                             buttons += '<a href="' + row.authorized_xml + '" target="_blank" data-toggle="tooltip" title="Descargar XML" class="btn btn-warning btn-xs btn-flat"><i class="fas fa-file-code"></i></a> ';
                         }
@@ -3,6 +3,41 @@ var select_customer, select_receipt, select_payment_type;
 var input_search_product, input_date_joined, input_end_credit, input_cash, input_change, input_transaction;
 var tblProducts, tblSearchProducts, tblAdditionalInfo;
 
+function wait_billing_job(job, callback) {
+    var polls = 0;
+    var finish = function () {
+        $.LoadingOverlay("hide", true);
+        callback(job);
+    };
+    var poll = function () {
+        if (polls === 0) {
+            loading({'text': 'Autorizando comprobante...'});
+        }
+        polls += 1;
+        $.ajax({
+            url: pathname,
+            data: {'action': 'billing_status', 'id': job.id},
+            type: 'POST',
+            dataType: 'json',
+            headers: {
+                'X-CSRFToken': csrftoken
+            }
+        }).done(function (request) {
+            if (request.hasOwnProperty('error')) {
+                return finish();
+            }
+            job = request;
+            // Si la etapa ya tiene reintentos programados no se bloquea al usuario, el worker continúa en segundo plano
+            if (job.is_finished || job.offline || job.attempts > 0 || polls >= 20) {
+                return finish();
+            }
+            $('.loading').text(job.stage.name + '...');
+            setTimeout(poll, 1500);
+        }).fail(finish);
+    };
+    setTimeout(poll, 1000);
+}
+
 var invoice = {
     detail: {
         tax: 0.00,
@@ -368,15 +403,51 @@ document.addEventListener('DOMContentLoaded', function (e) {
             var args = {
                 'params': params,
                 'success': function (request) {
-                    dialog_action({
-                        'content': '¿Desea Imprimir el Comprobante?',
-                        'success': function () {
-                            window.open(request.print_url, '_blank');
-                            location.href = href_url;
-                        },
-                        'cancel': function () {
-                            location.href = href_url;
+                    var print = function () {
+                        dialog_action({
+                            'content': '¿Desea Imprimir el Comprobante?',
+                            'success': function () {
+                                window.open(request.print_url, '_blank');
+                                location.href = href_url;
+                            },
+                            'cancel': function () {
+                                location.href = href_url;
+                            }
+                        });
+                    };
+                    if (request.offline) {
+                        return alert_sweetalert({
+                            'type': 'info',
+                            'message': 'La venta fue registrada. ' + request.msg,
+                            'callback': print
+                        });
+                    }
+                    if (!request.hasOwnProperty('billing_job')) {
+                        return print();
+                    }
+                    wait_billing_job(request.billing_job, function (job) {
+                        if (job.status.id === 'failed') {
+                            return alert_sweetalert({
+                                'type': 'error',
+                                'message': 'La venta fue registrada pero el comprobante no fue autorizado: ' + JSON.stringify(job.last_error.error),
+                                'callback': print
+                            });
+                        }
+                        if (job.offline && !job.is_finished) {
+                            return alert_sweetalert({
+                                'type': 'info',
+                                'message': 'La venta fue registrada sin conexión con el SRI, el comprobante se enviará automáticamente cuando el servicio se recupere',
+                                'callback': print
+                            });
+                        }
+                        if (!job.is_finished) {
+                            return alert_sweetalert({
+                                'type': 'info',
+                                'message': 'La venta fue registrada, el comprobante se seguirá procesando en segundo plano (' + job.stage.name + ')',
+                                'callback': print
+                            });
                         }
+                        print();
                     });
                 }
             };
@@ -66,6 +66,8 @@ var invoice = {
                         switch (row.status.id) {
                             case "without_authorizing":
                                 return '<span class="badge rounded-pill bg-warning">' + name + '</span>';
+                            case "offline_pending":
+                                return '<span class="badge rounded-pill bg-info">' + name + '</span>';
                             case "authorized":
                             case "authorized_and_sent_by_email":
                                 return '<span class="badge rounded-pill bg-success">' + name + '</span>';
@@ -98,6 +100,7 @@ var invoice = {
                             buttons += '<a rel="create_electronic_invoice" class="dropdown-item"><i class="fas fa-clipboard-check"></i> Generar factura electrónica</a>';
                         } else if (['authorized', 'authorized_and_sent_by_email'].includes(row.status.id)) {
                             buttons += '<a rel="send_receipt_by_email" class="dropdown-item"><i class="fas fa-envelope"></i> Enviar comprobantes por email</a>';
+                            buttons += '<a rel="send_vouchers_by_email" class="dropdown-item"><i class="fas fa-mail-bulk"></i> Reenviar al cliente sus comprobantes del periodo</a>';
                             buttons += '<a href="' + row.print_pdf + '" target="_blank" class="dropdown-item"><i class="fa-solid fa-file-pdf"></i> Imprimir pdf</a>';
                             buttons += '<a href="' + row.authorized_xml + '" target="_blank" class="dropdown-item"><i class="fas fa-file-code"></i> Descargar xml</a>';
                             if (row.customer.identification_type.id !== '07' && row.receipt.voucher_type.id === '01') {
@@ -113,6 +116,54 @@ var invoice = {
                 // $(this).wrap('<div class="dataTables_scroll"><div/>');
             }
         });
+    },
+    voucher_mailing_progress: function (id) {
+        // El reenvío se prepara en segundo plano; se consulta su avance hasta que todos los correos salgan
+        loading({'text': 'Preparando comprobantes...'});
+        var timer = setInterval(function () {
+            $.ajax({
+                url: pathname,
+                data: {'action': 'search_voucher_mailing', 'id': id},
+                type: 'POST',
+                dataType: 'json',
+                headers: {
+                    'X-CSRFToken': csrftoken
+                },
+                success: function (request) {
+                    if (request.hasOwnProperty('error')) {
+                        clearInterval(timer);
+                        $.LoadingOverlay("hide");
+                        return message_error(request.error);
+                    }
+                    var progress = request.progress;
+                    $('.loading').text('Comprobantes ' + progress.processed + ' de ' + progress.total + ' (' + progress.percent + '%), correos enviados: ' + progress.emails.sent);
+                    if (request.status.id === 'failed') {
+                        clearInterval(timer);
+                        $.LoadingOverlay("hide");
+                        return message_error(request.last_error);
+                    }
+                    if (progress.finished) {
+                        clearInterval(timer);
+                        $.LoadingOverlay("hide");
+                        if (progress.emails.failed > 0) {
+                            return message_error('No se pudo enviar el correo con los comprobantes, revise el email del cliente');
+                        }
+                        alert_sweetalert({
+                            'message': 'Se han enviado ' + progress.total + ' comprobantes por email',
+                            'timer': 2000,
+                            'callback': function () {
+                                tblInvoice.ajax.reload();
+                            }
+                        });
+                    }
+                },
+                error: function (jqXHR, textStatus, errorThrown) {
+                    clearInterval(timer);
+                    $.LoadingOverlay("hide");
+                    message_error(errorThrown + ' ' + textStatus);
+                }
+            });
+        }, 2000);
     }
 };
 
@@ -221,6 +272,25 @@ $(function () {
             };
             submit_with_formdata(args);
         })
+        .on('click', 'a[rel="send_vouchers_by_email"]', function () {
+            $('.tooltip').remove();
+            var tr = tblInvoice.cell($(this).closest('td, li')).index();
+            var row = tblInvoice.row(tr.row).data();
+            var params = new FormData();
+            params.append('action', 'send_vouchers_by_email');
+            params.append('id', row.id);
+            params.append('start_date', input_date_range.data('daterangepicker').startDate.format('YYYY-MM-DD'));
+            params.append('end_date', input_date_range.data('daterangepicker').endDate.format('YYYY-MM-DD'));
+            params.append('attachment', 'zip');
+            var args = {
+                'params': params,
+                'content': '¿Estas seguro de enviar a ' + row.customer.user.names + ' un ZIP con todos sus comprobantes del periodo seleccionado?',
+                'success': function (request) {
+                    invoice.voucher_mailing_progress(request.id);
+                }
+            };
+            submit_with_formdata(args);
+        })
         .on('click', 'a[rel="create_credit_note"]', function () {
             $('.tooltip').remove();
             var tr = tblInvoice.cell($(this).closest('td, li')).index();
@@ -265,4 +335,47 @@ $(function () {
     $('.btnSearchAll').on('click', function () {
         invoice.list({'start_date': '', 'end_date': ''});
     });
+
+    $('.btnExport').on('click', function () {
+        $.ajax({
+            url: pathname,
+            data: {
+                'action': 'search_export',
+                'start_date': input_date_range.data('daterangepicker').startDate.format('YYYY-MM-DD'),
+                'end_date': input_date_range.data('daterangepicker').endDate.format('YYYY-MM-DD')
+            },
+            type: 'POST',
+            dataType: 'json',
+            headers: {
+                'X-CSRFToken': csrftoken
+            },
+            success: function (request) {
+                if (request.hasOwnProperty('error')) {
+                    return message_error(request.error);
+                }
+                if (request.count === 0) {
+                    return message_error('No hay comprobantes autorizados en el periodo seleccionado');
+                }
+                if (request.parts.length === 1) {
+                    location.href = request.parts[0].url;
+                    return false;
+                }
+                // Los periodos grandes se descargan por partes para poder reintentar solo la que falle
+                var content = '<p>' + request.count + ' comprobantes en ' + request.parts.length + ' archivos:</p><ul>';
+                $.each(request.parts, function (index, part) {
+                    content += '<li><a href="' + part.url + '">' + part.name + '</a></li>';
+                });
+                $.alert({
+                    theme: 'modern',
+                    title: 'Exportar XML/PDF',
+                    icon: 'fas fa-file-archive',
+                    content: content + '</ul>',
+                    columnClass: 'medium'
+                });
+            },
+            error: function (jqXHR, textStatus, errorThrown) {
+                message_error(errorThrown + ' ' + textStatus);
+            }
+        });
+    });
 });
\ No newline at end of file
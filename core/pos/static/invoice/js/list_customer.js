@@ -75,6 +75,8 @@ var invoice = {
                         switch (row.status.id) {
                             case "without_authorizing":
                                 return '<span class="badge rounded-pill bg-warning">' + name + '</span>';
+                            case "offline_pending":
+                                return '<span class="badge rounded-pill bg-info">' + name + '</span>';
                             case "authorized":
                             case "authorized_and_sent_by_email":
                                 return '<span class="badge rounded-pill bg-success">' + name + '</span>';
@@ -98,7 +100,7 @@ var invoice = {
                     render: function (data, type, row) {
                         var buttons = '<a rel="detail" data-toggle="tooltip" title="Detalle" class="btn btn-success btn-xs btn-flat"><i class="fas fa-search"></i></a> ';
                         if (row.is_invoice) {
-                            if (!['without_authorizing', 'canceled', 'sequential_registered_error'].includes(row.status.id)) {
+                            if (!['without_authorizing', 'offline_pending', 'canceled', 'sequential_registered_error'].includes(row.status.id)) {
                                 buttons += '<a href="' + row.print_pdf + '" target="_blank" data-toggle="tooltip" title="Descargar PDF" class="btn btn-secondary btn-xs btn-flat"><i class="fas fa-file-pdf"></i></a> ';
                                 buttons += '<a href="' + row.authorized_xml + '" target="_blank" data-toggle="tooltip" title="Descargar XML" class="btn btn-warning btn-xs btn-flat"><i class="fas fa-file-code"></i></a> ';
                             }
@@ -1,3 +1,66 @@
+function product_import_render(request) {
+    var progress = request.progress;
+    $('#product_import_progress').removeClass('d-none');
+    $('#product_import_status').text(request.status.name + ': ' + progress.processed + ' de ' + progress.total + ' filas, ' + request.created + ' creados, ' + request.updated + ' actualizados');
+    $('#product_import_progress .progress-bar').css('width', progress.percent + '%').text(progress.percent + '%');
+    var tbody = $('#product_import_errors tbody').empty();
+    $.each(request.errors, function (index, item) {
+        tbody.append($('<tr>').append($('<td>').text(item.row), $('<td>').text(item.code), $('<td>').text(item.errors.join(', '))));
+    });
+    $('#product_import_errors').toggleClass('d-none', request.errors.length === 0);
+}
+
+function product_import_progress(id) {
+    // La importación se procesa en segundo plano; se consulta su avance hasta que termine
+    $('#frmForm button[type="submit"]').prop('disabled', true);
+    var timer = setInterval(function () {
+        $.ajax({
+            url: pathname,
+            data: {'action': 'search_product_import', 'id': id},
+            type: 'POST',
+            dataType: 'json',
+            headers: {
+                'X-CSRFToken': csrftoken
+            },
+            success: function (request) {
+                if (request.hasOwnProperty('error')) {
+                    clearInterval(timer);
+                    $('#frmForm button[type="submit"]').prop('disabled', false);
+                    return message_error(request.error);
+                }
+                product_import_render(request);
+                if (!request.progress.finished) {
+                    return false;
+                }
+                clearInterval(timer);
+                $('#frmForm button[type="submit"]').prop('disabled', false);
+                if (request.status.id === 'failed') {
+                    return message_error(request.last_error);
+                }
+                if (request.errors.length > 0) {
+                    // Se mantiene el modal abierto para revisar las filas no importadas
+                    $('#myModalUploadExcel').one('hidden.bs.modal', function () {
+                        location.reload();
+                    });
+                    return false;
+                }
+                alert_sweetalert({
+                    'message': 'Productos actualizados correctamente',
+                    'timer': 2000,
+                    'callback': function () {
+                        location.reload();
+                    }
+                });
+            },
+            error: function (jqXHR, textStatus, errorThrown) {
+                clearInterval(timer);
+                $('#frmForm button[type="submit"]').prop('disabled', false);
+                message_error(errorThrown + ' ' + textStatus);
+            }
+        });
+    }, 2000);
+}
+
 document.addEventListener('DOMContentLoaded', function (e) {
     const fv = FormValidation.formValidation(document.getElementById('frmForm'), {
             locale: 'es_ES',
@@ -59,13 +122,7 @@ document.addEventListener('DOMContentLoaded', function (e) {
             var args = {
                 'params': params,
                 'success': function (request) {
-                    alert_sweetalert({
-                        'message': 'Productos actualizados correctamente',
-                        'timer': 2000,
-                        'callback': function () {
-                            location.reload();
-                        }
-                    });
+                    product_import_progress(request.id);
                 }
             };
             submit_with_formdata(args);
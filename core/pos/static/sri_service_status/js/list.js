@@ -0,0 +1,126 @@
+var tblServiceStatus;
+
+var sri_service_status = {
+    list: function () {
+        tblServiceStatus = $('#data').DataTable({
+            autoWidth: false,
+            destroy: true,
+            deferRender: true,
+            ajax: {
+                url: pathname,
+                type: 'POST',
+                headers: {
+                    'X-CSRFToken': csrftoken
+                },
+                data: {
+                    'action': 'search'
+                },
+                dataSrc: ""
+            },
+            ordering: false,
+            columns: [
+                {data: "service.name"},
+                {data: "environment_type.name"},
+                {data: "state.name"},
+                {data: "consecutive_failures"},
+                {data: "total_calls"},
+                {data: "rejected_calls"},
+                {data: "last_latency"},
+                {data: "last_success_at"},
+                {data: "last_failure_at"},
+                {data: "retry_at"},
+                {data: "last_error"},
+                {data: "id"},
+            ],
+            columnDefs: [
+                {
+                    targets: [2],
+                    class: 'text-center',
+                    render: function (data, type, row) {
+                        var badges = {'closed': 'badge-success', 'open': 'badge-danger', 'half_open': 'badge-warning'};
+                        return '<span class="badge ' + badges[row.state.id] + ' badge-pill">' + row.state.name + '</span>';
+                    }
+                },
+                {
+                    targets: [-2],
+                    render: function (data, type, row) {
+                        return data ? '<small>' + $('<div/>').text(data).html() + '</small>' : '';
+                    }
+                },
+                {
+                    targets: [-1],
+                    class: 'text-center',
+                    render: function (data, type, row) {
+                        return '<a rel="reset" data-toggle="tooltip" title="Restablecer" class="btn btn-warning btn-xs btn-flat"><i class="fas fa-redo"></i></a>';
+                    }
+                }
+            ],
+            initComplete: function (settings, json) {
+                $('[data-toggle="tooltip"]').tooltip();
+                $(this).wrap('<div class="dataTables_scroll"><div/>');
+            }
+        });
+    },
+    offline_backlog: function () {
+        // Backlog de la emisión sin conexión; se actualiza mientras el worker lo envía al SRI
+        $.ajax({
+            url: pathname,
+            data: {'action': 'search_offline_backlog'},
+            type: 'POST',
+            dataType: 'json',
+            headers: {
+                'X-CSRFToken': csrftoken
+            },
+            success: function (request) {
+                if (request.hasOwnProperty('error')) {
+                    return false;
+                }
+                var container = $('#offline_backlog');
+                $.each(['backlog', 'authorizing', 'done', 'failed'], function (index, name) {
+                    container.find('[data-name="' + name + '"]').text(request[name]);
+                });
+                container.find('.progress-bar').css('width', request.percent + '%').text(request.percent + '%');
+                var summary = request.drained + ' de ' + request.total + ' comprobantes enviados al SRI desde ' + request.since;
+                if (request.oldest_pending) {
+                    summary += ' · Pendiente más antiguo: ' + request.oldest_pending;
+                }
+                summary += ' · Ritmo: ' + request.rate + ' por minuto';
+                if (request.eta) {
+                    summary += ' · Tiempo restante estimado: ' + Math.ceil(request.eta / 60) + ' min';
+                }
+                container.find('[data-name="summary"]').text(summary);
+            }
+        });
+    }
+};
+
+$(function () {
+    $('#data tbody')
+        .off()
+        .on('click', 'a[rel="reset"]', function () {
+            $('.tooltip').remove();
+            var tr = tblServiceStatus.cell($(this).closest('td, li')).index();
+            var row = tblServiceStatus.row(tr.row).data();
+            var params = new FormData();
+            params.append('action', 'reset');
+            params.append('id', row.id);
+            var args = {
+                'params': params,
+                'content': '¿Estas seguro de restablecer el estado del servicio? Los comprobantes volverán a enviarse al SRI',
+                'success': function (request) {
+                    alert_sweetalert({
+                        'message': 'Se ha restablecido el estado del servicio',
+                        'timer': 2000,
+                        'callback': function () {
+                            tblServiceStatus.ajax.reload();
+                        }
+                    })
+                }
+            };
+            submit_with_formdata(args);
+        });
+
+    sri_service_status.list();
+    sri_service_status.offline_backlog();
+    setInterval(sri_service_status.offline_backlog, 10000);
+});
@@ -1,11 +1,78 @@
-"""Tests deshabilitados a petición del usuario.
+import json
+from unittest import mock
 
-Si en el futuro se desean añadir pruebas automáticas para validar que la creación
-de clientes no otorga privilegios indebidos, aquí es buen lugar para:
- - Verificar que is_superuser / is_staff son False
- - Verificar que sólo pertenece al grupo 'cliente'
- - Verificar que no se asignan otros grupos.
-"""
+from django.test import RequestFactory, TestCase
 
-# placeholder
+from config import settings
+from core.pos.choices import PAYMENT_TYPE, VOUCHER_STAGE, VOUCHER_TYPE
+from core.pos.models import Category, Company, Customer, ElectronicBillingJob, Invoice, Product, Receipt
+from core.pos.utilities.sri import SRI
+from core.pos.views.invoice.views import InvoiceCreateView
+from core.user.models import User
 
+
+@mock.patch.object(settings, 'ELECTRONIC_BILLING_ASYNC', False)
+@mock.patch.object(settings, 'ELECTRONIC_BILLING_OFFLINE', True)
+@mock.patch('core.pos.views.invoice.views.check_quota_limits', return_value={'can_create': True})
+@mock.patch.object(SRI, 'firm_xml', return_value={'resp': True, 'xml': '<factura />'})
+@mock.patch.object(SRI, 'create_xml', return_value={'resp': True, 'xml': '<factura />'})
+class InvoiceCreateSyncTest(TestCase):
+    """Facturación electrónica dentro de la petición (ELECTRONIC_BILLING_ASYNC=False)"""
+
+    def setUp(self):
+        self.company = Company.objects.create(ruc='1002376026001', company_name='EMPRESA DE PRUEBA', commercial_name='PRUEBA', establishment_code='001', issuing_point_code='001', special_taxpayer='000', main_address='QUITO', establishment_address='QUITO', tax=15.00)
+        Receipt.objects.create(company=self.company, voucher_type=VOUCHER_TYPE[0][0], establishment_code='001', issuing_point_code='001', sequence=0)
+        self.employee = User.objects.create(username='vendedor', names='Vendedor', email='vendedor@prueba.com', company=self.company)
+        self.customer = Customer.objects.create(company=self.company, user=User.objects.create(username='1750000000', names='Cliente', email='cliente@prueba.com'), dni='1750000000')
+        self.product = Product.objects.create(company=self.company, name='Producto', code='P001', category=Category.objects.create(company=self.company, name='General'), pvp=10, stock=10)
+
+    def post(self):
+        request = RequestFactory().post('/', {
+            'action': 'add',
+            'date_joined': '2024-01-01',
+            'end_credit': '2024-01-01',
+            'receipt': VOUCHER_TYPE[0][0],
+            'payment_type': PAYMENT_TYPE[0][0],
+            'customer': self.customer.id,
+            'create_electronic_invoice': 'on',
+            'additional_info': '[]',
+            'products': json.dumps([{'id': self.product.id, 'quantity': 1, 'current_price': 10, 'discount': 0}]),
+        })
+        request.user = self.employee
+        request.company = self.company
+        view = InvoiceCreateView()
+        view.setup(request)
+        return json.loads(view.post(request).content)
+
+    @mock.patch.object(SRI, 'send_receipt_by_email')
+    @mock.patch.object(SRI, 'authorize_xml', return_value={'resp': False, 'pending': True, 'stage': VOUCHER_STAGE[3][0]})
+    @mock.patch.object(SRI, 'validate_xml', return_value={'resp': True, 'stage': VOUCHER_STAGE[2][0]})
+    def test_pending_authorization_keeps_invoice_and_job(self, validate_xml, authorize_xml, send_receipt_by_email, *args):
+        data = self.post()
+        self.assertTrue(data['resp'])
+        self.assertTrue(data['pending'])
+        invoice = Invoice.objects.get()
+        job = ElectronicBillingJob.objects.get(invoice=invoice)
+        self.assertEqual(job.stage, VOUCHER_STAGE[3][0])
+        send_receipt_by_email.assert_not_called()
+
+    @mock.patch.object(SRI, 'send_receipt_by_email')
+    @mock.patch.object(SRI, 'authorize_xml')
+    @mock.patch.object(SRI, 'validate_xml', return_value={'resp': False, 'error': 'Connection refused', 'unreachable': True, 'stage': VOUCHER_STAGE[2][0]})
+    def test_offline_contingency_keeps_invoice_and_job(self, validate_xml, authorize_xml, send_receipt_by_email, *args):
+        data = self.post()
+        self.assertTrue(data['resp'])
+        self.assertTrue(data['offline'])
+        invoice = Invoice.objects.get()
+        job = ElectronicBillingJob.objects.get(invoice=invoice)
+        self.assertTrue(job.offline)
+        self.assertEqual(job.stage, VOUCHER_STAGE[2][0])
+        authorize_xml.assert_not_called()
+        send_receipt_by_email.assert_not_called()
+
+    @mock.patch.object(SRI, 'validate_xml', return_value={'resp': False, 'error': 'DEVUELTA', 'stage': VOUCHER_STAGE[2][0]})
+    def test_rejected_voucher_rolls_back_sale(self, validate_xml, *args):
+        data = self.post()
+        self.assertFalse(data['resp'])
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(ElectronicBillingJob.objects.exists())
@@ -15,7 +15,9 @@ from core.pos.views.purchase.views import *
 from core.pos.views.quotation.views import *
 from core.pos.views.receipt.views import *
 from core.pos.views.receipt_error.views import *
+from core.pos.views.sri_service_status.views import *
 from core.pos.views.expense_type.views import *
+from core.pos.views.voucher_file.views import *
 
 urlpatterns = [
     # company
@@ -84,6 +86,7 @@ urlpatterns = [
     path('invoice/admin/update/<int:pk>/', InvoiceUpdateView.as_view(), name='invoice_update_admin'),
     path('invoice/admin/delete/<int:pk>/', InvoiceDeleteView.as_view(), name='invoice_delete_admin'),
     path('invoice/admin/print/<str:code>/<int:pk>/', InvoicePrintView.as_view(), name='invoice_print'),
+    path('invoice/admin/export/', InvoiceExportView.as_view(), name='invoice_export'),
     path('invoice/customer/', InvoiceCustomerListView.as_view(), name='invoice_list_customer'),
     # quotation
     path('quotation/', QuotationListView.as_view(), name='quotation_list'),
@@ -100,4 +103,8 @@ urlpatterns = [
     # receipt/error/
     path('receipt/error/', ReceiptErrorListView.as_view(), name='receipt_error_list'),
     path('receipt/error/delete/<int:pk>/', ReceiptErrorDeleteView.as_view(), name='receipt_error_delete'),
+    # sri/status/
+    path('sri/status/', SRIServiceStatusListView.as_view(), name='sri_service_status_list'),
+    # voucher file
+    path('voucher/file/<str:code>/<int:pk>/<str:kind>/', VoucherFileView.as_view(), name='voucher_file'),
 ]
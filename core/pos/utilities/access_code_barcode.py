@@ -0,0 +1,76 @@
+import base64
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import barcode
+from barcode.writer import SVGWriter
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from lxml import etree
+
+from config import settings
+
+# Mismas proporciones que el PNG que se generaba con ImageWriter
+BARCODE_OPTIONS = {'text_distance': 3.0, 'font_size': 6}
+MM_TO_PX = 96 / 25.4
+
+
+class AccessCodeBarcodeCache:
+    """Código de barras Code128 de cada clave de acceso. La clave no cambia una vez emitida:
+    el SVG se genera una sola vez, se guarda junto a los PDF autorizados y los más usados quedan en memoria.
+    """
+
+    def __init__(self, path=None, max_size=None):
+        self.path = path or settings.ACCESS_CODE_BARCODE_DIR
+        self.max_size = max_size or settings.ACCESS_CODE_BARCODE_CACHE_SIZE
+        self.lock = threading.Lock()
+        self.images = OrderedDict()
+
+    def render(self, access_code):
+        buffer = BytesIO()
+        barcode.Code128(access_code, writer=SVGWriter()).write(buffer, options=BARCODE_OPTIONS)
+        root = etree.fromstring(buffer.getvalue())
+        # Con viewBox el SVG se estira al ancho y alto de la clase .barcode igual que lo hacía el PNG
+        width, height = (float(root.get(name).rstrip('m')) * MM_TO_PX for name in ('width', 'height'))
+        root.set('viewBox', f'0 0 {width:.3f} {height:.3f}')
+        root.set('preserveAspectRatio', 'none')
+        return etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+    def get_image(self, access_code):
+        with self.lock:
+            if access_code in self.images:
+                self.images.move_to_end(access_code)
+                return self.images[access_code]
+        name = self.get_name(access_code)
+        if default_storage.exists(name):
+            with default_storage.open(name, 'rb') as file:
+                image = file.read()
+        else:
+            image = self.render(access_code)
+            stored_name = default_storage.save(name, ContentFile(image))
+            if stored_name != name:
+                # Otro proceso guardó el mismo código de barras al mismo tiempo
+                default_storage.delete(stored_name)
+        with self.lock:
+            self.images[access_code] = image
+            while len(self.images) > self.max_size:
+                self.images.popitem(last=False)
+        return image
+
+    def get_name(self, access_code):
+        return f'{self.path}/{access_code}.svg'
+
+    def get_url(self, access_code):
+        self.get_image(access_code)
+        return f'{settings.MEDIA_URL}{self.get_name(access_code)}'
+
+    def get_data_uri(self, access_code):
+        return f'data:image/svg+xml;base64,{base64.b64encode(self.get_image(access_code)).decode("ascii")}'
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+
+
+access_code_barcodes = AccessCodeBarcodeCache()
@@ -0,0 +1,83 @@
+import secrets
+from datetime import date, datetime
+
+import numpy as np
+
+ACCESS_KEY_LENGTH = 49
+# Posiciones de la clave de acceso: fecha(8) tipo(2) ruc(13) ambiente(1) establecimiento(3) punto de emisión(3)
+# secuencial(9) código numérico(8) tipo de emisión(1) dígito verificador(1)
+SEQUENCE_END = 39
+NUMERIC_CODE_END = 47
+# Factores 2 a 7 del módulo 11, aplicados de derecha a izquierda sobre los 48 primeros dígitos
+MOD11_FACTORS = np.resize(np.arange(2, 8, dtype=np.int64), 48)[::-1].copy()
+
+
+def to_digits(values, width):
+    """Convierte un arreglo de enteros en una matriz de width dígitos por fila"""
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return (np.asarray(values, dtype=np.int64).reshape(-1, 1) // powers) % 10
+
+
+def text_to_digits(text, width, name):
+    text = str(text)
+    if len(text) != width or not text.isdigit():
+        raise ValueError(f'El campo {name} de la clave de acceso debe tener {width} dígitos: {text}')
+    return np.frombuffer(text.encode('ascii'), dtype=np.uint8).astype(np.int64) - 48
+
+
+def compute_mod11(digits):
+    """Dígito verificador módulo 11 de cada fila de una matriz de 48 dígitos"""
+    number = 11 - (np.atleast_2d(digits) @ MOD11_FACTORS) % 11
+    number[number == 11] = 0
+    number[number == 10] = 1
+    return number
+
+
+def generate_numeric_codes(count):
+    return np.random.default_rng(secrets.randbits(128)).integers(0, 10 ** 8, size=count, dtype=np.int64)
+
+
+def create_access_keys(issue_dates, voucher_type, ruc, environment_type, establishment_code, issuing_point_code, sequences, emission_type, numeric_codes=None):
+    """Genera en bloque las claves de acceso de varios comprobantes de un mismo punto de emisión.
+
+    issue_dates puede ser una sola fecha o una por secuencial; numeric_codes se genera al azar si no se indica.
+    """
+    sequences = np.asarray(sequences, dtype=np.int64).reshape(-1)
+    count = len(sequences)
+    if isinstance(issue_dates, (date, datetime)):
+        issue_dates = [issue_dates]
+    dates = np.broadcast_to(np.array([int(value.strftime('%d%m%Y')) for value in issue_dates], dtype=np.int64), (count,))
+    if numeric_codes is None:
+        numeric_codes = generate_numeric_codes(count)
+    numeric_codes = np.broadcast_to(np.asarray(numeric_codes, dtype=np.int64), (count,))
+    header = np.concatenate([
+        text_to_digits(voucher_type, 2, 'tipo de comprobante'),
+        text_to_digits(ruc, 13, 'RUC'),
+        text_to_digits(environment_type, 1, 'ambiente'),
+        text_to_digits(establishment_code, 3, 'establecimiento'),
+        text_to_digits(issuing_point_code, 3, 'punto de emisión'),
+    ])
+    digits = np.hstack([
+        to_digits(dates, 8),
+        np.broadcast_to(header, (count, len(header))),
+        to_digits(sequences, 9),
+        to_digits(numeric_codes, 8),
+        np.broadcast_to(text_to_digits(emission_type, 1, 'tipo de emisión'), (count, 1)),
+    ])
+    keys = np.hstack([digits, compute_mod11(digits).reshape(-1, 1)])
+    text = (keys + 48).astype(np.uint8).tobytes().decode('ascii')
+    return [text[index:index + ACCESS_KEY_LENGTH] for index in range(0, len(text), ACCESS_KEY_LENGTH)]
+
+
+def is_same_voucher(access_key, other):
+    """Indica si dos claves de acceso corresponden al mismo comprobante (solo difieren en el código numérico)"""
+    if not access_key or not other or len(access_key) != ACCESS_KEY_LENGTH or len(other) != ACCESS_KEY_LENGTH:
+        return False
+    return access_key[:SEQUENCE_END] == other[:SEQUENCE_END] and access_key[NUMERIC_CODE_END] == other[NUMERIC_CODE_END]
+
+
+def is_valid_access_key(access_key):
+    if not access_key or len(access_key) != ACCESS_KEY_LENGTH or not access_key.isdigit():
+        return False
+    digits = np.frombuffer(access_key.encode('ascii'), dtype=np.uint8).astype(np.int64) - 48
+    return int(compute_mod11(digits[:48])[0]) == int(digits[48])
@@ -0,0 +1,45 @@
+import time
+
+from django.utils import timezone
+
+from config import settings
+from core.pos.utilities.sri_client import is_unreachable
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, status):
+        self.status = status
+        retry_at = timezone.localtime(status.retry_at).strftime('%H:%M:%S') if status.retry_at else ''
+        super().__init__(f'El servicio de {status.get_service_display().lower()} del SRI no está disponible, se reintentará después de las {retry_at}')
+
+
+class SRICircuitBreaker:
+    """Circuit breaker compartido por todos los procesos; el estado de cada servicio y ambiente vive en SRIServiceStatus."""
+
+    def get_status(self, service, environment_type):
+        from core.pos.models.sri_service_status import SRIServiceStatus
+
+        return SRIServiceStatus.get_status(service=service, environment_type=environment_type)
+
+    def call(self, service, environment_type, function, *args, **kwargs):
+        status = self.get_status(service=service, environment_type=environment_type)
+        if not status.allow_request():
+            raise CircuitOpenError(status)
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            # Solo la red, los timeouts y los 5xx cuentan como caída; un comprobante rechazado no abre el circuito
+            if is_unreachable(e):
+                status.record_failure(error=e, latency=time.perf_counter() - start)
+            raise
+        latency = time.perf_counter() - start
+        if latency > settings.SRI_BREAKER_SLOW_CALL:
+            # La respuesta es válida, pero un servicio tan lento cuenta como degradado
+            status.record_failure(error=f'Respuesta lenta del SRI: {latency:.1f} s', latency=latency)
+        else:
+            status.record_success(latency=latency)
+        return result
+
+
+sri_breaker = SRICircuitBreaker()
@@ -0,0 +1,176 @@
+import base64
+import smtplib
+import ssl
+import time
+import uuid
+from collections import Counter, namedtuple
+from email.mime.base import MIMEBase
+
+from config import settings
+
+SMTPCredentials = namedtuple('SMTPCredentials', ['host', 'port', 'username', 'password'])
+
+# Bytes leídos por bloque al codificar adjuntos en base64 (múltiplo de 57 para líneas completas de 76 caracteres)
+ATTACHMENT_CHUNK_SIZE = 57 * 1024
+
+
+def get_encoded_size(size):
+    """Bytes que ocupa en el mensaje un adjunto de `size` bytes codificado en base64 (líneas de 76 caracteres con CRLF)"""
+    encoded = (size + 2) // 3 * 4
+    return encoded + (encoded + 75) // 76 * 2
+
+
+def get_credentials(company=None):
+    """Servidor de correo de la compañía si tiene sus datos completos; si no, el de la plataforma (EMAIL_HOST_*)"""
+    if company is not None and company.email_host and company.email_host_user and company.email_host_password:
+        return SMTPCredentials(company.email_host, int(company.email_port), company.email_host_user, company.email_host_password)
+    return SMTPCredentials(settings.EMAIL_HOST, int(settings.EMAIL_PORT), settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+
+
+def write_message(message, attachments, file):
+    """Escribe en `file` el mensaje MIME (con fines de línea CRLF) agregando los adjuntos por bloques.
+
+    `attachments` es una lista de (nombre, tipo MIME, función que abre el archivo en modo binario); el contenido
+    se lee y codifica de a ATTACHMENT_CHUNK_SIZE bytes, así un lote de PDF/XML o un ZIP nunca se carga completo en memoria.
+    """
+    if message.get_content_maintype() != 'multipart':
+        raise ValueError('El mensaje debe ser multipart para agregar adjuntos')
+    boundary = f'===============adjuntos-{uuid.uuid4().hex}=='
+    message.set_boundary(boundary)
+    policy = message.policy.clone(linesep='\r\n')
+    content = message.as_bytes(policy=policy)
+    closing = f'--{boundary}--'.encode('ascii')
+    file.write(content[:content.rindex(closing)])
+    for filename, content_type, opener in attachments:
+        maintype, _, subtype = content_type.partition('/')
+        part = MIMEBase(maintype, subtype)
+        part.add_header('Content-Transfer-Encoding', 'base64')
+        part.add_header('Content-Disposition', 'attachment', filename=filename)
+        file.write(f'--{boundary}\r\n'.encode('ascii'))
+        file.write(part.as_bytes(policy=policy))
+        with opener() as source:
+            while True:
+                chunk = source.read(ATTACHMENT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                file.write(base64.encodebytes(chunk).replace(b'\n', b'\r\n'))
+        file.write(b'\r\n')
+    file.write(closing + b'\r\n')
+
+
+class SMTPConnectionPool:
+    """Conexiones SMTP autenticadas que se reutilizan entre mensajes, una por servidor y usuario.
+
+    Una conexión se renueva al llegar a EMAIL_OUTBOX_MESSAGES_PER_CONNECTION mensajes o tras EMAIL_OUTBOX_IDLE_TIMEOUT segundos sin uso.
+    """
+
+    def __init__(self, timeout=None, max_messages=None, idle_timeout=None):
+        self.timeout = timeout or settings.EMAIL_OUTBOX_TIMEOUT
+        self.max_messages = max_messages or settings.EMAIL_OUTBOX_MESSAGES_PER_CONNECTION
+        self.idle_timeout = idle_timeout or settings.EMAIL_OUTBOX_IDLE_TIMEOUT
+        self.connections = {}
+        self.metrics = Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self, credentials):
+        # 465 usa SSL implícito; en los demás puertos se usa STARTTLS si el servidor lo ofrece
+        if credentials.port == 465:
+            connection = smtplib.SMTP_SSL(credentials.host, credentials.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            connection = smtplib.SMTP(credentials.host, credentials.port, timeout=self.timeout)
+            connection.ehlo()
+            if connection.has_extn('starttls'):
+                connection.starttls(context=ssl.create_default_context())
+                connection.ehlo()
+        if credentials.username and credentials.password:
+            connection.login(credentials.username, credentials.password)
+        self.metrics['connections'] += 1
+        return connection
+
+    def get(self, credentials):
+        item = self.connections.get(credentials)
+        if item is not None:
+            if item['messages'] < self.max_messages and time.monotonic() - item['last_used'] < self.idle_timeout:
+                self.metrics['reused'] += 1
+                return item
+            self.discard(credentials)
+        item = {'connection': self.open(credentials), 'messages': 0, 'last_used': time.monotonic()}
+        self.connections[credentials] = item
+        return item
+
+    def send_file(self, connection, sender, recipients, file):
+        """Equivalente a sendmail() que transmite el mensaje desde un archivo línea por línea"""
+        connection.ehlo_or_helo_if_needed()
+        code, response = connection.mail(sender)
+        if code != 250:
+            connection.rset()
+            raise smtplib.SMTPSenderRefused(code, response, sender)
+        refused = {}
+        for recipient in recipients:
+            code, response = connection.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            connection.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, response = connection.docmd('data')
+        if code != 354:
+            connection.rset()
+            raise smtplib.SMTPDataError(code, response)
+        file.seek(0)
+        line = b''
+        for line in file:
+            # Transparencia de SMTP (RFC 5321 4.5.2): las líneas que empiezan con punto se duplican
+            connection.send(b'.' + line if line.startswith(b'.') else line)
+        connection.send(b'.\r\n' if line.endswith(b'\n') else b'\r\n.\r\n')
+        code, response = connection.getreply()
+        if code != 250:
+            connection.rset()
+            raise smtplib.SMTPDataError(code, response)
+        return refused
+
+    def send(self, credentials, recipients, message):
+        """Envía el mensaje (texto MIME o archivo binario abierto) con el usuario de las credenciales como remitente del sobre"""
+        # En bytes para que smtplib no falle con cabeceras o cuerpos no ASCII
+        message = message.encode('utf-8') if isinstance(message, str) else message
+        for retry in (False, True):
+            item = self.get(credentials)
+            try:
+                start = time.perf_counter()
+                if isinstance(message, bytes):
+                    item['connection'].sendmail(credentials.username, recipients, message)
+                else:
+                    self.send_file(item['connection'], credentials.username, recipients, message)
+            except smtplib.SMTPServerDisconnected:
+                # El servidor cerró la conexión reutilizada: se abre otra una sola vez
+                self.discard(credentials)
+                if retry:
+                    raise
+                continue
+            item['messages'] += 1
+            item['last_used'] = time.monotonic()
+            self.metrics['sent'] += 1
+            self.metrics['send_time'] += time.perf_counter() - start
+            return
+
+    def discard(self, credentials):
+        item = self.connections.pop(credentials, None)
+        if item is not None:
+            try:
+                item['connection'].quit()
+            except Exception:
+                item['connection'].close()
+
+    def close_idle(self):
+        now = time.monotonic()
+        for credentials in [key for key, item in self.connections.items() if now - item['last_used'] >= self.idle_timeout]:
+            self.discard(credentials)
+
+    def close(self):
+        for credentials in list(self.connections):
+            self.discard(credentials)
@@ -0,0 +1,110 @@
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Model
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from config import settings
+from core.pos.utilities.pdf_creator import PDFCreator
+
+
+def version_stamp(*sources, exclude=()):
+    """Huella de los datos que se muestran en un PDF: registros (sin los campos de exclude) o filas de consultas values_list"""
+    digest = hashlib.sha256()
+    for source in sources:
+        if source is None:
+            digest.update(b'-')
+        elif isinstance(source, Model):
+            digest.update(repr([(field.attname, getattr(source, field.attname)) for field in source._meta.concrete_fields if field.name not in exclude]).encode('utf-8'))
+        else:
+            digest.update(repr(list(source)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PDFCache:
+    """PDFs generados guardados en el storage con un nombre derivado del comprobante, la plantilla y la huella de sus datos.
+
+    Mientras nada cambie se sirve el mismo archivo; cualquier edición produce otro nombre y el archivo anterior se elimina.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.PDF_CACHE_DIR
+
+    def get_key(self, instance, template_name, version):
+        return hashlib.sha256(f'{instance._meta.label_lower}:{instance.pk}:{template_name}:{version}'.encode('utf-8')).hexdigest()
+
+    def get_prefix(self, instance, template_name):
+        # pdf_cache/pos.invoice/15/invoice-invoice_pdf-
+        return f'{self.path}/{instance._meta.label_lower}/{instance.pk}/{template_name.replace("/", "-").rsplit(".", 1)[0]}-'
+
+    def get_name(self, instance, template_name, version=None):
+        if version is None:
+            version = instance.get_pdf_version()
+        return f'{self.get_prefix(instance, template_name)}{self.get_key(instance, template_name, version)}.pdf'
+
+    def get(self, instance, template_name, context=None, force=False):
+        """Nombre en el storage del PDF vigente; solo se genera si no existe o si force es verdadero"""
+        name = self.get_name(instance, template_name)
+        if default_storage.exists(name):
+            if not force:
+                return name
+            default_storage.delete(name)
+        pdf_file = PDFCreator(template_name=template_name).create(context=context or {'object': instance})
+        stored_name = default_storage.save(name, ContentFile(pdf_file))
+        if stored_name != name:
+            # Otro proceso generó el mismo PDF al mismo tiempo
+            default_storage.delete(stored_name)
+        self.remove_outdated(instance, template_name, name)
+        return name
+
+    def get_content(self, instance, template_name, context=None, force=False):
+        with default_storage.open(self.get(instance, template_name, context, force), 'rb') as file:
+            return file.read()
+
+    def remove_outdated(self, instance, template_name, name):
+        prefix = self.get_prefix(instance, template_name)
+        directory, file_prefix = prefix.rsplit('/', 1)
+        try:
+            file_names = default_storage.listdir(directory)[1]
+        except (FileNotFoundError, NotImplementedError):
+            return
+        for file_name in file_names:
+            path = f'{directory}/{file_name}'
+            if file_name.startswith(file_prefix) and path != name:
+                default_storage.delete(path)
+
+    def clear(self, instance):
+        directory = f'{self.path}/{instance._meta.label_lower}/{instance.pk}'
+        try:
+            file_names = default_storage.listdir(directory)[1]
+        except (FileNotFoundError, NotImplementedError):
+            return
+        for file_name in file_names:
+            default_storage.delete(f'{directory}/{file_name}')
+
+    def serve(self, request, name, filename):
+        """Responde con el PDF guardado; el navegador lo revalida con ETag/Last-Modified y nginx lo entrega si X-Accel-Redirect está configurado"""
+        last_modified = int(default_storage.get_modified_time(name).timestamp())
+        etag = f'"{hashlib.md5(f"{name}:{last_modified}".encode("utf-8")).hexdigest()}"'
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if settings.PDF_CACHE_X_ACCEL_REDIRECT:
+                response = HttpResponse(content_type='application/pdf')
+                response['X-Accel-Redirect'] = f'{settings.PDF_CACHE_X_ACCEL_REDIRECT}{name}'
+            else:
+                response = FileResponse(default_storage.open(name, 'rb'), content_type='application/pdf')
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # El PDF depende de los permisos del usuario: el navegador puede guardarlo pero debe revalidarlo
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def response(self, request, instance, template_name, filename, context=None):
+        return self.serve(request, self.get(instance, template_name, context), filename)
+
+
+pdf_cache = PDFCache()
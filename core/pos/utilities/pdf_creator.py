@@ -1,57 +1,128 @@
 import mimetypes
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 
 import weasyprint
-from crum import get_current_request
-from django.conf import settings
 from django.contrib.staticfiles.finders import find
-from django.core.files.storage import default_storage
+from django.core.exceptions import SuspiciousFileOperation
 from django.template.loader import get_template
-from django.urls import get_script_prefix
 from weasyprint import CSS
 from weasyprint import HTML
+from weasyprint.text.fonts import FontConfiguration
 
 from config import settings
 
+# Las rutas /static/... y /media/... de las plantillas se resuelven como file:///static/... sin pasar por HTTP
+BASE_URL = 'file:///'
 
-class PDFCreator:
-    def __init__(self, template_name):
-        self.template_name = template_name
+
+class AssetCache:
+    """Archivos de static y media leídos del disco; los más usados se guardan en memoria (LRU por ruta y fecha de modificación)"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.files = OrderedDict()
+
+    def get_path(self, url_path):
+        if settings.STATIC_URL and url_path.startswith(settings.STATIC_URL):
+            try:
+                return find(url_path[len(settings.STATIC_URL):])
+            except SuspiciousFileOperation:
+                return None
+        if settings.MEDIA_URL not in ('', '/') and url_path.startswith(settings.MEDIA_URL):
+            media_root = os.path.realpath(settings.MEDIA_ROOT)
+            path = os.path.realpath(os.path.join(media_root, url_path[len(settings.MEDIA_URL):]))
+            if path.startswith(f'{media_root}{os.sep}') and os.path.isfile(path):
+                return path
+        return None
+
+    def read(self, path):
+        key = (path, os.path.getmtime(path))
+        with self.lock:
+            if key in self.files:
+                self.files.move_to_end(key)
+                return self.files[key]
+        with open(path, 'rb') as file:
+            data = file.read()
+        with self.lock:
+            self.files[key] = data
+            while len(self.files) > self.max_size:
+                self.files.popitem(last=False)
+        return data
+
+    def clear(self):
+        with self.lock:
+            self.files.clear()
+
+
+class PDFEngine:
+    """Genera los PDF con WeasyPrint reutilizando por proceso las hojas de estilo ya analizadas y la configuración de fuentes.
+
+    Cada hilo tiene su FontConfiguration y sus CSS porque WeasyPrint no permite compartirlos entre hilos.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.assets = AssetCache(max_size=settings.PDF_ASSET_CACHE_SIZE)
 
     def url_fetcher(self, url, *args, **kwargs):
         if url.startswith('file:'):
-            mime_type, encoding = mimetypes.guess_type(url)
-            url_path = urlparse(url).path
-            data = {
-                'mime_type': mime_type,
-                'encoding': encoding,
-                'filename': Path(url_path).name,
-            }
-
-            default_media_url = settings.MEDIA_URL in ('', get_script_prefix())
-            if not default_media_url and url_path.startswith(settings.MEDIA_URL):
-                media_root = settings.MEDIA_ROOT
-                if isinstance(settings.MEDIA_ROOT, Path):
-                    media_root = f'{settings.MEDIA_ROOT}/'
-                path = url_path.replace(settings.MEDIA_URL, media_root, 1)
-                data['file_obj'] = default_storage.open(path)
-                return data
-
-            elif settings.STATIC_URL and url_path.startswith(settings.STATIC_URL):
-                path = url_path.replace(settings.STATIC_URL, '', 1)
-                data['file_obj'] = open(find(path), 'rb')
-                return data
-
+            url_path = unquote(urlparse(url).path)
+            path = self.assets.get_path(url_path)
+            if path is not None:
+                mime_type, encoding = mimetypes.guess_type(path)
+                return {
+                    'string': self.assets.read(path),
+                    'mime_type': mime_type,
+                    'encoding': encoding,
+                    'filename': Path(path).name,
+                    'redirected_url': url,
+                }
         return weasyprint.default_url_fetcher(url, *args, **kwargs)
 
+    def get_font_config(self):
+        font_config = getattr(self.local, 'font_config', None)
+        if font_config is None:
+            font_config = self.local.font_config = FontConfiguration()
+            self.local.stylesheets = {}
+        return font_config
+
+    def get_stylesheet(self, path):
+        font_config = self.get_font_config()
+        full_path = find(path)
+        if full_path is None:
+            raise FileNotFoundError(f'No existe la hoja de estilos {path}')
+        key = (full_path, os.path.getmtime(full_path))
+        stylesheet = self.local.stylesheets.get(key)
+        if stylesheet is None:
+            stylesheet = CSS(url=f'{BASE_URL}{settings.STATIC_URL.lstrip("/")}{path}', url_fetcher=self.url_fetcher, font_config=font_config)
+            self.local.stylesheets[key] = stylesheet
+        return stylesheet
+
+    def get_stylesheets(self, template_name):
+        paths = settings.PDF_STYLESHEETS.get(template_name, settings.PDF_STYLESHEETS['default'])
+        return [self.get_stylesheet(path) for path in paths]
+
+    def render(self, template_name, context):
+        html_template = get_template(template_name).render(context)
+        html = HTML(string=html_template, base_url=BASE_URL, url_fetcher=self.url_fetcher)
+        return html.write_pdf(stylesheets=self.get_stylesheets(template_name), font_config=self.get_font_config(), presentational_hints=True)
+
+    def clear(self):
+        self.local = threading.local()
+        self.assets.clear()
+
+
+pdf_engine = PDFEngine()
+
+
+class PDFCreator:
+    def __init__(self, template_name):
+        self.template_name = template_name
+
     def create(self, context):
-        request = get_current_request()
-        template = get_template(self.template_name)
-        html_template = template.render(context).encode(encoding="UTF-8")
-        if request is not None:
-            pdf_file = HTML(string=html_template, base_url=request.build_absolute_uri()).write_pdf(presentational_hints=True)
-        else:
-            path_css = f'{settings.BASE_DIR}{settings.STATIC_URL}lib/bootstrap-4.6.0/css/bootstrap.min.css'
-            pdf_file = HTML(string=html_template, base_url='.', url_fetcher=self.url_fetcher).write_pdf(stylesheets=[CSS(path_css)], presentational_hints=True)
-        return pdf_file
+        return pdf_engine.render(template_name=self.template_name, context=context)
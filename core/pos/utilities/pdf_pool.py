@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import time
+
+from config import settings
+
+# Plantillas que cada proceso carga al iniciar junto con sus hojas de estilo
+PDF_TEMPLATES = ['invoice/invoice_pdf.html', 'invoice/ticket_pdf.html', 'credit_note/invoice_pdf.html', 'quotation/invoice_pdf.html']
+
+
+def init_worker(templates):
+    import django
+
+    django.setup()
+    from django.template.loader import get_template
+
+    from core.pos.utilities.pdf_creator import pdf_engine
+
+    for template_name in templates:
+        get_template(template_name)
+        pdf_engine.get_stylesheets(template_name)
+
+
+def render_job(job):
+    """job: (plantilla, 'app.modelo', id, authorized). Con authorized reemplaza authorized_pdf; si no, deja el PDF en la caché"""
+    from django.apps import apps
+
+    from core.pos.utilities.pdf_cache import pdf_cache
+
+    template_name, label, pk, authorized, force = job
+    start = time.perf_counter()
+    try:
+        model = apps.get_model(label)
+        instance = model.objects.get(pk=pk)
+        if authorized:
+            name = instance.update_authorized_pdf(force=force)
+        else:
+            name = pdf_cache.get(instance, template_name, force=force)
+        return {'label': label, 'pk': pk, 'name': name, 'error': None, 'time': time.perf_counter() - start}
+    except Exception as e:
+        return {'label': label, 'pk': pk, 'name': None, 'error': str(e), 'time': time.perf_counter() - start}
+
+
+class PDFRenderPool:
+    """Procesos que generan PDF en paralelo: WeasyPrint ocupa un núcleo completo por documento y no libera el GIL.
+
+    Se usa spawn para que cada proceso abra su propia conexión a la base de datos en lugar de heredar la del padre.
+    """
+
+    def __init__(self, processes=None, templates=None):
+        self.processes = processes or settings.PDF_POOL_PROCESSES or os.cpu_count() or 1
+        self.templates = templates or PDF_TEMPLATES
+        self.pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        if self.pool is None:
+            context = multiprocessing.get_context('spawn')
+            self.pool = context.Pool(processes=self.processes, initializer=init_worker, initargs=(self.templates,))
+
+    def render(self, jobs, chunksize=4):
+        """Devuelve los resultados a medida que terminan, en cualquier orden"""
+        self.start()
+        return self.pool.imap_unordered(render_job, jobs, chunksize=chunksize)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    @staticmethod
+    def create_job(instance, template_name=None, authorized=False, force=False):
+        return template_name or instance.receipt_template_name, instance._meta.label_lower, instance.pk, authorized, force
@@ -0,0 +1,102 @@
+import hashlib
+import multiprocessing
+import os
+from io import BytesIO
+
+import barcode
+from barcode.writer import ImageWriter
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from config import settings
+
+
+def render_barcode(code):
+    image_io = BytesIO()
+    barcode.Gs1_128(code, writer=ImageWriter()).write(image_io)
+    return image_io.getvalue()
+
+
+def render_job(job):
+    """job: (nombre, código). Devuelve el PNG o None si el código no se puede representar"""
+    name, code = job
+    try:
+        return name, render_barcode(code)
+    except Exception:
+        return name, None
+
+
+class ProductBarcodeCache:
+    """Código de barras GS1-128 de cada producto. El archivo se nombra a partir del código:
+    se dibuja una sola vez por código y la referencia del producto se actualiza al guardarlo o importarlo.
+    """
+
+    def __init__(self, path=None, processes=None, pool_threshold=None):
+        self.path = path or settings.PRODUCT_BARCODE_DIR
+        self.processes = processes or settings.PRODUCT_BARCODE_PROCESSES or os.cpu_count() or 1
+        self.pool_threshold = pool_threshold or settings.PRODUCT_BARCODE_POOL_THRESHOLD
+
+    def get_name(self, product):
+        digest = hashlib.sha1(product.code.encode('utf-8')).hexdigest()
+        return f'{self.path}/{product.company_id or 0}/{digest}.png'
+
+    def is_current(self, product):
+        return product.barcode.name == self.get_name(product)
+
+    def save(self, name, image):
+        stored_name = default_storage.save(name, ContentFile(image))
+        if stored_name != name:
+            # Otro proceso guardó el mismo código de barras al mismo tiempo
+            default_storage.delete(stored_name)
+
+    def get(self, product):
+        """Nombre del PNG del código actual del producto o None si todavía no se dibujó; no escribe en la base de datos"""
+        if not product.code:
+            return None
+        if self.is_current(product):
+            return product.barcode.name
+        name = self.get_name(product)
+        return name if default_storage.exists(name) else None
+
+    def render(self, jobs, pool=True):
+        if pool and len(jobs) >= self.pool_threshold and self.processes > 1:
+            # Dibujar el PNG ocupa la CPU y no libera el GIL
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(processes=self.processes) as pool:
+                return pool.map(render_job, jobs, chunksize=16)
+        return [render_job(job) for job in jobs]
+
+    def render_missing(self, products, pool=False):
+        """Dibuja los PNG que aún no existen; devuelve [(producto, nombre)] de los productos con la referencia desactualizada.
+        Sin pool se dibujan en el mismo proceso, como en el listado de productos.
+        """
+        stale, jobs = [], {}
+        for product in products:
+            if not product.code or self.is_current(product):
+                continue
+            name = self.get_name(product)
+            stale.append((product, name))
+            if name not in jobs and not default_storage.exists(name):
+                jobs[name] = product.code
+        failed = set()
+        for name, image in self.render(list(jobs.items()), pool=pool):
+            if image is None:
+                failed.add(name)
+            else:
+                self.save(name, image)
+        return [(product, name) for product, name in stale if name not in failed]
+
+    def render_products(self, products):
+        """Genera en bloque los códigos de barras pendientes de varios productos y actualiza su referencia,
+        p. ej. después de guardarlos o de una importación"""
+        updated = []
+        for product, name in self.render_missing([product for product in products if product.pk], pool=True):
+            product.barcode = name
+            updated.append(product)
+        if updated:
+            # Sin pasar por save: solo cambia la referencia al archivo
+            type(updated[0]).objects.bulk_update(updated, ['barcode'], batch_size=500)
+        return len(updated)
+
+
+product_barcodes = ProductBarcodeCache()
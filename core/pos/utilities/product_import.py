@@ -0,0 +1,145 @@
+from decimal import Decimal
+
+import pandas as pd
+from django.db import transaction
+
+from config import settings
+
+COLUMNS = {
+    'Código': 'code',
+    'Nombre': 'name',
+    'Categoría': 'category',
+    'Precio de Compra': 'price',
+    'Precio de Venta': 'pvp',
+    'Stock': 'stock',
+    '¿Es inventariado?': 'is_inventoried',
+    '¿Se cobra impuesto?': 'has_tax',
+}
+BOOLEANS = {
+    'true': True, 'verdadero': True, 'si': True, 'sí': True, '1': True, '1.0': True,
+    'false': False, 'falso': False, 'no': False, '0': False, '0.0': False,
+}
+# Máximo de Product.price y Product.pvp (max_digits=9, decimal_places=4)
+MAX_PRICE = 10 ** 5
+
+
+class ProductImportEngine:
+    """Importa productos desde el excel de `product_export_excel`: valida la hoja completa con pandas,
+    crea las categorías que falten y actualiza o crea los productos por bloques con un solo INSERT ... ON CONFLICT.
+    """
+    update_fields = ['name', 'category', 'price', 'pvp', 'is_inventoried', 'has_tax']
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+
+    def read(self, file):
+        df = pd.read_excel(file, engine='openpyxl', dtype={'Código': str})
+        missing = [column for column in COLUMNS if column not in df.columns]
+        if missing:
+            raise ValueError(f'Faltan las columnas: {", ".join(missing)}')
+        df = df[list(COLUMNS)].rename(columns=COLUMNS)
+        # Número de fila en el excel (la fila 1 es la cabecera)
+        df.index = df.index + 2
+        return df
+
+    def to_text(self, series):
+        return series.fillna('').astype(str).str.strip()
+
+    def to_boolean(self, series):
+        return self.to_text(series).str.lower().map(BOOLEANS)
+
+    def validate(self, df):
+        """Devuelve las filas válidas normalizadas y la lista de errores por fila: [{'row', 'code', 'errors'}]"""
+        data = pd.DataFrame(index=df.index)
+        for column in ['code', 'name', 'category']:
+            data[column] = self.to_text(df[column])
+        for column in ['price', 'pvp', 'stock']:
+            data[column] = pd.to_numeric(df[column], errors='coerce')
+        for column in ['is_inventoried', 'has_tax']:
+            data[column] = self.to_boolean(df[column])
+        checks = {
+            'El código es obligatorio': data['code'] == '',
+            'El código supera los 50 caracteres': data['code'].str.len() > 50,
+            'El nombre es obligatorio': data['name'] == '',
+            'El nombre supera los 150 caracteres': data['name'].str.len() > 150,
+            'La categoría es obligatoria': data['category'] == '',
+            'La categoría supera los 50 caracteres': data['category'].str.len() > 50,
+            'El precio de compra debe ser un número mayor o igual a 0': ~data['price'].between(0, MAX_PRICE, inclusive='left'),
+            'El precio de venta debe ser un número mayor o igual a 0': ~data['pvp'].between(0, MAX_PRICE, inclusive='left'),
+            'El stock debe ser un número entero mayor o igual a 0': ~((data['stock'] >= 0) & (data['stock'] % 1 == 0)),
+            '¿Es inventariado? debe ser Verdadero o Falso': data['is_inventoried'].isna(),
+            '¿Se cobra impuesto? debe ser Verdadero o Falso': data['has_tax'].isna(),
+            # Con códigos repetidos se importa la última fila
+            'El código se repite más abajo en el archivo': (data['code'] != '') & data['code'].duplicated(keep='last'),
+        }
+        invalid = pd.DataFrame(checks)
+        rows = invalid.any(axis=1)
+        errors = [
+            {'row': int(row), 'code': data.at[row, 'code'], 'errors': [message for message, failed in flags.items() if failed]}
+            for row, flags in invalid[rows].iterrows()
+        ]
+        data = data[~rows].copy()
+        data['stock'] = data['stock'].astype(int)
+        return data, errors
+
+    def get_categories(self, company, names):
+        """{nombre: id} de las categorías de la compañía; las que no existen se crean en un solo INSERT"""
+        from core.pos.models import Category
+
+        categories = dict(Category.objects.filter(company=company, name__in=names).values_list('name', 'id'))
+        missing = [Category(company=company, name=name) for name in names if name not in categories]
+        if missing:
+            Category.objects.bulk_create(missing, ignore_conflicts=True)
+            categories = dict(Category.objects.filter(company=company, name__in=names).values_list('name', 'id'))
+        return categories
+
+    def import_chunk(self, company, data, categories, **kwargs):
+        from core.pos.models import Product, StockMovement
+
+        codes = data['code'].tolist()
+        with transaction.atomic():
+            existing = set(Product.objects.filter(company=company, code__in=codes).values_list('code', flat=True))
+            products = [
+                Product(
+                    company=company,
+                    code=row.code,
+                    name=row.name,
+                    category_id=categories[row.category],
+                    price=Decimal(f'{row.price:.4f}'),
+                    pvp=Decimal(f'{row.pvp:.4f}'),
+                    is_inventoried=bool(row.is_inventoried),
+                    has_tax=bool(row.has_tax),
+                )
+                for row in data.itertuples()
+            ]
+            Product.objects.bulk_create(products, update_conflicts=True, unique_fields=['company', 'code'], update_fields=self.update_fields)
+            products = list(Product.objects.filter(company=company, code__in=codes).only('id', 'company_id', 'code', 'barcode'))
+            # El stock del archivo entra al kárdex como ajuste
+            stock = dict(zip(data['code'], data['stock']))
+            StockMovement.adjust({product.id: stock[product.code] for product in products}, **kwargs)
+        return products, len(existing)
+
+    def run(self, company, file, progress=None, **kwargs):
+        """Importa el archivo; progress(resultado) se llama al validar la hoja y después de cada bloque"""
+        from core.pos.utilities.product_barcode import product_barcodes
+
+        data, errors = self.validate(self.read(file))
+        result = {'total': len(data), 'processed': 0, 'created': 0, 'updated': 0, 'errors': errors}
+        if progress:
+            progress(result)
+        categories = self.get_categories(company, data['category'].unique().tolist())
+        products = []
+        for start in range(0, len(data), self.batch_size):
+            chunk = data.iloc[start:start + self.batch_size]
+            chunk_products, existing = self.import_chunk(company, chunk, categories, **kwargs)
+            products += chunk_products
+            result['processed'] += len(chunk)
+            result['updated'] += existing
+            result['created'] += len(chunk) - existing
+            if progress:
+                progress(result)
+        product_barcodes.render_products(products)
+        return result
+
+
+product_importer = ProductImportEngine()
@@ -0,0 +1,39 @@
+class PrometheusText:
+    """Métricas en el formato de exposición de texto de Prometheus (text/plain; version=0.0.4)."""
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self.lines = []
+
+    def escape(self, value):
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+    def format_labels(self, labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{name}="{self.escape(value)}"' for name, value in labels.items()) + '}'
+
+    def format_value(self, value):
+        if value is None:
+            return 'NaN'
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def add(self, name, kind, description, samples):
+        """samples: lista de (sufijo, etiquetas, valor); el sufijo es '_bucket', '_sum', '_count' o ''"""
+        self.lines.append(f'# HELP {name} {description}')
+        self.lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            self.lines.append(f'{name}{suffix}{self.format_labels(labels)} {self.format_value(value)}')
+
+    def get_histogram_samples(self, labels, buckets, total, count):
+        # buckets: {límite: observaciones <= límite} ya acumulados
+        samples = [('_bucket', {**labels, 'le': str(bucket)}, value) for bucket, value in buckets.items()]
+        samples.append(('_bucket', {**labels, 'le': '+Inf'}, count))
+        samples.append(('_sum', labels, total))
+        samples.append(('_count', labels, count))
+        return samples
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
@@ -0,0 +1,54 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Limita a `rate` operaciones por segundo permitiendo ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def get_wait_time(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        waited = 0
+        if self.rate <= 0:
+            return waited
+        while True:
+            with self.lock:
+                wait = self.get_wait_time()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+    """Un TokenBucket por clave (p. ej. la compañía emisora), creado a demanda."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, key):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(rate=self.rate, capacity=self.capacity)
+        return bucket
+
+    def acquire(self, key):
+        return self.get_bucket(key).acquire()
@@ -0,0 +1,47 @@
+import threading
+from collections import deque
+
+from django.db import transaction
+
+from config import settings
+
+
+class ReceiptSequenceAllocator:
+    """Entrega los secuenciales de los comprobantes; con bloques mayores a 1 el proceso reserva varios por cada acceso a la fila Receipt."""
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.blocks = {}
+
+    def get_block_size(self):
+        return max(self.block_size or settings.RECEIPT_SEQUENCE_BLOCK_SIZE, 1)
+
+    def release(self, receipt_id, numbers):
+        with self.lock:
+            self.blocks.setdefault(receipt_id, deque()).extend(numbers)
+
+    def allocate(self, receipt, count=1):
+        """Devuelve una lista con count secuenciales reservados para el comprobante"""
+        numbers = []
+        with self.lock:
+            block = self.blocks.get(receipt.pk)
+            while block and len(numbers) < count:
+                numbers.append(block.popleft())
+        missing = count - len(numbers)
+        if missing:
+            reserved = max(missing, self.get_block_size())
+            start = receipt.allocate_sequence(count=reserved)
+            numbers.extend(range(start, start + missing))
+            if reserved > missing:
+                # El resto del bloque solo se comparte cuando la reserva se confirma; si la transacción se revierte
+                # la fila vuelve a su valor y esos números no pueden entregarse
+                transaction.on_commit(lambda: self.release(receipt.pk, range(start + missing, start + reserved)))
+        return numbers
+
+    def clear(self):
+        with self.lock:
+            self.blocks = {}
+
+
+receipt_sequences = ReceiptSequenceAllocator()
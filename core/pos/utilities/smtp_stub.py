@@ -0,0 +1,135 @@
+import base64
+import socketserver
+import threading
+import time
+from collections import Counter
+
+# Los destinatarios de este dominio se rechazan con 550 para probar los errores permanentes
+REJECTED_DOMAIN = 'rechazado.invalid'
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def read_line(self):
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError
+        return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def authenticate(self, arguments):
+        mechanism, _, initial = arguments.partition(' ')
+        if mechanism.upper() == 'PLAIN':
+            if not initial:
+                self.reply('334 ')
+                initial = self.read_line()
+            _, username, password = base64.b64decode(initial).decode('utf-8').split('\0')
+        elif mechanism.upper() == 'LOGIN':
+            self.reply(f'334 {base64.b64encode(b"Username:").decode()}')
+            username = base64.b64decode(self.read_line()).decode('utf-8')
+            self.reply(f'334 {base64.b64encode(b"Password:").decode()}')
+            password = base64.b64decode(self.read_line()).decode('utf-8')
+        else:
+            self.reply('504 Mecanismo no soportado')
+            return
+        if self.server.accounts is not None and self.server.accounts.get(username) != password:
+            self.reply('535 Credenciales invalidas')
+            return
+        self.server.count('logins')
+        self.reply('235 Autenticado')
+
+    def handle(self):
+        self.server.count('connections')
+        self.reply('220 smtp-stub ESMTP')
+        sender, recipients, messages = None, [], 0
+        try:
+            while True:
+                line = self.read_line()
+                command, _, arguments = line.partition(' ')
+                command = command.upper()
+                if command == 'EHLO':
+                    self.wfile.write(b'250-smtp-stub\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+                elif command == 'HELO':
+                    self.reply('250 smtp-stub')
+                elif command == 'AUTH':
+                    self.authenticate(arguments)
+                elif command == 'MAIL':
+                    sender, recipients = arguments.split(':', 1)[1].strip().split(' ')[0].strip('<>'), []
+                    self.reply('250 OK')
+                elif command == 'RCPT':
+                    recipient = arguments.split(':', 1)[1].strip().strip('<>')
+                    if recipient.endswith(f'@{REJECTED_DOMAIN}'):
+                        self.reply('550 Buzon inexistente')
+                    else:
+                        recipients.append(recipient)
+                        self.reply('250 OK')
+                elif command == 'DATA':
+                    self.reply('354 Termine con <CRLF>.<CRLF>')
+                    data = []
+                    while True:
+                        chunk = self.rfile.readline()
+                        if chunk in (b'.\r\n', b'.\n', b''):
+                            break
+                        data.append(chunk[1:] if chunk.startswith(b'..') else chunk)
+                    if self.server.delay:
+                        time.sleep(self.server.delay)
+                    self.server.store(sender, recipients, b''.join(data))
+                    messages += 1
+                    self.reply('250 Mensaje aceptado')
+                    if self.server.messages_per_connection and messages >= self.server.messages_per_connection:
+                        # Simula un servidor que corta la conexión tras cierta cantidad de mensajes
+                        return
+                elif command == 'RSET':
+                    sender, recipients = None, []
+                    self.reply('250 OK')
+                elif command == 'NOOP':
+                    self.reply('250 OK')
+                elif command == 'QUIT':
+                    self.reply('221 Adios')
+                    return
+                else:
+                    self.reply('502 Comando no implementado')
+        except (ConnectionError, OSError):
+            return
+
+
+class SMTPStubServer(socketserver.ThreadingTCPServer):
+    """Servidor SMTP local sin TLS que acepta los mensajes y los guarda en memoria, para pruebas del envío de correos."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 2525), accounts=None, delay=0, messages_per_connection=0, verbose=False):
+        super().__init__(address, SMTPStubHandler)
+        self.accounts = accounts
+        self.delay = delay
+        self.messages_per_connection = messages_per_connection
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.messages = []
+        self.metrics = Counter()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, name):
+        with self.lock:
+            self.metrics[name] += 1
+
+    def store(self, sender, recipients, data):
+        with self.lock:
+            self.messages.append({'sender': sender, 'recipients': recipients, 'data': data})
+            self.metrics['messages'] += 1
+        if self.verbose:
+            print(f'{sender} -> {", ".join(recipients)} ({len(data)} bytes)')
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -1,20 +1,22 @@
 import base64
 import os.path
-import random
+import secrets
 import string
 import subprocess
-from datetime import datetime
-from itertools import cycle
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
 import requests
-from django.core.files import File
+from django.core.files.base import ContentFile
 from lxml import etree
-from suds.client import Client
 
 from config import settings
 from core.pos.choices import VOUCHER_STAGE, INVOICE_STATUS
+from core.pos.utilities import access_key as access_keys
+from core.pos.utilities.circuit_breaker import CircuitOpenError, sri_breaker
+from core.pos.utilities.sri_client import is_unreachable, sri_clients
+from core.pos.utilities.xades import signer_cache
+from core.pos.utilities.xsd import schema_cache
 
 
 class SRI:
@@ -27,41 +29,58 @@ class SRI:
     def compute_mod11(self, pass_key_48=''):
         if len(pass_key_48) > 48:
             return ''
-        addition = 0
-        factors = cycle((2, 3, 4, 5, 6, 7))
-        for digit, factor in zip(reversed(pass_key_48), factors):
-            addition += int(digit) * factor
-        number = 11 - addition % 11
-        if number == 11:
-            number = 0
-        elif number == 10:
-            number = 1
-        return str(number)
+        digits = access_keys.text_to_digits(pass_key_48.rjust(48, '0'), 48, 'clave de acceso')
+        return str(access_keys.compute_mod11(digits)[0])
 
     def generate_number(self, amount=8):
-        return ''.join(random.choices(list(string.digits), k=amount))
+        return ''.join(secrets.choice(string.digits) for _ in range(amount))
 
-    def create_access_key(self, instance):
-        password_48 = f"{datetime.now().strftime('%d%m%Y')}{instance.receipt.voucher_type}{instance.company.ruc}{instance.company.environment_type}{instance.receipt.establishment_code}{instance.receipt.issuing_point_code}{instance.receipt_number}{self.generate_number()}{instance.company.emission_type}"
-        module11 = self.compute_mod11(pass_key_48=password_48)
-        if len(module11):
-            return f'{password_48}{module11}'
-        return None
+    def create_access_key(self, instance, reuse=True):
+        access_key = access_keys.create_access_keys(
+            issue_dates=instance.get_issue_date(),
+            voucher_type=instance.receipt.voucher_type,
+            ruc=instance.company.ruc,
+            environment_type=instance.company.environment_type,
+            establishment_code=instance.receipt.establishment_code,
+            issuing_point_code=instance.receipt.issuing_point_code,
+            sequences=[int(instance.receipt_number)],
+            emission_type=instance.company.emission_type,
+        )[0]
+        # Reenviar un comprobante con su misma clave evita que el SRI lo registre dos veces con el mismo secuencial
+        if reuse and access_keys.is_same_voucher(instance.access_code, access_key):
+            return instance.access_code
+        return access_key
 
     def get_receipt_url(self, instance):
-        if instance.company.environment_type == 2:
-            return 'https://cel.sri.gob.ec/comprobantes-electronicos-ws/RecepcionComprobantesOffline?wsdl'
-        return 'https://celcer.sri.gob.ec/comprobantes-electronicos-ws/RecepcionComprobantesOffline?wsdl'
+        return sri_clients.get_url('receipt', instance.company.environment_type)
 
     def get_authorization_url(self, instance):
-        if instance.company.environment_type == 2:
-            return 'https://cel.sri.gob.ec/comprobantes-electronicos-ws/AutorizacionComprobantesOffline?wsdl'
-        return 'https://celcer.sri.gob.ec/comprobantes-electronicos-ws/AutorizacionComprobantesOffline?wsdl'
+        return sri_clients.get_url('authorization', instance.company.environment_type)
+
+    def call_service(self, service, environment_type, operation, *args):
+        # La descarga del WSDL también pasa por el circuit breaker: es lo primero que falla con el SRI caído
+        def call():
+            return getattr(sri_clients.get_client(service, environment_type).service, operation)(*args)
+
+        return sri_breaker.call(service, environment_type, call)
+
+    def validate_xml_schema(self, instance, xml, access_code=None):
+        response = {'resp': True, 'stage': VOUCHER_STAGE[0][0]}
+        errors = schema_cache.validate(xml)
+        if errors:
+            response = {'resp': False, 'stage': VOUCHER_STAGE[0][0], 'error': {'access_code': access_code or instance.access_code, 'errors': errors}}
+        return response
 
     def create_xml(self, instance):
         response = {'resp': False, 'stage': VOUCHER_STAGE[1][0]}
         try:
             xml, access_code = instance.create_xml_document()
+            if settings.ELECTRONIC_BILLING_VALIDATE_SCHEMA:
+                # Un comprobante mal formado se descarta antes de gastar la firma y el envío al SRI
+                validation = self.validate_xml_schema(instance=instance, xml=xml, access_code=access_code)
+                if not validation['resp']:
+                    response = validation
+                    return response
             instance.access_code = access_code
             instance.save()
             response['resp'] = True
@@ -73,12 +92,11 @@ class SRI:
                 instance.create_receipt_error(errors=response)
         return response
 
-    def firm_xml(self, instance, xml):
-        response = {'resp': False, 'stage': VOUCHER_STAGE[1][0]}
+    def sign_xml_with_jar(self, instance, xml):
         file_temp_name = ''
         try:
             with NamedTemporaryFile(suffix='.xml', delete=False) as file_temp:
-                file_temp.write(xml.encode())
+                file_temp.write(xml if isinstance(xml, bytes) else xml.encode())
                 file_temp.flush()
                 file_temp_name = file_temp.name
                 jar_path = self.get_absolute_path(os.path.join(os.path.dirname(self.base_dir), 'files/jar/sri.jar'))
@@ -87,24 +105,34 @@ class SRI:
                 xml_name = f'{instance.receipt_number}.xml'
                 commands = ['java', '-jar', jar_path, certificate_path, certificate_key, file_temp.name, self.base_dir, xml_name]
                 procedure = subprocess.run(args=commands, capture_output=True)
-                if procedure.returncode == 0:
-                    error = procedure.stdout.decode('utf-8')
-                    if error.__contains__('Error'):
-                        response['error'] = error
-                    else:
-                        generated_xml_path = os.path.join(self.base_dir, xml_name)
-                        with open(generated_xml_path, 'rb') as file:
-                            response['resp'] = True
-                            response['xml'] = file.read().decode('utf-8')
-                        if os.path.exists(generated_xml_path):
-                            os.remove(generated_xml_path)
-                else:
-                    response['error'] = procedure.stderr.decode('utf-8')
-        except Exception as e:
-            response['error'] = str(e)
+                if procedure.returncode != 0:
+                    raise Exception(procedure.stderr.decode('utf-8'))
+                error = procedure.stdout.decode('utf-8')
+                if error.__contains__('Error'):
+                    raise Exception(error)
+                generated_xml_path = os.path.join(self.base_dir, xml_name)
+                with open(generated_xml_path, 'rb') as file:
+                    signed_xml = file.read().decode('utf-8')
+                if os.path.exists(generated_xml_path):
+                    os.remove(generated_xml_path)
+                return signed_xml
         finally:
             if os.path.exists(file_temp_name):
                 os.remove(file_temp_name)
+
+    def sign_xml(self, instance, xml):
+        if settings.SRI_SIGNER == 'jar':
+            return self.sign_xml_with_jar(instance=instance, xml=xml)
+        return signer_cache.get(instance.company).sign(xml).decode('utf-8')
+
+    def firm_xml(self, instance, xml):
+        response = {'resp': False, 'stage': VOUCHER_STAGE[1][0]}
+        try:
+            response['xml'] = self.sign_xml(instance=instance, xml=xml)
+            response['resp'] = True
+        except Exception as e:
+            response['error'] = str(e)
+        finally:
             if 'error' in response:
                 instance.create_receipt_error(errors=response)
         return response
@@ -114,82 +142,184 @@ class SRI:
         try:
             document = xml.strip().encode('utf-8')
             base64_binary_xml = base64.b64encode(document).decode('utf-8')
-            sri_client = Client(self.get_receipt_url(instance))
-            result = sri_client.service.validarComprobante(base64_binary_xml)
+            result = self.call_service('receipt', instance.company.environment_type, 'validarComprobante', base64_binary_xml)
             status = result.estado
             if status == 'DEVUELTA':
                 receipt = result.comprobantes.comprobante[0]
-                response['error'] = {'access_code': receipt.claveAcceso, 'errors': []}
-                for count, value in enumerate(receipt.mensajes):
-                    message = value[1][count]
-                    values = dict()
-                    for name in ['identificador', 'informacionAdicional', 'mensaje', 'tipo']:
-                        if name in message:
-                            values[name] = message[name]
-                    response['error']['errors'].append(values)
+                response['error'] = {'access_code': receipt.claveAcceso, 'errors': self.get_messages(receipt)}
             elif status == 'RECIBIDA':
                 response['resp'] = True
                 response['xml'] = xml
+        except CircuitOpenError as e:
+            # Sin llamar al SRI no hay nada que registrar como error del comprobante
+            response['error'] = str(e)
+            response['circuit_open'] = True
         except Exception as e:
             response['error'] = str(e)
+            # Solo sin respuesta del SRI (red, timeout, WSDL inaccesible) el comprobante puede emitirse en contingencia;
+            # un SOAP fault o una respuesta inesperada se registra como error y consume intentos
+            if is_unreachable(e):
+                response['unreachable'] = True
         finally:
-            if 'error' in response:
+            if 'error' in response and not self.is_unavailable(response):
                 instance.create_receipt_error(errors=response)
         return response
 
+    def is_unavailable(self, response):
+        # El SRI no respondió: se deja en cola en lugar de tratarlo como rechazado. En la autorización el comprobante
+        # ya fue recibido, así que se espera al SRI aunque la emisión en contingencia esté desactivada
+        if response.get('circuit_open'):
+            return True
+        if response.get('unreachable', False):
+            return settings.ELECTRONIC_BILLING_OFFLINE or response.get('stage') == VOUCHER_STAGE[3][0]
+        return False
+
+    def get_messages(self, receipt):
+        errors = []
+        for count, value in enumerate(getattr(receipt, 'mensajes', None) or []):
+            message = value[1][count]
+            values = dict()
+            for name in ['identificador', 'informacionAdicional', 'mensaje', 'tipo']:
+                if name in message:
+                    values[name] = message[name]
+            errors.append(values)
+        return errors
+
+    def save_authorization(self, instance, receipt):
+        xml_authorization = etree.Element('autorizacion')
+        etree.SubElement(xml_authorization, 'estado').text = receipt.estado
+        etree.SubElement(xml_authorization, 'numeroAutorizacion').text = receipt.numeroAutorizacion
+        etree.SubElement(xml_authorization, 'fechaAutorizacion', attrib={'class': "fechaAutorizacion"}).text = str(receipt.fechaAutorizacion.strftime("%d/%m/%Y %H:%M:%S"))
+        voucher_sri = etree.SubElement(xml_authorization, 'comprobante')
+        voucher_sri.text = etree.CDATA(receipt.comprobante)
+        xml_text = etree.tostring(xml_authorization, encoding="utf8", xml_declaration=True).decode('utf8').replace("'", '"')
+        # El almacenamiento de comprobantes nombra el archivo por su contenido (ver voucher_storage)
+        xml_path = f'{instance.receipt.get_name_file()}-{instance.receipt_number_full}.xml'
+        instance.authorized_xml.save(name=xml_path, content=ContentFile(xml_text.encode()), save=False)
+        instance.authorized_date = receipt.fechaAutorizacion
+        # Generar y adjuntar PDF autorizado inmediatamente
+        try:
+            instance.create_authorized_pdf()
+        except Exception:
+            pass
+        instance.status = INVOICE_STATUS[1][0]
+        instance.save()
+
+    def get_authorization_response(self, instance, receipt):
+        response = {'resp': False, 'stage': VOUCHER_STAGE[3][0]}
+        if receipt.estado == 'NO AUTORIZADO':
+            response['error'] = {'access_code': instance.access_code, 'stage': receipt.estado, 'authorized_date': str(receipt.fechaAutorizacion), 'errors': self.get_messages(receipt)}
+        else:
+            self.save_authorization(instance=instance, receipt=receipt)
+            response['resp'] = True
+        return response
+
     def authorize_xml(self, instance):
         response = {'resp': False, 'stage': VOUCHER_STAGE[3][0]}
         try:
-            sri_client = Client(self.get_authorization_url(instance))
-            result = sri_client.service.autorizacionComprobante(instance.access_code)
-            if len(result):
-                receipt = result[2].autorizacion[0]
-                if receipt.estado == 'NO AUTORIZADO':
-                    response['error'] = {'access_code': instance.access_code, 'stage': receipt.estado, 'authorized_date': str(receipt.fechaAutorizacion), 'errors': []}
-                    for count, value in enumerate(receipt.mensajes):
-                        message = value[1][count]
-                        values = dict()
-                        for name in ['identificador', 'informacionAdicional', 'mensaje', 'tipo']:
-                            if name in message:
-                                values[name] = message[name]
-                        response['error']['errors'].append(values)
-                else:
-                    xml_authorization = etree.Element('autorizacion')
-                    etree.SubElement(xml_authorization, 'estado').text = receipt.estado
-                    etree.SubElement(xml_authorization, 'numeroAutorizacion').text = receipt.numeroAutorizacion
-                    etree.SubElement(xml_authorization, 'fechaAutorizacion', attrib={'class': "fechaAutorizacion"}).text = str(receipt.fechaAutorizacion.strftime("%d/%m/%Y %H:%M:%S"))
-                    voucher_sri = etree.SubElement(xml_authorization, 'comprobante')
-                    voucher_sri.text = etree.CDATA(receipt.comprobante)
-                    xml_text = etree.tostring(xml_authorization, encoding="utf8", xml_declaration=True).decode('utf8').replace("'", '"')
-                    with NamedTemporaryFile(delete=True) as file_temp:
-                        xml_path = f'xml/{instance.receipt.get_name_file()}-{instance.receipt_number_full}.xml'
-                        file_temp.write(xml_text.encode())
-                        file_temp.flush()
-                        instance.authorized_xml.save(name=xml_path, content=File(file_temp))
-                        instance.authorized_date = receipt.fechaAutorizacion
-                        # Generar y adjuntar PDF autorizado inmediatamente
-                        try:
-                            instance.create_authorized_pdf()
-                        except Exception:
-                            pass
-                        instance.status = INVOICE_STATUS[1][0]
-                        instance.save()
-                        response['resp'] = True
+            result = self.call_service('authorization', instance.company.environment_type, 'autorizacionComprobante', instance.access_code)
+            receipts = result[2].autorizacion if len(result) and result[2] else []
+            # Un comprobante reenviado puede tener varias respuestas, prevalece la autorizada
+            receipt = next((item for item in receipts if item.estado == 'AUTORIZADO'), receipts[0] if receipts else None)
+            if receipt is None or receipt.estado == 'EN PROCESO':
+                # Aún sin respuesta final: no es un error, se vuelve a consultar más tarde
+                response['pending'] = True
+            else:
+                response = self.get_authorization_response(instance=instance, receipt=receipt)
+        except CircuitOpenError as e:
+            response['error'] = str(e)
+            response['circuit_open'] = True
         except Exception as e:
             response['error'] = str(e)
+            # El SRI ya tiene el comprobante: sin respuesta solo queda volver a consultar cuando se recupere
+            if is_unreachable(e):
+                response['unreachable'] = True
         finally:
-            if 'error' in response:
+            if 'error' in response and not self.is_unavailable(response):
                 instance.create_receipt_error(errors=response)
         return response
 
+    def create_batch_xml(self, access_code, ruc, xmls):
+        # Solo se firma cada comprobante; el lote es un contenedor sin firma propia
+        batch = etree.Element('lote', version='1.0.0')
+        etree.SubElement(batch, 'claveAcceso').text = access_code
+        etree.SubElement(batch, 'ruc').text = ruc
+        vouchers = etree.SubElement(batch, 'comprobantes')
+        for xml in xmls:
+            etree.SubElement(vouchers, 'comprobante').text = etree.CDATA(xml.strip())
+        return etree.tostring(batch, encoding='UTF-8', xml_declaration=True)
+
+    def validate_batch_xml(self, instances, xmls):
+        """Envía en un solo lote comprobantes firmados de la misma compañía, ambiente y tipo.
+
+        results contiene, en el orden de instances, la respuesta equivalente a validate_xml de cada comprobante.
+        """
+        response = {'resp': False, 'stage': VOUCHER_STAGE[2][0], 'access_code': None, 'results': []}
+        try:
+            access_code = self.create_access_key(instances[0], reuse=False)
+            response['access_code'] = access_code
+            document = self.create_batch_xml(access_code=access_code, ruc=instances[0].company.ruc, xmls=xmls)
+            base64_binary_xml = base64.b64encode(document).decode('utf-8')
+            result = self.call_service('receipt', instances[0].company.environment_type, 'validarComprobante', base64_binary_xml)
+            errors = {}
+            if result.estado == 'DEVUELTA':
+                for receipt in result.comprobantes.comprobante:
+                    errors[receipt.claveAcceso] = {'access_code': receipt.claveAcceso, 'batch_access_code': access_code, 'errors': self.get_messages(receipt)}
+            for instance, xml in zip(instances, xmls):
+                # Un error sobre la clave del lote (estructura, RUC) aplica a todos sus comprobantes
+                error = errors.get(instance.access_code, errors.get(access_code))
+                if error:
+                    response['results'].append({'resp': False, 'stage': VOUCHER_STAGE[2][0], 'error': error})
+                else:
+                    response['results'].append({'resp': True, 'stage': VOUCHER_STAGE[2][0], 'xml': xml})
+        except CircuitOpenError as e:
+            response['results'] = [{'resp': False, 'stage': VOUCHER_STAGE[2][0], 'error': str(e), 'circuit_open': True} for _ in instances]
+        except Exception as e:
+            response['results'] = [{'resp': False, 'stage': VOUCHER_STAGE[2][0], 'error': str(e)} for _ in instances]
+        for instance, result in zip(instances, response['results']):
+            if 'error' in result and not result.get('circuit_open'):
+                instance.create_receipt_error(errors=result)
+        response['resp'] = any(result['resp'] for result in response['results'])
+        return response
+
+    def authorize_batch_xml(self, access_code, instances):
+        """Consulta la autorización de un lote; results sigue el orden de instances.
+
+        Los comprobantes que el SRI aún no procesa quedan con resp False y la clave 'pending'.
+        """
+        response = {'resp': False, 'stage': VOUCHER_STAGE[3][0], 'access_code': access_code, 'results': []}
+        try:
+            result = self.call_service('authorization', instances[0].company.environment_type, 'autorizacionComprobanteLote', access_code)
+            receipts = {}
+            if len(result) and result[2]:
+                for receipt in result[2].autorizacion:
+                    voucher_access_code = receipt.numeroAutorizacion
+                    if not voucher_access_code and receipt.comprobante:
+                        voucher_access_code = etree.fromstring(receipt.comprobante.encode('utf-8')).findtext('infoTributaria/claveAcceso')
+                    if voucher_access_code not in receipts or receipt.estado == 'AUTORIZADO':
+                        receipts[voucher_access_code] = receipt
+            for instance in instances:
+                receipt = receipts.get(instance.access_code)
+                if receipt is None or receipt.estado == 'EN PROCESO':
+                    response['results'].append({'resp': False, 'stage': VOUCHER_STAGE[3][0], 'pending': True, 'error': f'El comprobante {instance.access_code} no tiene respuesta en el lote {access_code}'})
+                    continue
+                try:
+                    response['results'].append(self.get_authorization_response(instance=instance, receipt=receipt))
+                except Exception as e:
+                    response['results'].append({'resp': False, 'stage': VOUCHER_STAGE[3][0], 'error': str(e)})
+        except Exception as e:
+            response['results'] = [{'resp': False, 'stage': VOUCHER_STAGE[3][0], 'pending': True, 'error': str(e)} for _ in instances]
+        for instance, result in zip(instances, response['results']):
+            if 'error' in result and not result.get('pending'):
+                instance.create_receipt_error(errors=result)
+        response['resp'] = any(result['resp'] for result in response['results'])
+        return response
+
     def send_receipt_by_email(self, instance):
         response = {'resp': False, 'stage': VOUCHER_STAGE[4][0]}
         try:
-            instance.status = INVOICE_STATUS[2][0]
-            customer = instance.get_client_from_model()
+            # El mensaje queda en la bandeja de salida; OutboundEmail marca la factura como enviada al entregarlo
             response = instance.send_invoice_files_to_customer()
-            if response['resp']:
-                instance.save()
         except Exception as e:
             response['error'] = str(e)
             instance.create_receipt_error(errors=response)
@@ -0,0 +1,157 @@
+import io
+import logging
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from suds.cache import ObjectCache
+from suds.client import Client, ServiceSelector
+from suds.options import Options
+from suds.transport import Reply, Transport, TransportError
+
+from config import settings
+from core.pos.choices import ENVIRONMENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+SERVICE_PATHS = {
+    'receipt': 'comprobantes-electronicos-ws/RecepcionComprobantesOffline?wsdl',
+    'authorization': 'comprobantes-electronicos-ws/AutorizacionComprobantesOffline?wsdl',
+}
+
+
+class SRIUnavailableError(Exception):
+    """El SRI no respondió: error de red, timeout, respuesta 5xx sin SOAP o WSDL inaccesible"""
+
+
+def is_unreachable(error):
+    # Un SOAP fault o una respuesta mal formada sí vienen del SRI y no indican que el servicio esté caído
+    if isinstance(error, TransportError):
+        return error.httpcode is None or error.httpcode >= 500
+    return isinstance(error, (SRIUnavailableError, requests.ConnectionError, requests.Timeout, ConnectionError, socket.timeout))
+
+
+class RequestsTransport(Transport):
+    """Transporte de suds sobre una requests.Session compartida para reutilizar conexiones HTTP keep-alive."""
+
+    def __init__(self, session, timeout):
+        super().__init__()
+        self.session = session
+        self.timeout = timeout
+
+    def open(self, request):
+        try:
+            response = self.session.get(request.url, headers=request.headers, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise SRIUnavailableError(f'No se pudo descargar el WSDL del SRI: {e}') from e
+        return io.BytesIO(response.content)
+
+    def send(self, request):
+        # suds convierte cualquier TransportError del envío en una respuesta vacía; los fallos de red se lanzan aparte
+        try:
+            response = self.session.post(request.url, data=request.message, headers=request.headers, timeout=request.timeout or self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise SRIUnavailableError(str(e)) from e
+        if response.status_code >= 500 and 'xml' not in response.headers.get('Content-Type', ''):
+            # Un 5xx sin sobre SOAP viene del servidor web o de un proxy, no de un SOAP fault del SRI
+            raise SRIUnavailableError(f'{response.status_code} {response.reason}')
+        if response.status_code >= 400:
+            raise TransportError(response.reason, response.status_code, io.BytesIO(response.content))
+        return Reply(response.status_code, response.headers, response.content)
+
+
+class SRIClientPool:
+    """Clientes SOAP del SRI reutilizables por proceso, uno por servicio y tipo de ambiente.
+
+    El WSDL se descarga y se interpreta una sola vez (con caché en disco entre procesos);
+    cada hilo obtiene un clon liviano del cliente que comparte la definición del servicio.
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.session = None
+
+    def get_url(self, service, environment_type):
+        base_url = settings.SRI_WS_PRODUCTION_URL if environment_type == ENVIRONMENT_TYPE[1][0] else settings.SRI_WS_TEST_URL
+        return f'{base_url.rstrip("/")}/{SERVICE_PATHS[service]}'
+
+    def get_session(self):
+        if self.session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(SERVICE_PATHS) * len(ENVIRONMENT_TYPE), pool_maxsize=settings.SRI_WS_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.session = session
+        return self.session
+
+    def get_options(self):
+        return {
+            'cache': ObjectCache(location=settings.SRI_WSDL_CACHE_DIR, days=settings.SRI_WSDL_CACHE_DAYS),
+            'transport': RequestsTransport(session=self.get_session(), timeout=settings.SRI_WS_TIMEOUT),
+            'timeout': settings.SRI_WS_TIMEOUT,
+        }
+
+    def create_client(self, url):
+        return Client(url, **self.get_options())
+
+    def clone_client(self, master):
+        # Equivalente a Client.clone() sin el deepcopy de las opciones (entra en recursión infinita con suds 1.2 en Python 3.11)
+        client = Client.__new__(Client)
+        client.options = Options()
+        client.set_options(**self.get_options())
+        client.wsdl = master.wsdl
+        client.factory = master.factory
+        client.service = ServiceSelector(client, master.wsdl.services)
+        client.sd = master.sd
+        client.messages = dict(tx=None, rx=None)
+        return client
+
+    def get_master(self, service, environment_type):
+        key = (service, environment_type)
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    client = self.create_client(self.get_url(service, environment_type))
+                    self.clients[key] = client
+        return client
+
+    def get_client(self, service, environment_type):
+        clones = getattr(self.local, 'clients', None)
+        if clones is None:
+            clones = self.local.clients = {}
+        key = (service, environment_type)
+        master = self.get_master(service, environment_type)
+        client = clones.get(key)
+        if client is None or client.wsdl is not master.wsdl:
+            client = clones[key] = self.clone_client(master)
+        return client
+
+    def warm_up(self, environment_types=None):
+        loaded = []
+        for environment_type in environment_types or [choice[0] for choice in ENVIRONMENT_TYPE]:
+            for service in SERVICE_PATHS:
+                try:
+                    self.get_master(service, environment_type)
+                    loaded.append((service, environment_type))
+                except Exception as e:
+                    logger.warning('No se pudo precargar el cliente %s del ambiente %s: %s', service, environment_type, e)
+        return loaded
+
+    def warm_up_in_background(self, environment_types=None):
+        thread = threading.Thread(target=self.warm_up, kwargs={'environment_types': environment_types}, name='sri-client-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        with self.lock:
+            self.clients.clear()
+        self.local = threading.local()
+
+
+sri_clients = SRIClientPool()
@@ -0,0 +1,400 @@
+import base64
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+RECEIPT_NAMESPACE = 'http://ec.gob.sri.ws.recepcion'
+AUTHORIZATION_NAMESPACE = 'http://ec.gob.sri.ws.autorizacion'
+
+MESSAGE_TYPE = '''
+      <xs:complexType name="mensaje">
+        <xs:sequence>
+          <xs:element name="identificador" type="xs:string" minOccurs="0"/>
+          <xs:element name="mensaje" type="xs:string" minOccurs="0"/>
+          <xs:element name="informacionAdicional" type="xs:string" minOccurs="0"/>
+          <xs:element name="tipo" type="xs:string" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>'''
+
+RECEIPT_WSDL = '''<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" xmlns:tns="{namespace}" xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="{namespace}" name="RecepcionComprobantesOfflineService">
+  <types>
+    <xs:schema targetNamespace="{namespace}" version="1.0">
+      <xs:element name="RespuestaSolicitud" type="tns:respuestaSolicitud"/>
+      <xs:element name="comprobante" type="tns:comprobante"/>
+      <xs:element name="mensaje" type="tns:mensaje"/>
+      <xs:element name="validarComprobante" type="tns:validarComprobante"/>
+      <xs:element name="validarComprobanteResponse" type="tns:validarComprobanteResponse"/>
+      <xs:complexType name="validarComprobante">
+        <xs:sequence>
+          <xs:element name="xml" type="xs:base64Binary" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="validarComprobanteResponse">
+        <xs:sequence>
+          <xs:element name="RespuestaRecepcionComprobante" type="tns:respuestaSolicitud" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="respuestaSolicitud">
+        <xs:sequence>
+          <xs:element name="estado" type="xs:string" minOccurs="0"/>
+          <xs:element name="comprobantes" minOccurs="0">
+            <xs:complexType>
+              <xs:sequence>
+                <xs:element ref="tns:comprobante" minOccurs="0" maxOccurs="unbounded"/>
+              </xs:sequence>
+            </xs:complexType>
+          </xs:element>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="comprobante">
+        <xs:sequence>
+          <xs:element name="claveAcceso" type="xs:string" minOccurs="0"/>
+          <xs:element name="mensajes" minOccurs="0">
+            <xs:complexType>
+              <xs:sequence>
+                <xs:element ref="tns:mensaje" minOccurs="0" maxOccurs="unbounded"/>
+              </xs:sequence>
+            </xs:complexType>
+          </xs:element>
+        </xs:sequence>
+      </xs:complexType>{message_type}
+    </xs:schema>
+  </types>
+  <message name="validarComprobante">
+    <part name="parameters" element="tns:validarComprobante"/>
+  </message>
+  <message name="validarComprobanteResponse">
+    <part name="parameters" element="tns:validarComprobanteResponse"/>
+  </message>
+  <portType name="RecepcionComprobantesOffline">
+    <operation name="validarComprobante">
+      <input message="tns:validarComprobante"/>
+      <output message="tns:validarComprobanteResponse"/>
+    </operation>
+  </portType>
+  <binding name="RecepcionComprobantesOfflinePortBinding" type="tns:RecepcionComprobantesOffline">
+    <soap:binding transport="http://schemas.xmlsoap.org/soap/http" style="document"/>
+    <operation name="validarComprobante">
+      <soap:operation soapAction=""/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+  </binding>
+  <service name="RecepcionComprobantesOfflineService">
+    <port name="RecepcionComprobantesOfflinePort" binding="tns:RecepcionComprobantesOfflinePortBinding">
+      <soap:address location="{location}"/>
+    </port>
+  </service>
+</definitions>'''
+
+AUTHORIZATION_WSDL = '''<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" xmlns:tns="{namespace}" xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="{namespace}" name="AutorizacionComprobantesOfflineService">
+  <types>
+    <xs:schema targetNamespace="{namespace}" version="1.0">
+      <xs:element name="RespuestaAutorizacion" type="tns:respuestaComprobante"/>
+      <xs:element name="autorizacion" type="tns:autorizacion"/>
+      <xs:element name="mensaje" type="tns:mensaje"/>
+      <xs:element name="autorizacionComprobante" type="tns:autorizacionComprobante"/>
+      <xs:element name="autorizacionComprobanteResponse" type="tns:autorizacionComprobanteResponse"/>
+      <xs:element name="autorizacionComprobanteLote" type="tns:autorizacionComprobanteLote"/>
+      <xs:element name="autorizacionComprobanteLoteResponse" type="tns:autorizacionComprobanteLoteResponse"/>
+      <xs:complexType name="autorizacionComprobante">
+        <xs:sequence>
+          <xs:element name="claveAccesoComprobante" type="xs:string" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="autorizacionComprobanteResponse">
+        <xs:sequence>
+          <xs:element name="RespuestaAutorizacionComprobante" type="tns:respuestaComprobante" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="autorizacionComprobanteLote">
+        <xs:sequence>
+          <xs:element name="claveAccesoLote" type="xs:string" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="autorizacionComprobanteLoteResponse">
+        <xs:sequence>
+          <xs:element name="RespuestaAutorizacionLote" type="tns:respuestaLote" minOccurs="0"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="respuestaLote">
+        <xs:sequence>
+          <xs:element name="claveAccesoLoteConsultada" type="xs:string" minOccurs="0"/>
+          <xs:element name="numeroComprobantesLote" type="xs:string" minOccurs="0"/>
+          <xs:element name="autorizaciones" minOccurs="0">
+            <xs:complexType>
+              <xs:sequence>
+                <xs:element ref="tns:autorizacion" minOccurs="0" maxOccurs="unbounded"/>
+              </xs:sequence>
+            </xs:complexType>
+          </xs:element>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="respuestaComprobante">
+        <xs:sequence>
+          <xs:element name="claveAccesoConsultada" type="xs:string" minOccurs="0"/>
+          <xs:element name="numeroComprobantes" type="xs:string" minOccurs="0"/>
+          <xs:element name="autorizaciones" minOccurs="0">
+            <xs:complexType>
+              <xs:sequence>
+                <xs:element ref="tns:autorizacion" minOccurs="0" maxOccurs="unbounded"/>
+              </xs:sequence>
+            </xs:complexType>
+          </xs:element>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="autorizacion">
+        <xs:sequence>
+          <xs:element name="estado" type="xs:string" minOccurs="0"/>
+          <xs:element name="numeroAutorizacion" type="xs:string" minOccurs="0"/>
+          <xs:element name="fechaAutorizacion" type="xs:dateTime" minOccurs="0"/>
+          <xs:element name="ambiente" type="xs:string" minOccurs="0"/>
+          <xs:element name="comprobante" type="xs:string" minOccurs="0"/>
+          <xs:element name="mensajes" minOccurs="0">
+            <xs:complexType>
+              <xs:sequence>
+                <xs:element ref="tns:mensaje" minOccurs="0" maxOccurs="unbounded"/>
+              </xs:sequence>
+            </xs:complexType>
+          </xs:element>
+        </xs:sequence>
+      </xs:complexType>{message_type}
+    </xs:schema>
+  </types>
+  <message name="autorizacionComprobante">
+    <part name="parameters" element="tns:autorizacionComprobante"/>
+  </message>
+  <message name="autorizacionComprobanteResponse">
+    <part name="parameters" element="tns:autorizacionComprobanteResponse"/>
+  </message>
+  <message name="autorizacionComprobanteLote">
+    <part name="parameters" element="tns:autorizacionComprobanteLote"/>
+  </message>
+  <message name="autorizacionComprobanteLoteResponse">
+    <part name="parameters" element="tns:autorizacionComprobanteLoteResponse"/>
+  </message>
+  <portType name="AutorizacionComprobantesOffline">
+    <operation name="autorizacionComprobante">
+      <input message="tns:autorizacionComprobante"/>
+      <output message="tns:autorizacionComprobanteResponse"/>
+    </operation>
+    <operation name="autorizacionComprobanteLote">
+      <input message="tns:autorizacionComprobanteLote"/>
+      <output message="tns:autorizacionComprobanteLoteResponse"/>
+    </operation>
+  </portType>
+  <binding name="AutorizacionComprobantesOfflinePortBinding" type="tns:AutorizacionComprobantesOffline">
+    <soap:binding transport="http://schemas.xmlsoap.org/soap/http" style="document"/>
+    <operation name="autorizacionComprobante">
+      <soap:operation soapAction=""/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+    <operation name="autorizacionComprobanteLote">
+      <soap:operation soapAction=""/>
+      <input><soap:body use="literal"/></input>
+      <output><soap:body use="literal"/></output>
+    </operation>
+  </binding>
+  <service name="AutorizacionComprobantesOfflineService">
+    <port name="AutorizacionComprobantesOfflinePort" binding="tns:AutorizacionComprobantesOfflinePortBinding">
+      <soap:address location="{location}"/>
+    </port>
+  </service>
+</definitions>'''
+
+ENVELOPE = '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>{body}</soap:Body></soap:Envelope>'
+
+
+class SRIStubState:
+    """Comprobantes y lotes recibidos por el servidor de pruebas, indexados por clave de acceso."""
+
+    def __init__(self, environment='PRUEBAS', authorization_delay=0):
+        self.environment = environment
+        # Segundos durante los que un comprobante recibido responde como EN PROCESO
+        self.authorization_delay = authorization_delay
+        self.vouchers = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.requests = {'wsdl': 0, 'validarComprobante': 0, 'autorizacionComprobante': 0, 'autorizacionComprobanteLote': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def receive_batch(self, root):
+        access_code = root.findtext('claveAcceso')
+        if not access_code or root.find('comprobantes') is None:
+            return [('', 'ARCHIVO NO CUMPLE ESTRUCTURA XML')]
+        results = []
+        for voucher in root.find('comprobantes').findall('comprobante'):
+            try:
+                result = self.receive((voucher.text or '').strip().encode('utf-8'))
+            except etree.XMLSyntaxError:
+                result = None
+            results.append(result or (access_code, 'ARCHIVO NO CUMPLE ESTRUCTURA XML'))
+        with self.lock:
+            self.batches[access_code] = [code for code, error in results if not error]
+        return results
+
+    def get_batch(self, access_code):
+        with self.lock:
+            access_codes = self.batches.get(access_code)
+        if access_codes is None:
+            return None
+        return [(code, self.get(code)) for code in access_codes]
+
+    def receive(self, xml):
+        root = etree.fromstring(xml)
+        if root.tag == 'lote':
+            return self.receive_batch(root)
+        access_code = root.findtext('infoTributaria/claveAcceso')
+        if not access_code:
+            return None
+        with self.lock:
+            if access_code in self.vouchers:
+                return access_code, 'CLAVE ACCESO REGISTRADA'
+            self.vouchers[access_code] = {'xml': xml.decode('utf-8'), 'date': datetime.now().astimezone()}
+        return access_code, None
+
+    def get(self, access_code):
+        with self.lock:
+            return self.vouchers.get(access_code)
+
+    def is_processing(self, voucher):
+        return (datetime.now().astimezone() - voucher['date']).total_seconds() < self.authorization_delay
+
+
+class SRIStubHandler(BaseHTTPRequestHandler):
+    """Imita los servicios offline de recepción y autorización del SRI para pruebas sin red."""
+
+    server_version = 'SRIStub/1.0'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def get_service(self):
+        if 'RecepcionComprobantesOffline' in self.path:
+            return 'receipt'
+        if 'AutorizacionComprobantesOffline' in self.path:
+            return 'authorization'
+        return None
+
+    def write(self, content, status=200):
+        content = content.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        service = self.get_service()
+        if service is None:
+            self.write('<error>Servicio no encontrado</error>', status=404)
+            return
+        self.state.count('wsdl')
+        location = f'http://{self.headers.get("Host", "%s:%s" % self.server.server_address)}{self.path.split("?")[0]}'
+        if service == 'receipt':
+            self.write(RECEIPT_WSDL.format(namespace=RECEIPT_NAMESPACE, location=location, message_type=MESSAGE_TYPE))
+        else:
+            self.write(AUTHORIZATION_WSDL.format(namespace=AUTHORIZATION_NAMESPACE, location=location, message_type=MESSAGE_TYPE))
+
+    def do_POST(self):
+        service = self.get_service()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        operation = etree.fromstring(body).find('{http://schemas.xmlsoap.org/soap/envelope/}Body')[0]
+        name = etree.QName(operation).localname
+        self.state.count(name)
+        if service == 'receipt' and name == 'validarComprobante':
+            self.write(ENVELOPE.format(body=self.validate(operation)))
+        elif service == 'authorization' and name == 'autorizacionComprobante':
+            self.write(ENVELOPE.format(body=self.authorize(operation)))
+        elif service == 'authorization' and name == 'autorizacionComprobanteLote':
+            self.write(ENVELOPE.format(body=self.authorize_batch(operation)))
+        else:
+            self.write(ENVELOPE.format(body=f'<soap:Fault><faultcode>soap:Client</faultcode><faultstring>Operación {escape(name)} no soportada</faultstring></soap:Fault>'), status=500)
+
+    def build_messages(self, messages):
+        items = ''.join(
+            f'<mensaje><identificador>{identifier}</identificador><mensaje>{escape(text)}</mensaje><tipo>ERROR</tipo></mensaje>'
+            for identifier, text in messages
+        )
+        return f'<mensajes>{items}</mensajes>'
+
+    def validate(self, operation):
+        xml = base64.b64decode(operation.findtext('xml') or '')
+        try:
+            result = self.state.receive(xml)
+        except etree.XMLSyntaxError:
+            result = None
+        if result is None:
+            result = [('', 'ARCHIVO NO CUMPLE ESTRUCTURA XML')]
+        elif isinstance(result, tuple):
+            result = [result]
+        # En un lote solo se devuelven los comprobantes con errores; los demás quedan recibidos
+        errors = [(access_code, error) for access_code, error in result if error]
+        status = 'DEVUELTA' if errors else 'RECIBIDA'
+        vouchers = ''.join(
+            f'<comprobante><claveAcceso>{access_code}</claveAcceso>{self.build_messages([("43" if error == "CLAVE ACCESO REGISTRADA" else "35", error)])}</comprobante>'
+            for access_code, error in errors
+        )
+        return f'<ns2:validarComprobanteResponse xmlns:ns2="{RECEIPT_NAMESPACE}"><RespuestaRecepcionComprobante><estado>{status}</estado><comprobantes>{vouchers}</comprobantes></RespuestaRecepcionComprobante></ns2:validarComprobanteResponse>'
+
+    def build_authorization(self, access_code, voucher):
+        if self.state.is_processing(voucher):
+            return f'<autorizacion><estado>EN PROCESO</estado><numeroAutorizacion>{access_code}</numeroAutorizacion><mensajes/></autorizacion>'
+        return (
+            f'<autorizacion><estado>AUTORIZADO</estado><numeroAutorizacion>{access_code}</numeroAutorizacion>'
+            f'<fechaAutorizacion>{voucher["date"].isoformat()}</fechaAutorizacion><ambiente>{self.state.environment}</ambiente>'
+            f'<comprobante>{escape(voucher["xml"])}</comprobante><mensajes/></autorizacion>'
+        )
+
+    def authorize(self, operation):
+        access_code = operation.findtext('claveAccesoComprobante') or ''
+        voucher = self.state.get(access_code)
+        authorizations = self.build_authorization(access_code, voucher) if voucher else ''
+        return (
+            f'<ns2:autorizacionComprobanteResponse xmlns:ns2="{AUTHORIZATION_NAMESPACE}"><RespuestaAutorizacionComprobante>'
+            f'<claveAccesoConsultada>{escape(access_code)}</claveAccesoConsultada><numeroComprobantes>{1 if voucher else 0}</numeroComprobantes>'
+            f'<autorizaciones>{authorizations}</autorizaciones></RespuestaAutorizacionComprobante></ns2:autorizacionComprobanteResponse>'
+        )
+
+    def authorize_batch(self, operation):
+        access_code = operation.findtext('claveAccesoLote') or ''
+        vouchers = self.state.get_batch(access_code) or []
+        authorizations = ''.join(self.build_authorization(code, voucher) for code, voucher in vouchers)
+        return (
+            f'<ns2:autorizacionComprobanteLoteResponse xmlns:ns2="{AUTHORIZATION_NAMESPACE}"><RespuestaAutorizacionLote>'
+            f'<claveAccesoLoteConsultada>{escape(access_code)}</claveAccesoLoteConsultada><numeroComprobantesLote>{len(vouchers)}</numeroComprobantesLote>'
+            f'<autorizaciones>{authorizations}</autorizaciones></RespuestaAutorizacionLote></ns2:autorizacionComprobanteLoteResponse>'
+        )
+
+
+class SRIStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), verbose=False, **state_options):
+        super().__init__(address, SRIStubHandler)
+        self.state = SRIStubState(**state_options)
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, name='sri-stub-server', daemon=True)
+        thread.start()
+        return thread
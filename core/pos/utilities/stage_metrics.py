@@ -0,0 +1,69 @@
+import time
+from functools import partial
+
+from django.db import transaction
+
+from config import settings
+from core.pos.choices import STAGE_OUTCOME
+
+
+class StageMetrics:
+    """Mide duración, tamaño y resultado de cada etapa de la facturación electrónica y los guarda en VoucherStageMetric."""
+
+    def get_outcome(self, response):
+        if not isinstance(response, dict):
+            return STAGE_OUTCOME[0][0]
+        if response.get('circuit_open') or response.get('unreachable'):
+            return STAGE_OUTCOME[2][0]
+        if response.get('pending'):
+            return STAGE_OUTCOME[1][0]
+        return STAGE_OUTCOME[0][0] if response.get('resp') else STAGE_OUTCOME[3][0]
+
+    def get_size(self, response, kwargs):
+        # XML generado o firmado, el enviado al SRI cuando la respuesta no lo incluye, o el contenido del PDF
+        value = response.get('xml') if isinstance(response, dict) else response
+        if value is None:
+            value = kwargs.get('xml')
+        if isinstance(value, str):
+            return len(value.encode('utf-8'))
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return 0
+
+    def record(self, voucher, stage, duration, outcome, size=0):
+        from core.pos.models.voucher_stage_metric import VoucherStageMetric
+
+        try:
+            # Savepoint propio: una métrica que no se guarda nunca interrumpe la emisión del comprobante
+            with transaction.atomic():
+                VoucherStageMetric.objects.create(
+                    company_id=voucher.company_id,
+                    voucher_type=voucher.voucher_type_code,
+                    voucher_id=voucher.pk,
+                    receipt_number_full=voucher.receipt_number_full,
+                    stage=stage,
+                    outcome=outcome,
+                    duration=duration,
+                    size=size,
+                )
+        except Exception:  # pragma: no cover
+            pass
+
+    def measure(self, voucher, stage, function, **kwargs):
+        if not settings.ELECTRONIC_BILLING_METRICS:
+            return function(**kwargs)
+        outcome, size = STAGE_OUTCOME[3][0], 0
+        start = time.perf_counter()
+        try:
+            response = function(**kwargs)
+            outcome, size = self.get_outcome(response), self.get_size(response, kwargs)
+            return response
+        finally:
+            self.record(voucher, stage, time.perf_counter() - start, outcome, size)
+
+    def timed(self, voucher, stage, function):
+        # La función medida conserva la firma function(**kwargs) que esperan los run_stage
+        return partial(self.measure, voucher, stage, function)
+
+
+stage_metrics = StageMetrics()
@@ -0,0 +1,57 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+DETAIL_PLACES = Decimal('0.0001')
+TOTAL_PLACES = Decimal('0.01')
+
+
+class TotalsEngine:
+    """Calcula en memoria con Decimal los valores del detalle y la cabecera de facturas, notas de crédito y proformas."""
+    detail_fields = ['price', 'price_with_tax', 'subtotal', 'tax', 'total_tax', 'discount', 'total_discount', 'total_amount']
+    batch_size = 500
+
+    def to_decimal(self, value, places=DETAIL_PLACES):
+        if not isinstance(value, Decimal):
+            # str evita arrastrar el error binario de los float del formulario
+            value = Decimal(str(value or 0))
+        return value.quantize(places, rounding=ROUND_HALF_UP)
+
+    def calculate_detail(self, detail, tax):
+        detail.price = self.to_decimal(detail.price)
+        detail.discount = self.to_decimal(detail.discount)
+        detail.tax = self.to_decimal(tax)
+        detail.price_with_tax = self.to_decimal(detail.price + detail.price * detail.tax)
+        detail.subtotal = self.to_decimal(detail.price * int(detail.quantity))
+        detail.total_discount = self.to_decimal(detail.subtotal * detail.discount)
+        detail.total_amount = detail.subtotal - detail.total_discount
+        detail.total_tax = self.to_decimal(detail.total_amount * detail.tax)
+        return detail
+
+    def calculate(self, document, details):
+        # detail.product debe venir cargado (select_related o asignado) para no consultar por línea
+        subtotal_with_tax = subtotal_without_tax = total_tax = total_discount = Decimal('0')
+        for detail in details:
+            self.calculate_detail(detail, document.tax)
+            if detail.product.has_tax:
+                subtotal_with_tax += detail.total_amount
+                total_tax += detail.total_tax
+            else:
+                subtotal_without_tax += detail.total_amount
+            total_discount += detail.total_discount
+        document.subtotal_with_tax = self.to_decimal(subtotal_with_tax, TOTAL_PLACES)
+        document.subtotal_without_tax = self.to_decimal(subtotal_without_tax, TOTAL_PLACES)
+        document.total_tax = self.to_decimal(total_tax, TOTAL_PLACES)
+        document.total_discount = self.to_decimal(total_discount, TOTAL_PLACES)
+        document.total_amount = self.to_decimal(subtotal_with_tax + subtotal_without_tax, TOTAL_PLACES) + document.total_tax
+        return details
+
+    def save_details(self, model, details):
+        created = [detail for detail in details if detail.pk is None]
+        updated = [detail for detail in details if detail.pk is not None]
+        if created:
+            model.objects.bulk_create(created, batch_size=self.batch_size)
+        if updated:
+            model.objects.bulk_update(updated, self.detail_fields, batch_size=self.batch_size)
+        return details
+
+
+totals_engine = TotalsEngine()
@@ -0,0 +1,145 @@
+import csv
+import io
+import math
+import shutil
+import zipfile
+
+from django.utils import timezone
+
+from config import settings
+from core.pos.choices import INVOICE_STATUS
+
+MANIFEST_FIELDS = [
+    'tipo', 'numero', 'fecha_emision', 'codigo_acceso', 'cliente', 'identificacion', 'subtotal', 'iva', 'descuento', 'total', 'estado', 'fecha_autorizacion', 'xml', 'pdf',
+]
+
+
+class ZipStream(io.RawIOBase):
+    """Destino no posicionable para zipfile: acumula lo escrito hasta que el generador lo entrega con `pop()`"""
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def pop(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class VoucherExport:
+    """Archivo ZIP con los XML y PDF autorizados de una compañía en un periodo, más un manifiesto CSV.
+
+    Los comprobantes se dividen en partes de `part_size` con un orden estable (facturas y luego notas de crédito, por fecha e id),
+    así una descarga o exportación interrumpida se retoma desde la parte que faltaba.
+    """
+
+    def __init__(self, company, start_date=None, end_date=None, part_size=None):
+        self.company = company
+        self.start_date = start_date or None
+        self.end_date = end_date or None
+        self.part_size = part_size or settings.VOUCHER_EXPORT_PART_SIZE
+
+    def get_querysets(self):
+        from core.pos.models import CreditNote, Invoice
+
+        filters = {'company': self.company, 'status__in': [INVOICE_STATUS[1][0], INVOICE_STATUS[2][0], INVOICE_STATUS[3][0]], 'authorized_xml__isnull': False}
+        if self.start_date and self.end_date:
+            filters['date_joined__range'] = [self.start_date, self.end_date]
+        return [
+            Invoice.objects.filter(**filters).exclude(authorized_xml='').select_related('receipt', 'customer__user').order_by('date_joined', 'id'),
+            CreditNote.objects.filter(**filters).exclude(authorized_xml='').select_related('receipt', 'invoice__customer__user').order_by('date_joined', 'id'),
+        ]
+
+    def get_count(self):
+        if not hasattr(self, '_count'):
+            self._count = [queryset.count() for queryset in self.get_querysets()]
+        return sum(self._count)
+
+    def get_parts(self):
+        return max(math.ceil(self.get_count() / self.part_size), 1)
+
+    def get_filename(self, part=1):
+        period = f'{self.start_date}_{self.end_date}' if self.start_date and self.end_date else 'todos'
+        name = f'comprobantes-{self.company.ruc}-{period}'
+        return f'{name}-parte{part:03d}.zip' if self.get_parts() > 1 else f'{name}.zip'
+
+    def get_vouchers(self, part=1):
+        # Recorre solo los comprobantes de la parte sin cargar el resto del periodo
+        self.get_count()
+        start, end = (part - 1) * self.part_size, part * self.part_size
+        for queryset, count in zip(self.get_querysets(), self._count):
+            if start < count and end > 0:
+                yield from queryset[max(start, 0):min(end, count)].iterator(chunk_size=100)
+            start, end = start - count, end - count
+
+    def get_authorized_date(self, voucher):
+        value = voucher.authorized_date
+        return timezone.localtime(value) if timezone.is_aware(value) else value
+
+    def get_manifest_row(self, voucher, xml_name, pdf_name):
+        customer = voucher.get_client_from_model()
+        return [
+            voucher.receipt.name,
+            voucher.receipt_number_full,
+            voucher.date_joined.strftime('%Y-%m-%d'),
+            voucher.access_code,
+            customer.user.names,
+            customer.identification,
+            f'{voucher.subtotal:.2f}',
+            f'{voucher.total_tax:.2f}',
+            f'{voucher.total_discount:.2f}',
+            f'{voucher.total_amount:.2f}',
+            voucher.get_status_display(),
+            self.get_authorized_date(voucher).strftime('%Y-%m-%d %H:%M:%S') if voucher.authorized_date else '',
+            xml_name,
+            pdf_name,
+        ]
+
+    def add_file(self, file_zip, file, arcname, date_time, compress_type):
+        info = zipfile.ZipInfo(arcname, date_time=date_time)
+        info.compress_type = compress_type
+        with file.storage.open(file.name, 'rb') as source, file_zip.open(info, 'w') as target:
+            shutil.copyfileobj(source, target, 64 * 1024)
+
+    def write(self, file, part=1, create_missing_pdf=True):
+        """Escribe la parte en `file` (puede no ser posicionable); es un generador que avanza un comprobante por vez"""
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerow(MANIFEST_FIELDS)
+        with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED) as file_zip:
+            for voucher in self.get_vouchers(part):
+                if not voucher.authorized_pdf and create_missing_pdf:
+                    voucher.update_authorized_pdf()
+                folder = f'{voucher.receipt.get_name_file()}/{voucher.date_joined.strftime("%Y-%m")}'
+                name = voucher.access_code or voucher.receipt_number_full
+                date_time = (self.get_authorized_date(voucher) if voucher.authorized_date else voucher.date_joined).timetuple()[:6]
+                xml_name = f'{folder}/{name}.xml'
+                # El XML se comprime; el PDF ya viene comprimido internamente y se guarda tal cual para no gastar CPU
+                self.add_file(file_zip, voucher.authorized_xml, xml_name, date_time, zipfile.ZIP_DEFLATED)
+                pdf_name = ''
+                if voucher.authorized_pdf:
+                    pdf_name = f'{folder}/{name}.pdf'
+                    self.add_file(file_zip, voucher.authorized_pdf, pdf_name, date_time, zipfile.ZIP_STORED)
+                writer.writerow(self.get_manifest_row(voucher, xml_name, pdf_name))
+                yield voucher
+            file_zip.writestr('manifiesto.csv', manifest.getvalue().encode('utf-8-sig'))
+
+    def stream(self, part=1):
+        """Contenido de la parte en bloques para StreamingHttpResponse, con memoria acotada a un comprobante"""
+        stream = ZipStream()
+        for _ in self.write(stream, part=part):
+            yield stream.pop()
+        yield stream.pop()
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import tempfile
+
+import zstandard
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from config import settings
+
+# Sufijo de los archivos guardados comprimidos con zstd
+COMPRESSED_SUFFIX = '.zst'
+# Hasta este tamaño el archivo se prepara en memoria antes de enviarlo al backend; los más grandes pasan por disco
+SPOOL_MAX_SIZE = 1024 * 1024
+# Tamaño máximo de la cabecera de un frame zstd, donde va el tamaño del contenido si se conocía al comprimir
+FRAME_HEADER_MAX_SIZE = 18
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+(\.zst)?$')
+
+
+class VoucherStorage(Storage):
+    """Almacenamiento de los XML y PDF autorizados direccionado por contenido.
+
+    Cada archivo se guarda como `<carpeta>/<ab>/<cd>/<sha256><ext>`: el mismo contenido se escribe una sola vez y lo comparten
+    todos los comprobantes que lo referencian. El backend real (disco local, S3/MinIO con django-storages, etc.) se configura
+    con VOUCHER_STORAGE_BACKEND y VOUCHER_STORAGE_OPTIONS; con VOUCHER_STORAGE_COMPRESS_XML los XML se guardan comprimidos
+    con zstd y se descomprimen al vuelo al leerlos.
+    """
+
+    def __init__(self, backend=None, options=None, compress_xml=None, compress_level=None):
+        backend = backend or settings.VOUCHER_STORAGE_BACKEND
+        self.backend = import_string(backend)(**(settings.VOUCHER_STORAGE_OPTIONS if options is None else options))
+        self.compress_xml = settings.VOUCHER_STORAGE_COMPRESS_XML if compress_xml is None else compress_xml
+        self.compress_level = compress_level or settings.VOUCHER_STORAGE_COMPRESS_LEVEL
+
+    def is_compressed(self, name):
+        return name.endswith(COMPRESSED_SUFFIX)
+
+    def is_hashed(self, name):
+        return bool(HASHED_NAME.search(name))
+
+    def get_hashed_name(self, name, digest, compressed=False):
+        # Se conserva la primera carpeta de upload_to (authorized_xml, pdf_authorized) para separar los tipos de archivo
+        folder = name.split('/', 1)[0] if '/' in name else ''
+        extension = os.path.splitext(name)[1].lower()
+        hashed = f'{digest[:2]}/{digest[2:4]}/{digest}{extension}{COMPRESSED_SUFFIX if compressed else ""}'
+        return f'{folder}/{hashed}' if folder else hashed
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo depende del contenido y se calcula en _save
+        return name
+
+    def _save(self, name, content):
+        compressed = self.compress_xml and name.lower().endswith('.xml')
+        digest = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+            writer = zstandard.ZstdCompressor(level=self.compress_level).stream_writer(spool, closefd=False) if compressed else spool
+            if hasattr(content, 'seek') and content.seekable():
+                content.seek(0)
+            for chunk in content.chunks():
+                chunk = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                digest.update(chunk)
+                writer.write(chunk)
+            if compressed:
+                writer.close()
+            hashed = self.get_hashed_name(name, digest.hexdigest(), compressed)
+            if self.backend.exists(hashed):
+                # Contenido repetido: se reutiliza el archivo existente
+                return hashed
+            spool.seek(0)
+            return self.backend.save(hashed, File(spool))
+
+    def open(self, name, mode='rb'):
+        file = self.backend.open(name, mode)
+        if self.is_compressed(name) and 'r' in mode:
+            return File(zstandard.ZstdDecompressor().stream_reader(file, closefd=True), name=name[:-len(COMPRESSED_SUFFIX)])
+        return file
+
+    def _open(self, name, mode='rb'):
+        return self.open(name, mode)
+
+    def is_referenced(self, name):
+        from core.pos.models.elec_billing_base import ElecBillingBase
+
+        for model in apps.get_models():
+            if issubclass(model, ElecBillingBase) and model.objects.filter(Q(authorized_xml=name) | Q(authorized_pdf=name)).exists():
+                return True
+        return False
+
+    def delete(self, name):
+        # Un archivo compartido por contenido solo se borra cuando ningún comprobante lo referencia
+        if name and not self.is_referenced(name):
+            self.backend.delete(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def get_content_size(self, name):
+        # size() es lo que ocupa en el backend; los XML comprimidos se entregan descomprimidos al leerlos
+        if not self.is_compressed(name):
+            return self.size(name)
+        with self.backend.open(name, 'rb') as file:
+            size = zstandard.frame_content_size(file.read(FRAME_HEADER_MAX_SIZE))
+        if size >= 0:
+            return size
+        # Los archivos escritos con stream_writer no guardan el tamaño en la cabecera
+        size = 0
+        with self.open(name, 'rb') as file:
+            for chunk in iter(lambda: file.read(SPOOL_MAX_SIZE), b''):
+                size += len(chunk)
+        return size
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+
+voucher_storage = VoucherStorage()
+
+
+def get_voucher_storage():
+    # Callable para FileField(storage=...): el backend configurado no queda serializado en las migraciones
+    return voucher_storage
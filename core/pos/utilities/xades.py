@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import secrets
+import threading
+from datetime import datetime
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs12
+from lxml import etree
+
+DS_NS = 'http://www.w3.org/2000/09/xmldsig#'
+ETSI_NS = 'http://uri.etsi.org/01903/v1.3.2#'
+C14N_ALGORITHM = 'http://www.w3.org/TR/2001/REC-xml-c14n-20010315'
+RSA_SHA1_ALGORITHM = 'http://www.w3.org/2000/09/xmldsig#rsa-sha1'
+SHA1_ALGORITHM = 'http://www.w3.org/2000/09/xmldsig#sha1'
+ENVELOPED_ALGORITHM = 'http://www.w3.org/2000/09/xmldsig#enveloped-signature'
+SIGNED_PROPERTIES_TYPE = 'http://uri.etsi.org/01903#SignedProperties'
+
+
+def ds(tag):
+    return f'{{{DS_NS}}}{tag}'
+
+
+def etsi(tag):
+    return f'{{{ETSI_NS}}}{tag}'
+
+
+class XadesSigner:
+    """Firma XAdES-BES enveloped (perfil exigido por el SRI) sin levantar la JVM.
+
+    El certificado y la llave privada se descifran una sola vez al construir la instancia,
+    luego cada llamada a sign() trabaja directamente sobre bytes.
+    """
+
+    def __init__(self, p12_data, password):
+        bundle = pkcs12.load_pkcs12(p12_data, password.encode('utf-8') if isinstance(password, str) else password)
+        if bundle.key is None:
+            raise ValueError('El archivo P12 no contiene una llave privada')
+        self.private_key = bundle.key
+        self.certificate = self.get_signing_certificate(bundle)
+        self.certificate_der = self.certificate.public_bytes(Encoding.DER)
+        self.certificate_b64 = base64.b64encode(self.certificate_der).decode('ascii')
+        self.certificate_digest = base64.b64encode(hashlib.sha1(self.certificate_der).digest()).decode('ascii')
+        self.issuer_name = self.certificate.issuer.rfc4514_string()
+        self.serial_number = str(self.certificate.serial_number)
+        public_numbers = self.private_key.public_key().public_numbers()
+        self.modulus = self.int_to_b64(public_numbers.n)
+        self.exponent = self.int_to_b64(public_numbers.e)
+
+    def get_signing_certificate(self, bundle):
+        # Los P12 de algunas entidades (Security Data, BCE) traen también la cadena de la CA;
+        # se elige el certificado cuya llave pública corresponde a la llave privada.
+        public_numbers = self.private_key.public_key().public_numbers()
+        certificates = []
+        if bundle.cert is not None:
+            certificates.append(bundle.cert.certificate)
+        certificates.extend(item.certificate for item in bundle.additional_certs)
+        for certificate in certificates:
+            if certificate.public_key().public_numbers() == public_numbers:
+                return certificate
+        raise ValueError('No se encontró el certificado correspondiente a la llave privada del P12')
+
+    def int_to_b64(self, value):
+        return base64.b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'big')).decode('ascii')
+
+    def digest(self, element):
+        return base64.b64encode(hashlib.sha1(etree.tostring(element, method='c14n')).digest()).decode('ascii')
+
+    def add_reference(self, signed_info, uri, digest_value, transforms=(), **attrib):
+        reference = etree.SubElement(signed_info, ds('Reference'), attrib={**attrib, 'URI': uri})
+        if transforms:
+            xml_transforms = etree.SubElement(reference, ds('Transforms'))
+            for algorithm in transforms:
+                etree.SubElement(xml_transforms, ds('Transform'), Algorithm=algorithm)
+        etree.SubElement(reference, ds('DigestMethod'), Algorithm=SHA1_ALGORITHM)
+        etree.SubElement(reference, ds('DigestValue')).text = digest_value
+        return reference
+
+    def sign(self, xml):
+        if isinstance(xml, str):
+            xml = xml.encode('utf-8')
+        root = etree.fromstring(xml.strip(), parser=etree.XMLParser(remove_blank_text=False, resolve_entities=False))
+        # La transformación enveloped-signature equivale a digerir el comprobante antes de anexar la firma
+        voucher_digest = self.digest(root)
+
+        number = secrets.randbelow(900000) + 100000
+        signature_id = f'Signature{number}'
+        signed_properties_id = f'{signature_id}-SignedProperties{secrets.randbelow(900000) + 100000}'
+        certificate_id = f'Certificate{secrets.randbelow(9000000) + 1000000}'
+        reference_id = f'Reference-ID-{secrets.randbelow(900000) + 100000}'
+
+        signature = etree.SubElement(root, ds('Signature'), nsmap={'ds': DS_NS, 'etsi': ETSI_NS}, Id=signature_id)
+        signed_info = etree.SubElement(signature, ds('SignedInfo'), Id=f'Signature-SignedInfo{secrets.randbelow(900000) + 100000}')
+        etree.SubElement(signed_info, ds('CanonicalizationMethod'), Algorithm=C14N_ALGORITHM)
+        etree.SubElement(signed_info, ds('SignatureMethod'), Algorithm=RSA_SHA1_ALGORITHM)
+        signature_value = etree.SubElement(signature, ds('SignatureValue'), Id=f'SignatureValue{secrets.randbelow(900000) + 100000}')
+
+        key_info = etree.SubElement(signature, ds('KeyInfo'), Id=certificate_id)
+        x509_data = etree.SubElement(key_info, ds('X509Data'))
+        etree.SubElement(x509_data, ds('X509Certificate')).text = self.certificate_b64
+        rsa_key_value = etree.SubElement(etree.SubElement(key_info, ds('KeyValue')), ds('RSAKeyValue'))
+        etree.SubElement(rsa_key_value, ds('Modulus')).text = self.modulus
+        etree.SubElement(rsa_key_value, ds('Exponent')).text = self.exponent
+
+        xml_object = etree.SubElement(signature, ds('Object'), Id=f'{signature_id}-Object{secrets.randbelow(900000) + 100000}')
+        qualifying_properties = etree.SubElement(xml_object, etsi('QualifyingProperties'), Target=f'#{signature_id}')
+        signed_properties = etree.SubElement(qualifying_properties, etsi('SignedProperties'), Id=signed_properties_id)
+        signed_signature_properties = etree.SubElement(signed_properties, etsi('SignedSignatureProperties'))
+        etree.SubElement(signed_signature_properties, etsi('SigningTime')).text = datetime.now().astimezone().replace(microsecond=0).isoformat()
+        xml_cert = etree.SubElement(etree.SubElement(signed_signature_properties, etsi('SigningCertificate')), etsi('Cert'))
+        cert_digest = etree.SubElement(xml_cert, etsi('CertDigest'))
+        etree.SubElement(cert_digest, ds('DigestMethod'), Algorithm=SHA1_ALGORITHM)
+        etree.SubElement(cert_digest, ds('DigestValue')).text = self.certificate_digest
+        issuer_serial = etree.SubElement(xml_cert, etsi('IssuerSerial'))
+        etree.SubElement(issuer_serial, ds('X509IssuerName')).text = self.issuer_name
+        etree.SubElement(issuer_serial, ds('X509SerialNumber')).text = self.serial_number
+        data_object_format = etree.SubElement(etree.SubElement(signed_properties, etsi('SignedDataObjectProperties')), etsi('DataObjectFormat'), ObjectReference=f'#{reference_id}')
+        etree.SubElement(data_object_format, etsi('Description')).text = 'contenido comprobante'
+        etree.SubElement(data_object_format, etsi('MimeType')).text = 'text/xml'
+
+        # Las referencias se insertan antes de SignatureValue, ya con el resto del árbol armado,
+        # para que la canonicalización incluya los namespaces heredados de ds:Signature.
+        self.add_reference(signed_info, f'#{signed_properties_id}', self.digest(signed_properties), Id=f'SignedPropertiesID{secrets.randbelow(900000) + 100000}', Type=SIGNED_PROPERTIES_TYPE)
+        self.add_reference(signed_info, f'#{certificate_id}', self.digest(key_info))
+        self.add_reference(signed_info, f'#{root.get("id", "comprobante")}', voucher_digest, transforms=(ENVELOPED_ALGORITHM,), Id=reference_id)
+
+        signed_info_c14n = etree.tostring(signed_info, method='c14n')
+        signature_value.text = base64.b64encode(self.private_key.sign(signed_info_c14n, padding.PKCS1v15(), hashes.SHA1())).decode('ascii')
+        return b'<?xml version="1.0" encoding="UTF-8"?>\n' + etree.tostring(root, encoding='UTF-8')
+
+
+class XadesSignerCache:
+    """Mantiene en memoria un XadesSigner por firma electrónica de cada compañía."""
+
+    def __init__(self):
+        self.signers = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, company):
+        return company.pk, company.electronic_signature.name, company.electronic_signature_key
+
+    def get(self, company):
+        key = self.get_key(company)
+        signer = self.signers.get(key)
+        if signer is None:
+            with self.lock:
+                signer = self.signers.get(key)
+                if signer is None:
+                    with company.electronic_signature.open('rb') as file:
+                        signer = XadesSigner(p12_data=file.read(), password=company.electronic_signature_key)
+                    # Una compañía que cambió su firma deja de usar las llaves anteriores
+                    for stale_key in [k for k in self.signers if k[0] == company.pk]:
+                        del self.signers[stale_key]
+                    self.signers[key] = signer
+        return signer
+
+    def clear(self):
+        with self.lock:
+            self.signers.clear()
+
+
+signer_cache = XadesSignerCache()
@@ -0,0 +1,120 @@
+import threading
+from xml.sax.saxutils import escape
+
+from core.pos.choices import RETENTION_AGENT, TAX_CODES
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+
+def element(tag, value):
+    if value is None or value == '':
+        return f'<{tag} />'
+    return f'<{tag}>{escape(str(value))}</{tag}>'
+
+
+def optional_element(tag, value):
+    # Los elementos opcionales del XSD (minOccurs="0") no admiten texto vacío: sin valor se omiten
+    if value is None or value == '':
+        return ''
+    return element(tag, value)
+
+
+class SRIXMLBuilder:
+    """Genera el XML de los comprobantes como texto; las partes que dependen solo de la compañía se arman una vez."""
+
+    # Un cambio en cualquiera de estos campos invalida los fragmentos guardados, incluso si se hizo en otro proceso
+    COMPANY_FIELDS = (
+        'environment_type', 'emission_type', 'company_name', 'commercial_name', 'ruc', 'main_address', 'regimen_rimpe',
+        'retention_agent', 'establishment_address', 'obligated_accounting', 'special_taxpayer', 'tax_percentage',
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.companies = {}
+
+    def compile_company(self, company):
+        # El XSD exige agenteRetencion antes de contribuyenteRimpe
+        tax_info_end = [element('dirMatriz', company.main_address)]
+        if company.retention_agent == RETENTION_AGENT[0][0]:
+            tax_info_end.append(element('agenteRetencion', '1'))
+        if not company.is_popular_regime:
+            tax_info_end.append(optional_element('contribuyenteRimpe', company.regimen_rimpe))
+        return {
+            'tax_info_start': ''.join([
+                element('ambiente', company.environment_type),
+                element('tipoEmision', company.emission_type),
+                element('razonSocial', company.company_name),
+                optional_element('nombreComercial', company.commercial_name),
+                element('ruc', company.ruc),
+            ]),
+            'tax_info_end': ''.join(tax_info_end),
+            'establishment_address': optional_element('dirEstablecimiento', company.establishment_address),
+            'obligated_accounting': optional_element('obligadoContabilidad', company.obligated_accounting),
+            'special_taxpayer': element('contribuyenteEspecial', company.special_taxpayer) if company.special_taxpayer != '000' else '',
+            'tax_percentage': str(company.tax_percentage),
+        }
+
+    def get_company_fragments(self, company):
+        fingerprint = tuple(getattr(company, name) for name in self.COMPANY_FIELDS)
+        cached = self.companies.get(company.pk)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        fragments = self.compile_company(company)
+        with self.lock:
+            self.companies[company.pk] = (fingerprint, fragments)
+        return fragments
+
+    def clear(self, company_id=None):
+        with self.lock:
+            if company_id is None:
+                self.companies = {}
+            else:
+                self.companies.pop(company_id, None)
+
+    def render_tax_info(self, instance, access_key, fragments):
+        return ''.join([
+            '<infoTributaria>',
+            fragments['tax_info_start'],
+            element('claveAcceso', access_key),
+            element('codDoc', instance.receipt.voucher_type),
+            element('estab', instance.receipt.establishment_code),
+            element('ptoEmi', instance.receipt.issuing_point_code),
+            element('secuencial', instance.receipt_number),
+            fragments['tax_info_end'],
+            '</infoTributaria>',
+        ])
+
+    def render_total_taxes(self, instance, fragments):
+        parts = ['<totalConImpuestos>']
+        if instance.subtotal_without_tax != 0.0000:
+            parts.append(f'<totalImpuesto><codigo>{TAX_CODES[0][0]}</codigo><codigoPorcentaje>0</codigoPorcentaje><baseImponible>{instance.subtotal_without_tax:.2f}</baseImponible><valor>0.00</valor></totalImpuesto>')
+        if instance.subtotal_with_tax != 0.0000:
+            parts.append(f'<totalImpuesto><codigo>{TAX_CODES[0][0]}</codigo><codigoPorcentaje>{fragments["tax_percentage"]}</codigoPorcentaje><baseImponible>{instance.subtotal_with_tax:.2f}</baseImponible><valor>{instance.total_tax:.2f}</valor></totalImpuesto>')
+        parts.append('</totalConImpuestos>')
+        return ''.join(parts)
+
+    def render_details(self, details, fragments, code_tag):
+        """details debe traer el producto con select_related: el detalle completo sale de una sola consulta"""
+        tax_code = TAX_CODES[0][0]
+        tax_percentage = fragments['tax_percentage']
+        parts = ['<detalles>']
+        for detail in details:
+            if detail.product.has_tax:
+                tax = f'<codigoPorcentaje>{tax_percentage}</codigoPorcentaje><tarifa>{detail.tax_rate:.2f}</tarifa><baseImponible>{detail.total_amount:.2f}</baseImponible><valor>{detail.total_tax:.2f}</valor>'
+            else:
+                tax = f'<codigoPorcentaje>0</codigoPorcentaje><tarifa>0</tarifa><baseImponible>{detail.total_amount:.2f}</baseImponible><valor>0</valor>'
+            parts.append(
+                f'<detalle>{optional_element(code_tag, detail.product.code)}{element("descripcion", detail.product.name)}'
+                f'<cantidad>{detail.quantity:.2f}</cantidad><precioUnitario>{detail.price:.2f}</precioUnitario>'
+                f'<descuento>{detail.total_discount:.2f}</descuento><precioTotalSinImpuesto>{detail.total_amount:.2f}</precioTotalSinImpuesto>'
+                f'<impuestos><impuesto><codigo>{tax_code}</codigo>{tax}</impuesto></impuestos></detalle>'
+            )
+        parts.append('</detalles>')
+        return ''.join(parts)
+
+    def render(self, root, version, parts):
+        """Devuelve los bytes UTF-8 del comprobante, listos para el firmador"""
+        return f'{XML_DECLARATION}<{root} id="comprobante" version="{version}">{"".join(parts)}</{root}>'.encode('utf-8')
+
+
+xml_builder = SRIXMLBuilder()
@@ -0,0 +1,53 @@
+import os
+import threading
+
+from lxml import etree
+
+# XSD oficiales del SRI (ficha técnica de comprobantes electrónicos); importan xmldsig-core-schema.xsd del mismo directorio
+XSD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'files', 'xsd')
+XMLDSIG_NAMESPACE = 'http://www.w3.org/2000/09/xmldsig#'
+# Código y mensaje con los que el SRI devuelve un comprobante que no cumple el esquema
+STRUCTURE_ERROR = {'identificador': '35', 'mensaje': 'ARCHIVO NO CUMPLE ESTRUCTURA XML', 'tipo': 'ERROR'}
+
+
+class XMLSchemaCache:
+    """Esquemas XSD de los comprobantes compilados una sola vez; cada hilo tiene los suyos porque un validador de lxml no es reentrante."""
+
+    def __init__(self, path=XSD_DIR):
+        self.path = path
+        self.local = threading.local()
+
+    def get_schema_name(self, root):
+        # factura_V1.0.0.xsd, notaCredito_V1.1.0.xsd
+        return f'{etree.QName(root).localname}_V{root.get("version")}.xsd'
+
+    def get(self, name):
+        schemas = getattr(self.local, 'schemas', None)
+        if schemas is None:
+            schemas = self.local.schemas = {}
+        if name not in schemas:
+            path = os.path.join(self.path, name)
+            schemas[name] = etree.XMLSchema(etree.parse(path)) if os.path.exists(path) else None
+        return schemas[name]
+
+    def validate(self, xml):
+        """Devuelve los errores del comprobante con el formato de los mensajes del SRI; una lista vacía si es válido"""
+        if isinstance(xml, str):
+            xml = xml.encode('utf-8')
+        try:
+            root = etree.fromstring(xml.strip(), parser=etree.XMLParser(resolve_entities=False))
+        except etree.XMLSyntaxError as e:
+            return [{**STRUCTURE_ERROR, 'informacionAdicional': str(e)}]
+        schema = self.get(self.get_schema_name(root))
+        # La firma de un comprobante autorizado no forma parte de la estructura que define el XSD
+        for signature in root.findall(f'{{{XMLDSIG_NAMESPACE}}}Signature'):
+            root.remove(signature)
+        if schema is None or schema.validate(root):
+            return []
+        return [{**STRUCTURE_ERROR, 'informacionAdicional': f'Línea {error.line}: {error.message}'} for error in schema.error_log]
+
+    def clear(self):
+        self.local = threading.local()
+
+
+schema_cache = XMLSchemaCache()
@@ -8,7 +8,7 @@ from django.views.generic import CreateView, DeleteView, ListView
 
 from core.pos.forms import CreditNoteForm, CreditNote, CreditNoteDetail, Invoice, Receipt, InvoiceDetail, VOUCHER_TYPE, INVOICE_STATUS, IDENTIFICATION_TYPE
 from core.pos.models import Company
-from core.pos.utilities.pdf_creator import PDFCreator
+from core.pos.utilities.pdf_cache import pdf_cache
 from core.pos.utilities.sri import SRI
 from core.report.forms import ReportForm
 from core.security.mixins import GroupPermissionMixin, CompanyQuerysetMixin, AutoAssignCompanyMixin
@@ -98,17 +98,20 @@ class CreditNoteCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, Company
                     credit_note.tax = credit_note.company.tax_rate
                     credit_note.create_electronic_invoice = 'create_electronic_invoice' in request.POST
                     credit_note.save()
-                    for i in json.loads(request.POST['products']):
-                        invoice_detail = InvoiceDetail.objects.get(id=i['id'])
-                        CreditNoteDetail.objects.create(
-                            credit_note_id=credit_note.id,
-                            invoice_detail_id=invoice_detail.id,
-                            product_id=invoice_detail.product_id,
+                    products = json.loads(request.POST['products'])
+                    invoice_details = InvoiceDetail.objects.select_related('product').in_bulk([i['id'] for i in products])
+                    details = []
+                    for i in products:
+                        invoice_detail = invoice_details[int(i['id'])]
+                        details.append(CreditNoteDetail(
+                            credit_note=credit_note,
+                            invoice_detail=invoice_detail,
+                            product=invoice_detail.product,
                             quantity=int(i['new_quantity']),
                             price=float(i['price']),
                             discount=float(i['discount']) / 100
-                        )
-                    credit_note.recalculate_invoice()
+                        ))
+                    credit_note.recalculate_invoice(details)
                     if credit_note.create_electronic_invoice:
                         data = credit_note.generate_electronic_invoice_document()
                         if not data['resp']:
@@ -180,9 +183,7 @@ class CreditNotePrintView(GroupPermissionMixin, CompanyQuerysetMixin, ListView):
     def get(self, request, *args, **kwargs):
         credit_note = self.get_queryset().filter(id=self.kwargs['pk']).first()
         if credit_note:
-            context = {'object': credit_note}
-            pdf_file = PDFCreator(template_name=self.template_name).create(context=context)
-            return HttpResponse(pdf_file, content_type='application/pdf')
+            return pdf_cache.response(request, credit_note, self.template_name, filename=f'{credit_note.receipt_number_full}.pdf')
         return HttpResponseRedirect(self.success_url)
 
 
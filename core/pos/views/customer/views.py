@@ -1,7 +1,6 @@
 import json
 import secrets
 import string
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
@@ -14,6 +13,7 @@ from django.views.generic import CreateView, UpdateView, DeleteView, ListView
 
 from config import settings
 from core.pos.forms import CustomerForm, Customer, CustomerUserForm
+from core.pos.models import OutboundEmail
 from core.pos.utilities.sri import SRI
 from core.security.mixins import GroupModuleMixin, GroupPermissionMixin, CompanyQuerysetMixin
 from core.subscription.models import check_quota_limits
@@ -100,7 +100,6 @@ class CustomerCreateView(GroupPermissionMixin, CreateView):
         try:
             message = MIMEMultipart('alternative')
             message['Subject'] = 'Credenciales de acceso - OptimusPos Facturación'
-            message['From'] = settings.EMAIL_HOST_USER
             message['To'] = user.email
 
             # Texto plano (fallback)
@@ -154,11 +153,7 @@ class CustomerCreateView(GroupPermissionMixin, CreateView):
             message.attach(MIMEText(text_content, 'plain'))
             message.attach(MIMEText(html_content, 'html'))
 
-            # Envío directo por SSL en puerto 465
-            server = smtplib.SMTP_SSL(settings.EMAIL_HOST, 465)
-            server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-            server.sendmail(settings.EMAIL_HOST_USER, [user.email], message.as_string())
-            server.quit()
+            OutboundEmail.enqueue(message=message, recipients=[user.email])
 
         except Exception:
             pass
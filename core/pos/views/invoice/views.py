@@ -2,13 +2,17 @@ import json
 
 from django.db import transaction
 from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, DeleteView, ListView, UpdateView
 
+from config import settings
+from core.pos.choices import MAILING_ATTACHMENT
 from core.pos.forms import InvoiceForm, Invoice, Customer, Receipt, Product, InvoiceDetail, CreditNote, CreditNoteDetail, Company, AccountReceivable, VOUCHER_TYPE, INVOICE_STATUS, PAYMENT_TYPE
-from core.pos.utilities.pdf_creator import PDFCreator
+from core.pos.models import ElectronicBillingJob, VoucherMailing
+from core.pos.utilities.pdf_cache import pdf_cache
 from core.pos.utilities.sri import SRI
+from core.pos.utilities.voucher_export import VoucherExport
 from core.report.forms import ReportForm
 from core.security.mixins import GroupPermissionMixin, AutoAssignCompanyMixin, CompanyQuerysetMixin
 from core.subscription.models import check_quota_limits
@@ -45,8 +49,7 @@ class InvoiceListView(GroupPermissionMixin, CompanyQuerysetMixin, ListView):
                 # Verificar si necesita número de recibo
                 receipt_number_is_null = invoice.receipt_number_is_null()
                 if receipt_number_is_null:
-                    invoice.receipt_number = invoice.generate_receipt_number()
-                    invoice.receipt_number_full = invoice.generate_receipt_number_full()
+                    invoice.generate_receipt_number_full()
                     invoice.edit()
                 
                 # Intentar generar factura electrónica
@@ -75,8 +78,6 @@ class InvoiceListView(GroupPermissionMixin, CompanyQuerysetMixin, ListView):
                     # Éxito en el primer intento
                     invoice.create_electronic_invoice = True
                     invoice.edit()
-                    if receipt_number_is_null:
-                        invoice.save_sequence_number()
             elif action == 'create_credit_note':
                 with transaction.atomic():
                     invoice = self.model.objects.get(pk=request.POST['id'])
@@ -90,16 +91,17 @@ class InvoiceListView(GroupPermissionMixin, CompanyQuerysetMixin, ListView):
                     credit_note.receipt_number_full = credit_note.get_receipt_number_full()
                     credit_note.tax = invoice.company.tax_rate
                     credit_note.save()
-                    for invoice_detail in invoice.invoicedetail_set.all():
+                    details = []
+                    for invoice_detail in invoice.get_details():
                         credit_note_detail = CreditNoteDetail()
-                        credit_note_detail.credit_note_id = credit_note.id
-                        credit_note_detail.invoice_detail_id = invoice_detail.id
-                        credit_note_detail.product_id = invoice_detail.product_id
+                        credit_note_detail.credit_note = credit_note
+                        credit_note_detail.invoice_detail = invoice_detail
+                        credit_note_detail.product = invoice_detail.product
                         credit_note_detail.quantity = invoice_detail.quantity
                         credit_note_detail.price = invoice_detail.price
                         credit_note_detail.discount = invoice_detail.discount
-                        credit_note_detail.save()
-                    credit_note.recalculate_invoice()
+                        details.append(credit_note_detail)
+                    credit_note.recalculate_invoice(details)
                     data = credit_note.generate_electronic_invoice_document()
                     if not data['resp']:
                         transaction.set_rollback(True)
@@ -111,6 +113,35 @@ class InvoiceListView(GroupPermissionMixin, CompanyQuerysetMixin, ListView):
             elif action == 'send_receipt_by_email':
                 invoice = self.model.objects.get(pk=request.POST['id'])
                 data = SRI().send_receipt_by_email(instance=invoice)
+            elif action == 'send_vouchers_by_email':
+                # Reenvía al cliente de la factura todos sus comprobantes del periodo filtrado, en segundo plano
+                invoice = self.get_queryset().get(pk=request.POST['id'])
+                mailing = VoucherMailing.enqueue(
+                    customer=invoice.customer,
+                    company=invoice.company,
+                    start_date=request.POST.get('start_date', ''),
+                    end_date=request.POST.get('end_date', ''),
+                    attachment=request.POST['attachment'] if request.POST.get('attachment') in dict(MAILING_ATTACHMENT) else MAILING_ATTACHMENT[0][0],
+                )
+                data = mailing.as_dict()
+            elif action == 'search_export':
+                # Partes del ZIP de XML/PDF autorizados del periodo; cada una se descarga por separado
+                if self.get_company() is None:
+                    raise ValueError('El usuario no tiene una compañía asignada')
+                export = VoucherExport(company=self.get_company(), start_date=request.POST.get('start_date', ''), end_date=request.POST.get('end_date', ''))
+                url = reverse_lazy('invoice_export')
+                data = {
+                    'count': export.get_count(),
+                    'parts': [
+                        {'name': export.get_filename(part), 'url': f'{url}?start_date={export.start_date or ""}&end_date={export.end_date or ""}&part={part}'}
+                        for part in range(1, export.get_parts() + 1)
+                    ],
+                }
+            elif action == 'search_voucher_mailing':
+                queryset = VoucherMailing.objects.all()
+                if self.get_company():
+                    queryset = queryset.filter(company=self.get_company())
+                data = queryset.get(pk=request.POST['id']).as_dict()
             else:
                 data['error'] = 'No ha seleccionado ninguna opción'
         except Exception as e:
@@ -190,17 +221,19 @@ class InvoiceCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
                             invoice.is_draft_invoice = 'is_draft_invoice' in request.POST
                         invoice.additional_info = json.loads(request.POST['additional_info'])
                         invoice.save()
-                        for i in json.loads(request.POST['products']):
-                            product = Product.objects.get(pk=i['id'])
-                            invoice_detail = InvoiceDetail.objects.create(
-                                invoice_id=invoice.id,
-                                product_id=product.id,
+                        items = json.loads(request.POST['products'])
+                        products = Product.objects.in_bulk([i['id'] for i in items])
+                        details = invoice.recalculate_invoice([
+                            InvoiceDetail(
+                                invoice=invoice,
+                                product=products[int(i['id'])],
                                 quantity=int(i['quantity']),
                                 price=float(i['current_price']),
                                 discount=float(i['discount']) / 100
                             )
-                            invoice_detail.deduct_product_stock()
-                        invoice.recalculate_invoice()
+                            for i in items
+                        ])
+                        invoice.deduct_product_stock(details)
                         if invoice.payment_type == PAYMENT_TYPE[1][0]:
                             AccountReceivable.objects.create(
                                 invoice_id=invoice.id,
@@ -209,17 +242,21 @@ class InvoiceCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
                                 debt=invoice.total_amount
                             )
                         data = {'print_url': str(reverse_lazy('invoice_print', kwargs={'pk': invoice.id, 'code': invoice.receipt.voucher_type}))}
-                        if invoice.create_electronic_invoice and not invoice.is_draft_invoice:
-                            data = invoice.generate_electronic_invoice_document()
-                            if data.get('resp'):
+                        if invoice.create_electronic_invoice and not invoice.is_draft_invoice and settings.ELECTRONIC_BILLING_ASYNC:
+                            # El trabajo se confirma junto con la venta; electronic_billing_worker lo procesa fuera del request
+                            data['billing_job'] = ElectronicBillingJob.enqueue(voucher=invoice).as_dict()
+                        elif invoice.create_electronic_invoice and not invoice.is_draft_invoice:
+                            # Si el SRI aún autoriza el comprobante o no responde (pending), la venta se confirma con su trabajo en cola
+                            data.update(invoice.generate_electronic_invoice_document())
+                            if not data['resp']:
+                                transaction.set_rollback(True)
+                            elif not data.get('pending'):
                                 # Enviar por correo automáticamente al autorizar
                                 try:
                                     email_resp = SRI().send_receipt_by_email(instance=invoice)
                                     data['email'] = email_resp
                                 except Exception as e:
                                     data['email_error'] = str(e)
-                            else:
-                                transaction.set_rollback(True)
                 if 'error' in data:
                     invoice.create_receipt_error(errors=data, change_status=False)
             elif action == 'get_receipt_number':
@@ -298,6 +335,9 @@ class InvoiceCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
                     data.append(customer_dict)
                 
                 print(f"[InvoiceCreateView.search_customer] Respuesta final: {data}")
+            elif action == 'billing_status':
+                job = ElectronicBillingJob.objects.get(pk=request.POST['id'], company=self.get_company())
+                data = job.as_dict()
             elif action == 'check_quota':
                 # Nueva acción para verificar cuotas
                 quota_check = check_quota_limits(request.user, 'invoice')
@@ -363,17 +403,19 @@ class InvoiceUpdateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
                     invoice.save()
                     invoice.invoicedetail_set.all().delete()
                     invoice.accountreceivable_set.all().delete()
-                    for i in json.loads(request.POST['products']):
-                        product = Product.objects.get(pk=i['id'])
-                        invoice_detail = InvoiceDetail.objects.create(
-                            invoice_id=invoice.id,
-                            product_id=product.id,
+                    items = json.loads(request.POST['products'])
+                    products = Product.objects.in_bulk([i['id'] for i in items])
+                    details = invoice.recalculate_invoice([
+                        InvoiceDetail(
+                            invoice=invoice,
+                            product=products[int(i['id'])],
                             quantity=int(i['quantity']),
                             price=float(i['current_price']),
                             discount=float(i['discount']) / 100
                         )
-                        invoice_detail.deduct_product_stock()
-                    invoice.recalculate_invoice()
+                        for i in items
+                    ])
+                    invoice.deduct_product_stock(details)
                     if invoice.payment_type == PAYMENT_TYPE[1][0]:
                         AccountReceivable.objects.create(
                             invoice_id=invoice.id,
@@ -382,7 +424,9 @@ class InvoiceUpdateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
                             debt=invoice.total_amount
                         )
                     data = {'print_url': str(reverse_lazy('invoice_print', kwargs={'pk': invoice.id, 'code': invoice.receipt.voucher_type}))}
-                    if invoice.create_electronic_invoice and not invoice.is_draft_invoice:
+                    if invoice.create_electronic_invoice and not invoice.is_draft_invoice and settings.ELECTRONIC_BILLING_ASYNC:
+                        data['billing_job'] = ElectronicBillingJob.enqueue(voucher=invoice, send_email=False).as_dict()
+                    elif invoice.create_electronic_invoice and not invoice.is_draft_invoice:
                         data = invoice.generate_electronic_invoice_document()
                         if not data['resp']:
                             transaction.set_rollback(True)
@@ -447,6 +491,9 @@ class InvoiceUpdateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
                 
                 for i in customers_qs:
                     data.append(i.as_dict())
+            elif action == 'billing_status':
+                job = ElectronicBillingJob.objects.get(pk=request.POST['id'], company=self.get_company())
+                data = job.as_dict()
             else:
                 data['error'] = 'No ha seleccionado ninguna opción'
         except Exception as e:
@@ -517,11 +564,30 @@ class InvoicePrintView(GroupPermissionMixin, ListView):
         invoice = self.get_queryset().filter(id=self.kwargs['pk']).first()
         if invoice:
             context = {'object': invoice, 'height': 450 + invoice.invoicedetail_set.all().count() * 10}
-            pdf_file = PDFCreator(template_name=self.get_template_names()).create(context=context)
-            return HttpResponse(pdf_file, content_type='application/pdf')
+            return pdf_cache.response(request, invoice, self.get_template_names(), filename=f'{invoice.receipt_number_full}.pdf', context=context)
         return HttpResponseRedirect(self.success_url)
 
 
+class InvoiceExportView(GroupPermissionMixin, CompanyQuerysetMixin, ListView):
+    model = Invoice
+    success_url = reverse_lazy('invoice_list_admin')
+    permission_required = 'view_invoice_admin'
+
+    def get(self, request, *args, **kwargs):
+        company = self.get_company()
+        if company is None:
+            return HttpResponseRedirect(self.success_url)
+        export = VoucherExport(company=company, start_date=request.GET.get('start_date', ''), end_date=request.GET.get('end_date', ''))
+        part = int(request.GET.get('part', 1))
+        if not 1 <= part <= export.get_parts():
+            return HttpResponseRedirect(self.success_url)
+        # El ZIP se comprime y envía mientras se lee cada archivo, sin armarlo completo en memoria ni en disco
+        response = StreamingHttpResponse(export.stream(part=part), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{export.get_filename(part)}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class InvoiceCustomerListView(GroupPermissionMixin, ListView):
     model = Invoice
     template_name = 'invoice/list_customer.html'
@@ -0,0 +1,75 @@
+import secrets
+
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils import timezone
+from django.views.generic import View
+
+from config import settings
+from core.pos.choices import CIRCUIT_STATE, ENVIRONMENT_TYPE
+from core.pos.models import ElectronicBillingJob, OutboundEmail, SRIServiceStatus, VoucherStageMetric
+from core.pos.utilities.prometheus import PrometheusText
+
+
+class MetricsView(View):
+    """Métricas de la facturación electrónica para Prometheus: etapas, autorización, circuit breaker, contingencia y correo"""
+
+    def has_access(self, request):
+        authorization = request.headers.get('Authorization', '')
+        if settings.METRICS_TOKEN and authorization.startswith('Bearer '):
+            return secrets.compare_digest(authorization[7:].strip(), settings.METRICS_TOKEN)
+        return request.user.is_authenticated and request.user.is_superuser
+
+    def add_stage_metrics(self, metrics):
+        histogram = VoucherStageMetric.get_histogram()
+        samples, sizes = [], []
+        for item in histogram:
+            labels = {'stage': item['stage'], 'company': item['company_id'], 'outcome': item['outcome']}
+            samples.extend(metrics.get_histogram_samples(labels, item['buckets'], item['sum'] or 0.0, item['count']))
+            sizes.append(('', labels, item['size'] or 0))
+        metrics.add('sri_stage_duration_seconds', 'histogram', 'Duración de cada etapa de la facturación electrónica', samples)
+        metrics.add('sri_stage_payload_bytes_total', 'counter', 'Bytes de XML/PDF procesados por etapa', sizes)
+
+    def add_authorization_metrics(self, metrics):
+        authorization = ElectronicBillingJob.get_authorization_metrics()
+        buckets = {bucket: count for bucket, count in authorization['latency_histogram'].items() if bucket != '+Inf'}
+        metrics.add('sri_authorization_polls_total', 'counter', 'Consultas de autorización realizadas al SRI', [('', {}, authorization['polls'])])
+        metrics.add('sri_authorization_latency_seconds', 'histogram', 'Tiempo entre la recepción y la autorización del SRI', metrics.get_histogram_samples({}, buckets, authorization['latency_sum'], authorization['authorized']))
+        metrics.add('sri_authorization_backlog', 'gauge', 'Comprobantes recibidos que esperan su autorización', [('', {'environment': name}, count) for name, count in authorization['backlog'].items()])
+        oldest = authorization['oldest_pending']
+        metrics.add('sri_authorization_oldest_pending_seconds', 'gauge', 'Antigüedad del comprobante más antiguo sin autorizar', [('', {}, (timezone.now() - oldest).total_seconds() if oldest else 0)])
+
+    def add_breaker_metrics(self, metrics):
+        states, failures, calls, rejected = [], [], [], []
+        for status in SRIServiceStatus.objects.all():
+            labels = {'service': status.service, 'environment': dict(ENVIRONMENT_TYPE).get(status.environment_type, status.environment_type)}
+            states.extend(('', {**labels, 'state': state}, status.state == state) for state, _ in CIRCUIT_STATE)
+            failures.append(('', labels, status.consecutive_failures))
+            calls.append(('', labels, status.total_calls))
+            rejected.append(('', labels, status.rejected_calls))
+        metrics.add('sri_breaker_state', 'gauge', 'Estado del circuit breaker de cada servicio del SRI', states)
+        metrics.add('sri_breaker_consecutive_failures', 'gauge', 'Fallos consecutivos de cada servicio del SRI', failures)
+        metrics.add('sri_breaker_calls_total', 'counter', 'Llamadas realizadas a cada servicio del SRI', calls)
+        metrics.add('sri_breaker_rejected_calls_total', 'counter', 'Llamadas rechazadas con el circuito abierto', rejected)
+
+    def add_offline_metrics(self, metrics):
+        offline = ElectronicBillingJob.get_offline_metrics()
+        metrics.add('sri_offline_backlog', 'gauge', 'Comprobantes emitidos sin conexión pendientes de envío al SRI', [('', {}, offline['backlog'])])
+        metrics.add('sri_offline_authorizing', 'gauge', 'Comprobantes emitidos sin conexión que esperan su autorización', [('', {}, offline['authorizing'])])
+
+    def add_email_metrics(self, metrics):
+        email = OutboundEmail.get_metrics()
+        metrics.add('email_outbox_messages', 'gauge', 'Correos de la bandeja de salida por estado', [('', {'status': name}, count) for name, count in email['status'].items()])
+        metrics.add('email_outbox_delay_seconds_max', 'gauge', 'Mayor demora entre el registro y el envío de un correo', [('', {}, email['delay_max'])])
+        oldest = email['oldest_pending']
+        metrics.add('email_outbox_oldest_pending_seconds', 'gauge', 'Antigüedad del correo pendiente más antiguo', [('', {}, (timezone.now() - oldest).total_seconds() if oldest else 0)])
+
+    def get(self, request, *args, **kwargs):
+        if not self.has_access(request):
+            return HttpResponseForbidden()
+        metrics = PrometheusText()
+        self.add_stage_metrics(metrics)
+        self.add_authorization_metrics(metrics)
+        self.add_breaker_metrics(metrics)
+        self.add_offline_metrics(metrics)
+        self.add_email_metrics(metrics)
+        return HttpResponse(metrics.render(), content_type=metrics.content_type)
@@ -1,7 +1,6 @@
 import json
 from io import BytesIO
 
-import pandas as pd
 import xlsxwriter
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -12,7 +11,9 @@ from django.urls import reverse_lazy
 from django.views.generic import CreateView, UpdateView, DeleteView, ListView
 from django.views.generic.base import View
 
-from core.pos.forms import ProductForm, Product, Category
+from core.pos.forms import ProductForm, Product
+from core.pos.models import ProductImport, StockMovement
+from core.pos.utilities.product_barcode import product_barcodes
 from core.security.mixins import GroupPermissionMixin, CompanyQuerysetMixin, AutoAssignCompanyMixin
 from core.subscription.models import check_quota_limits
 
@@ -28,28 +29,20 @@ class ProductListView(GroupPermissionMixin, CompanyQuerysetMixin, ListView):
         try:
             if action == 'search':
                 data = []
-                for i in self.get_queryset():
+                queryset = list(self.get_queryset())
+                # Solo se dibujan los códigos que faltan, en la misma petición; la referencia se actualiza al guardar el producto
+                product_barcodes.render_missing(queryset)
+                for i in queryset:
                     data.append(i.as_dict())
             elif action == 'upload_excel':
-                with transaction.atomic():
-                    archive = request.FILES['archive']
-                    df = pd.read_excel(archive, engine='openpyxl', dtype={'Código': str})
-                    for record in json.loads(df.to_json(orient='records')):
-                        if record['Nombre'] not in ['SUMINISTROS', 'SPRAY LIMPIADOR DE MARIPOSA/12.5- OZ', 'SPRAY LIMPIADOR DE FRENOS', 'LITRO DE ACEITE MOTOR ENI I-SIGMA TOP 10W-40', 'FILTRO A/C POER', 'FILTRO AIRE POER DIESEL', 'FILTRO DE COMBUSTIBLE POER ESP 4D20M', 'FILTRO ACEITE POER 4D20M', 'LAVADO EXPRESS', 'CHEQUEO DE 20000KM + 25 PUNTOS DE INSPECCION', 'ALINEACION Y BALANCEO']:
-                            continue
-                        product, created = self.model.objects.update_or_create(
-                            code=str(record['Código']),
-                            defaults={
-                                'name': record['Nombre'],
-                                'category': Category.objects.get_or_create(name=record['Categoría'])[0],
-                                'price': float(record['Precio de Compra']),
-                                'pvp': float(record['Precio de Venta']),
-                                'stock': int(record['Stock']),
-                                'is_inventoried': record['¿Es inventariado?'],
-                                'has_tax': record['¿Se cobra impuesto?']
-                            }
-                        )
-                        print(f'{product.id} => {created}')
+                # El excel se importa en segundo plano; la página consulta el avance con search_product_import
+                if self.get_company() is None:
+                    raise ValueError('El usuario no tiene una compañía asignada')
+                product_import = ProductImport.enqueue(archive=request.FILES['archive'], company=self.get_company(), user=request.user)
+                data = product_import.as_dict()
+            elif action == 'search_product_import':
+                queryset = ProductImport.objects.filter(company=self.get_company())
+                data = queryset.get(pk=request.POST['id']).as_dict()
             else:
                 data['error'] = 'No ha seleccionado ninguna opción'
         except Exception as e:
@@ -97,6 +90,7 @@ class ProductCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
                                 else:
                                     product.company = company_obj
                                     product.save()
+                                    product_barcodes.render_products([product])
                                     data = product.as_dict()
                         except Exception as ex:
                             data['error'] = f'Error al guardar el producto: {ex}'
@@ -145,6 +139,7 @@ class ProductUpdateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQue
             if action == 'edit':
                 result = self.get_form().save()
                 if isinstance(result, Product):
+                    product_barcodes.render_products([result])
                     data = result.as_dict()
                 else:
                     data = result
@@ -215,10 +210,8 @@ class ProductStockAdjustmentView(GroupPermissionMixin, CompanyQuerysetMixin, Lis
                     data.append(item)
             elif action == 'create':
                 with transaction.atomic():
-                    for i in json.loads(request.POST['products']):
-                        product = self.model.objects.get(pk=i['id'])
-                        product.stock = int(i['quantity'])
-                        product.save()
+                    products = {int(i['id']): int(i['quantity']) for i in json.loads(request.POST['products'])}
+                    StockMovement.adjust(products, user=request.user)
             else:
                 data['error'] = 'No ha seleccionado ninguna opción'
         except Exception as e:
@@ -6,8 +6,9 @@ from django.http import HttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, DeleteView, ListView
 
+from core.pos.choices import STOCK_MOVEMENT_TYPE
 from core.pos.forms import PurchaseForm, Purchase, PurchaseDetail, Product, Provider, AccountPayable, PAYMENT_TYPE
-from core.pos.models import Company
+from core.pos.models import Company, StockMovement
 from core.report.forms import ReportForm
 from core.security.mixins import GroupPermissionMixin, AutoAssignCompanyMixin, CompanyQuerysetMixin
 
@@ -79,6 +80,7 @@ class PurchaseCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQu
                         payment_type=request.POST['payment_type'],
                         tax=float(current_company.tax) / 100,
                     )
+                    movements = []
                     for i in json.loads(request.POST['products']):
                         # Validar producto pertenece a la compañía
                         product = Product.objects.filter(pk=i['id'], company=current_company).first()
@@ -91,8 +93,11 @@ class PurchaseCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQu
                             quantity=int(i['quantity']),
                             price=float(i['price'])
                         )
-                        detail.product.stock += detail.quantity
-                        detail.product.save()
+                        movements.append(StockMovement(
+                            company=current_company, product=product, movement_type=STOCK_MOVEMENT_TYPE[3][0], quantity=detail.quantity,
+                            purchase=purchase, user=request.user, description=purchase.number,
+                        ))
+                    StockMovement.register(movements)
 
                     purchase.recalculate_invoice()
 
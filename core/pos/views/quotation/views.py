@@ -7,7 +7,7 @@ from django.urls import reverse_lazy
 from django.views.generic import CreateView, DeleteView, ListView, UpdateView
 
 from core.pos.forms import QuotationForm, Quotation, Customer, Product, QuotationDetail, Company
-from core.pos.utilities.pdf_creator import PDFCreator
+from core.pos.utilities.pdf_cache import pdf_cache
 from core.report.forms import ReportForm
 from core.security.mixins import GroupPermissionMixin, AutoAssignCompanyMixin, CompanyQuerysetMixin
 
@@ -88,16 +88,18 @@ class QuotationCreateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQ
                     quotation.date_joined = request.POST['date_joined']
                     quotation.tax = quotation.company.tax_rate
                     quotation.save()
-                    for i in json.loads(request.POST['products']):
-                        product = Product.objects.get(pk=i['id'])
-                        QuotationDetail.objects.create(
-                            quotation_id=quotation.id,
-                            product_id=product.id,
+                    items = json.loads(request.POST['products'])
+                    products = Product.objects.in_bulk([i['id'] for i in items])
+                    quotation.recalculate_invoice([
+                        QuotationDetail(
+                            quotation=quotation,
+                            product=products[int(i['id'])],
                             quantity=int(i['quantity']),
                             price=float(i['current_price']),
                             discount=float(i['discount']) / 100
                         )
-                    quotation.recalculate_invoice()
+                        for i in items
+                    ])
                     data = {'print_url': str(reverse_lazy('quotation_print', kwargs={'pk': quotation.id}))}
             elif action == 'search_product':
                 product_id = json.loads(request.POST['product_id'])
@@ -172,16 +174,18 @@ class QuotationUpdateView(AutoAssignCompanyMixin, GroupPermissionMixin, CompanyQ
                     quotation.tax = quotation.company.tax_rate
                     quotation.save()
                     quotation.quotationdetail_set.all().delete()
-                    for i in json.loads(request.POST['products']):
-                        product = Product.objects.get(pk=i['id'])
-                        QuotationDetail.objects.create(
-                            quotation_id=quotation.id,
-                            product_id=product.id,
+                    items = json.loads(request.POST['products'])
+                    products = Product.objects.in_bulk([i['id'] for i in items])
+                    quotation.recalculate_invoice([
+                        QuotationDetail(
+                            quotation=quotation,
+                            product=products[int(i['id'])],
                             quantity=int(i['quantity']),
                             price=float(i['current_price']),
                             discount=float(i['discount']) / 100
                         )
-                    quotation.recalculate_invoice()
+                        for i in items
+                    ])
                     data = {'print_url': str(reverse_lazy('quotation_print', kwargs={'pk': quotation.id}))}
             elif action == 'search_product':
                 product_id = json.loads(request.POST['product_id'])
@@ -268,7 +272,5 @@ class QuotationPrintView(GroupPermissionMixin, ListView):
     def get(self, request, *args, **kwargs):
         quotation = self.model.objects.filter(id=self.kwargs['pk']).first()
         if quotation:
-            context = {'quotation': quotation}
-            pdf_file = PDFCreator(template_name=self.template_name).create(context=context)
-            return HttpResponse(pdf_file, content_type='application/pdf')
+            return pdf_cache.response(request, quotation, self.template_name, filename=f'{quotation.formatted_number}.pdf', context={'quotation': quotation})
         return HttpResponseRedirect(self.success_url)
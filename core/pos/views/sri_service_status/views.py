@@ -0,0 +1,48 @@
+import json
+
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.generic import ListView
+
+from core.pos.choices import ENVIRONMENT_TYPE, SRI_SERVICE
+from core.pos.models import ElectronicBillingJob, SRIServiceStatus
+from core.security.mixins import GroupPermissionMixin
+
+
+class SRIServiceStatusListView(GroupPermissionMixin, ListView):
+    model = SRIServiceStatus
+    template_name = 'sri_service_status/list.html'
+    permission_required = 'view_sri_service_status'
+
+    def post(self, request, *args, **kwargs):
+        data = {}
+        action = request.POST['action']
+        try:
+            if action == 'search':
+                data = []
+                for environment_type, _ in ENVIRONMENT_TYPE:
+                    for service, _ in SRI_SERVICE:
+                        data.append(SRIServiceStatus.get_status(service=service, environment_type=environment_type).as_dict())
+            elif action == 'search_offline_backlog':
+                # Comprobantes emitidos sin conexión y avance de su envío al SRI
+                data = ElectronicBillingJob.get_offline_metrics()
+                for name in ['since', 'oldest_pending']:
+                    data[name] = timezone.localtime(data[name]).strftime('%Y-%m-%d %H:%M:%S') if data[name] else ''
+                data['rate'] = round(data['rate'] * 60, 1)
+            elif action == 'reset':
+                group = self.get_user_group(request)
+                if group is None or not group.permissions.filter(codename='change_sri_service_status').exists():
+                    data['error'] = 'No tiene permisos para restablecer el estado del servicio'
+                else:
+                    SRIServiceStatus.objects.get(pk=request.POST['id']).reset()
+            else:
+                data['error'] = 'No ha seleccionado ninguna opción'
+        except Exception as e:
+            data['error'] = str(e)
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = f'Listado de {self.model._meta.verbose_name_plural}'
+        context['list_url'] = self.request.path
+        return context
@@ -0,0 +1,33 @@
+from django.http import FileResponse, Http404
+from django.views.generic import View
+
+from core.pos.choices import VOUCHER_TYPE
+from core.pos.models import CreditNote, Invoice
+from core.security.mixins import BaseGroupMixin
+
+
+class VoucherFileView(BaseGroupMixin, View):
+    """Descarga del XML o PDF autorizado leyendo el archivo por bloques desde el almacenamiento de comprobantes"""
+    models = {VOUCHER_TYPE[0][0]: Invoice, VOUCHER_TYPE[1][0]: CreditNote}
+    content_types = {'xml': 'application/xml', 'pdf': 'application/pdf'}
+
+    def has_access(self, voucher):
+        # Personal de la compañía emisora o el cliente dueño del comprobante
+        user = self.request.user
+        if user.is_superuser or (user.company_id and user.company_id == voucher.company_id):
+            return True
+        customer = voucher.get_client_from_model()
+        return customer is not None and customer.user_id == user.id
+
+    def get(self, request, *args, **kwargs):
+        model = self.models.get(self.kwargs['code'])
+        if model is None or self.kwargs['kind'] not in self.content_types:
+            raise Http404
+        voucher = model.objects.filter(pk=self.kwargs['pk']).select_related('receipt').first()
+        if voucher is None or not self.has_access(voucher):
+            raise Http404
+        file = voucher.authorized_xml if self.kwargs['kind'] == 'xml' else voucher.authorized_pdf
+        if not file:
+            raise Http404
+        filename = f'{voucher.receipt.get_name_file()}-{voucher.receipt_number_full}.{self.kwargs["kind"]}'
+        return FileResponse(file.storage.open(file.name, 'rb'), as_attachment=self.kwargs['kind'] == 'xml', filename=filename, content_type=self.content_types[self.kwargs['kind']])
@@ -0,0 +1,205 @@
+var input_date_range;
+var tblReport;
+var columns = [];
+var report = {
+    getParams: function (args) {
+        var params = {};
+        if ($.isEmptyObject(args)) {
+            params['start_date'] = input_date_range.data('daterangepicker').startDate.format('YYYY-MM-DD');
+            params['end_date'] = input_date_range.data('daterangepicker').endDate.format('YYYY-MM-DD');
+        } else {
+            params = Object.assign({}, params, args);
+        }
+        return params;
+    },
+    initTable: function () {
+        tblReport = $('#tblReport').DataTable({
+            autoWidth: false,
+            destroy: true,
+        });
+        tblReport.settings()[0].aoColumns.forEach(function (value, index, array) {
+            columns.push(value.sWidthOrig);
+        });
+    },
+    list: function (args = {}) {
+        var params = Object.assign({'action': 'search'}, report.getParams(args));
+        tblReport = $('#tblReport').DataTable({
+            destroy: true,
+            autoWidth: false,
+            ajax: {
+                url: pathname,
+                type: 'POST',
+                headers: {
+                    'X-CSRFToken': csrftoken
+                },
+                data: params,
+                dataSrc: ''
+            },
+            order: [[0, 'asc'], [1, 'asc']],
+            paging: false,
+            ordering: true,
+            searching: false,
+            dom: 'Bfrtip',
+            buttons: [
+                {
+                    extend: 'excelHtml5',
+                    text: ' <i class="fas fa-file-excel"></i> Descargar Excel',
+                    titleAttr: 'Excel',
+                    className: 'btn btn-success btn-flat btn-sm'
+                },
+                {
+                    extend: 'pdfHtml5',
+                    text: '<i class="fas fa-file-pdf"></i> Descargar Pdf',
+                    titleAttr: 'PDF',
+                    className: 'btn btn-danger btn-flat btn-sm',
+                    download: 'open',
+                    orientation: 'landscape',
+                    pageSize: 'LEGAL',
+                    customize: function (doc) {
+                        doc.styles = {
+                            header: {
+                                fontSize: 18,
+                                bold: true,
+                                alignment: 'center'
+                            },
+                            subheader: {
+                                fontSize: 13,
+                                bold: true
+                            },
+                            quote: {
+                                italics: true
+                            },
+                            small: {
+                                fontSize: 8
+                            },
+                            tableHeader: {
+                                bold: true,
+                                fontSize: 11,
+                                color: 'white',
+                                fillColor: '#2d4154',
+                                alignment: 'center'
+                            }
+                        };
+                        doc.content[1].table.widths = columns;
+                        doc.content[1].margin = [0, 35, 0, 0];
+                        doc.content[1].layout = {};
+                        doc['footer'] = (function (page, pages) {
+                            return {
+                                columns: [
+                                    {
+                                        alignment: 'left',
+                                        text: ['Fecha de creación: ', {text: new moment().format('YYYY-MM-DD')}]
+                                    },
+                                    {
+                                        alignment: 'right',
+                                        text: ['página ', {text: page.toString()}, ' de ', {text: pages.toString()}]
+                                    }
+                                ],
+                                margin: 20
+                            }
+                        });
+
+                    }
+                }
+            ],
+            columns: [
+                {data: "date_joined"},
+                {data: "company"},
+                {data: "stage.name"},
+                {data: "count"},
+                {data: "errors"},
+                {data: "avg"},
+                {data: "p50"},
+                {data: "p95"},
+                {data: "p99"},
+                {data: "max"},
+                {data: "size_avg"},
+            ],
+            columnDefs: [
+                {
+                    targets: [3, 4],
+                    class: 'text-center',
+                    render: function (data, type, row) {
+                        return data;
+                    }
+                },
+                {
+                    targets: [5, 6, 7, 8, 9],
+                    class: 'text-center',
+                    render: function (data, type, row) {
+                        return data.toFixed(3);
+                    }
+                },
+                {
+                    targets: [-1],
+                    class: 'text-center',
+                    render: function (data, type, row) {
+                        return (data / 1024).toFixed(1);
+                    }
+                }
+            ],
+            rowCallback: function (row, data, index) {
+
+            },
+            initComplete: function (settings, json) {
+                $(this).wrap('<div class="dataTables_scroll"><div/>');
+                report.graph(args);
+            }
+        });
+    },
+    graph: function (args = {}) {
+        execute_ajax_request({
+            'params': Object.assign({'action': 'search_graph'}, report.getParams(args)),
+            'success': function (request) {
+                Highcharts.chart('container', {
+                    chart: {
+                        type: 'line'
+                    },
+                    title: {
+                        text: 'p95 por etapa (segundos)'
+                    },
+                    xAxis: {
+                        categories: request.categories
+                    },
+                    yAxis: {
+                        title: {
+                            text: 'Segundos'
+                        }
+                    },
+                    credits: {
+                        enabled: false
+                    },
+                    series: request.series
+                });
+            }
+        });
+    }
+};
+
+$(function () {
+    input_date_range = $('input[name="date_range"]');
+
+    input_date_range
+        .daterangepicker({
+                language: 'auto',
+                startDate: new Date(),
+                locale: {
+                    format: 'YYYY-MM-DD',
+                },
+                autoApply: true,
+            }
+        )
+        .on('change.daterangepicker apply.daterangepicker', function (ev, picker) {
+            report.list();
+        });
+
+    $('.drp-buttons').hide();
+
+    report.initTable();
+
+    report.list();
+
+    $('.btnSearchAll').on('click', function () {
+        report.list({'start_date': '', 'end_date': ''});
+    });
+});
\ No newline at end of file
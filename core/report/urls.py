@@ -3,6 +3,7 @@ from django.urls import path
 from core.report.views.account_payable_report.views import AccountPayableReportView
 from core.report.views.account_receivable_report.views import AccountReceivableReportView
 from core.report.views.earning_report.views import EarningReportView
+from core.report.views.electronic_billing_report.views import ElectronicBillingReportView
 from core.report.views.expense_report.views import ExpenseReportView
 from core.report.views.invoice_report.views import InvoiceReportView
 from core.report.views.purchase_report.views import PurchaseReportView
@@ -16,4 +17,5 @@ urlpatterns = [
     path('account/receivable/', AccountReceivableReportView.as_view(), name='account_receivable_report'),
     path('result/', ResultReportView.as_view(), name='result_report'),
     path('earning/', EarningReportView.as_view(), name='earning_report'),
+    path('electronic/billing/', ElectronicBillingReportView.as_view(), name='electronic_billing_report'),
 ]
@@ -0,0 +1,68 @@
+import json
+
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.generic import FormView
+
+from core.pos.choices import VOUCHER_METRIC_STAGE
+from core.pos.models import Company, VoucherStageMetric
+from core.report.forms import ReportForm
+from core.security.mixins import GroupModuleMixin
+
+
+class ElectronicBillingReportView(GroupModuleMixin, FormView):
+    template_name = 'electronic_billing_report/report.html'
+    form_class = ReportForm
+
+    def get_company(self):
+        company = getattr(self.request, 'company', None)
+        if company is None:
+            company = getattr(self.request.user, 'company', None)
+        return company
+
+    def get_queryset(self):
+        filters = Q()
+        start_date = self.request.POST.get('start_date', '')
+        end_date = self.request.POST.get('end_date', '')
+        if len(start_date) and len(end_date):
+            filters &= Q(date_joined__range=[start_date, end_date])
+        company = self.get_company()
+        if company:
+            filters &= Q(company=company)
+        return VoucherStageMetric.objects.filter(filters)
+
+    def post(self, request, *args, **kwargs):
+        action = request.POST['action']
+        data = {}
+        try:
+            if action == 'search':
+                data = []
+                stages = dict(VOUCHER_METRIC_STAGE)
+                rows = VoucherStageMetric.get_report(self.get_queryset())
+                companies = dict(Company.objects.filter(id__in={row['company_id'] for row in rows}).values_list('id', 'commercial_name'))
+                for row in rows:
+                    row['date_joined'] = row['date_joined'].strftime('%Y-%m-%d')
+                    row['company'] = companies.get(row.pop('company_id'), '')
+                    row['stage'] = {'id': row['stage'], 'name': stages.get(row['stage'], row['stage'])}
+                    data.append(row)
+            elif action == 'search_graph':
+                # p95 diario de cada etapa
+                stages = dict(VOUCHER_METRIC_STAGE)
+                rows = VoucherStageMetric.get_report(self.get_queryset(), group_by=('date_joined', 'stage'))
+                categories = sorted({row['date_joined'].strftime('%Y-%m-%d') for row in rows})
+                series = []
+                for stage, name in stages.items():
+                    values = {row['date_joined'].strftime('%Y-%m-%d'): round(row['p95'], 3) for row in rows if row['stage'] == stage}
+                    if values:
+                        series.append({'name': name, 'data': [values.get(category) for category in categories]})
+                data = {'categories': categories, 'series': series}
+            else:
+                data['error'] = 'No ha seleccionado ninguna opción'
+        except Exception as e:
+            data['error'] = str(e)
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = 'Reporte de Tiempos de la Facturación Electrónica'
+        return context
@@ -1,5 +1,4 @@
 import json
-import smtplib
 from datetime import date, timedelta
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -9,8 +8,8 @@ from django.urls import reverse_lazy
 from django.utils import timezone
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView, View
 from django.contrib.auth import logout
-from django.conf import settings
 
+from core.pos.models import OutboundEmail
 from core.subscription.forms import SubscriptionForm
 from core.subscription.models import Subscription, Plan
 from core.subscription.repositories.plan_repository import PlanRepository
@@ -136,7 +135,6 @@ def send_subscription_email(user, subscription):
         
         message = MIMEMultipart('alternative')
         message['Subject'] = f'Plan {plan.name} activado - Facturador SRI'
-        message['From'] = settings.EMAIL_HOST_USER
         message['To'] = user.email
 
         # Texto plano
@@ -213,11 +211,7 @@ Vigencia: {subscription.start_date} hasta {subscription.end_date}
         message.attach(MIMEText(text_content, 'plain'))
         message.attach(MIMEText(html_content, 'html'))
 
-        # Envío por SSL en puerto 465
-        server = smtplib.SMTP_SSL(settings.EMAIL_HOST, 465)
-        server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-        server.sendmail(settings.EMAIL_HOST_USER, [user.email], message.as_string())
-        server.quit()
+        OutboundEmail.enqueue(message=message, recipients=[user.email])
 
     except Exception:
         # Se silencian errores de correo para no interrumpir el flujo
@@ -0,0 +1,7 @@
+#!/bin/bash
+DJANGO_DIR=$(dirname $(dirname $(cd `dirname $0` && pwd)))
+DJANGO_SETTINGS_MODULE=config.settings
+cd $DJANGO_DIR
+source $DJANGO_DIR/venv/bin/activate
+export DJANGO_SETTINGS_MODULE=$DJANGO_SETTINGS_MODULE
+exec python manage.py electronic_billing_worker